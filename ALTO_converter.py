@@ -3,12 +3,12 @@
 
 
 """
+import io
 import json
 import os
 import re
 import csv
 from shutil import copyfile
-from openiti.helper.yml import readYML, dicToYML
 from  openiti.helper.templates import version_yml_template, book_yml_template, author_yml_template
 import urllib.request
 
@@ -17,34 +17,144 @@ from escriptorium_connector import EscriptoriumConnector
 from lxml import etree
 import statistics
 from zipfile import ZipFile
-import time
 import shutil
+import multiprocessing
+import collections
+import tempfile
 from openiti.helper.funcs import natural_sort
 import datetime
 
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+import substitution_rules
+import yml_store
+
 
 escript_message = """This text was OCR'ed as part of the second phase of the\
 ¶    OpenITI AOCP project, generously funded by the Andrew W. Mellon Foundation."""
 escript_version = "0.13.8"
+# compiled post-processing rules (key: line segment separator):
+post_process_rules = dict()
+# the elements of PAGE/ALTO files that are read by read_page:
+page_tags = ("Page", "fileName", "Metadata", "TextRegion", "TextBlock", "TextLine", "Polygon")
+
 
 
 
+def read_page(fp):
+    """Read the regions and lines of a PAGE or ALTO XML file
+    into a page model, in a single pass through the file.
 
-def get_all_region_types_in_document(root, nsmap):
-    """Get a list of all region types used in an document
+    The file is parsed incrementally (with lxml's iterparse), and only
+    the parts that are used by the converter are extracted; every line
+    is cleared as soon as its coordinates and text have been read,
+    so that the word- and glyph-level elements are not kept in memory.
+
+    The lines are stored column-wise: every line is an index
+    into the lists of the page model (in document order).
+    Lines without a bounding box are left out.
 
     Args:
-        root (Element): the root element of the XML document
-        nsmap (dict): a dictionary containing the namespaces used in the document
+        fp (str): path to the xml file (or a file object)
 
     Returns:
-        list
+        dict, with the keys:
+            region_types (list): all region types used in the document
+            regions (dict): key: region type, value: list of dictionaries
+                describing the regions of that type that contain lines of text
+            text (list): the text of each line
+            region (list): the type of the region that contains each line
+            min_x, max_x, min_y, max_y (list): the bounding box of each line
+            xs (list): the x coordinates of the outline of each line
+            image_fn (str): the imageFilename of the (first) Page element
+            file_name (str): the text of the (first) fileName element (ALTO)
+            metadata (list): (tag, text) tuples of the elements
+                in the Metadata element of the document
     """
-    all_regions = set()
-    for region in root.xpath("//default:TextRegion|//default:TextBlock", namespaces=nsmap):
-        region_type = get_region_type(region)
-        all_regions.add(region_type)
-    return list(all_regions)
+    page = {"region_types": set(), "regions": dict(), "text": [], "region": [],
+            "min_x": [], "max_x": [], "min_y": [], "max_y": [], "xs": [],
+            "image_fn": None, "file_name": None, "metadata": []}
+    regions = []       # (region type, region dictionary), in document order
+    open_regions = []  # [index in regions, first Polygon found?, its points]
+    context = etree.iterparse(fp, events=("start", "end"), remove_blank_text=True,
+                              tag=["{*}"+tag for tag in page_tags])
+    root = None
+    page_found = metadata_found = False
+    for event, el in context:
+        if root is None:
+            root = el.getroottree().getroot()
+            nsmap = {k if k is not None else 'default':v for k,v in root.nsmap.items()}
+            ns = "{%s}" % nsmap["default"]
+        if not el.tag.startswith(ns):
+            continue
+        tag = el.tag[len(ns):]
+
+        if event == "start":
+            if tag in ("TextRegion", "TextBlock"):
+                region_type = get_region_type(el)
+                page["region_types"].add(region_type)
+                open_regions.append([len(regions), False, None])
+                regions.append((region_type, None))
+            elif tag == "Page" and not page_found:
+                page_found = True
+                page["image_fn"] = el.get("imageFilename")
+
+        elif tag == "TextLine":
+            # calculate the bounding box of the line mask (min_x, max_x, min_y, max_y)
+            bbox, xs, ys = get_bounding_box(el, nsmap, element_type="line")
+            if bbox:
+                page["text"].append(get_line_text(el, nsmap))
+                # get the type of the region that contains the line:
+                page["region"].append(get_region_type(el.getparent()))
+                page["min_x"].append(bbox[0])
+                page["max_x"].append(bbox[1])
+                page["min_y"].append(bbox[2])
+                page["max_y"].append(bbox[3])
+                page["xs"].append(xs)
+            el.clear()
+
+        elif tag == "Polygon":
+            # (used unless the region's Coords element has child elements,
+            # i.e., also if it only has a points attribute; see get_points)
+            for open_region in open_regions:
+                if not open_region[1]:
+                    open_region[1:] = [True, get_polygon_points(el)]
+
+        elif tag in ("TextRegion", "TextBlock"):
+            i, polygon_found, polygon_points = open_regions.pop()
+            region_type = regions[i][0]
+            # exclude regions that do not have any line of text in them:
+            if el.find(ns+"TextLine") is not None:
+                coords = el.find(ns+"Coords")
+                if coords is not None and len(coords):
+                    points = get_polygon_points(coords)
+                else:
+                    points = polygon_points
+                if points is not None:
+                    bbox = parse_points(points)[0]
+                    region_d = {"id": el.get("id"), "type": region_type, "bounding_box": bbox}
+                    regions[i] = (region_type, region_d)
+            el.clear()
+
+        elif tag == "fileName" and page["file_name"] is None:
+            file_name = etree.tostring(el, method="text", encoding='utf-8', with_tail=False)
+            page["file_name"] = file_name.decode("utf-8")
+
+        elif tag == "Metadata" and el.getparent() is root and not metadata_found:
+            metadata_found = True
+            page["metadata"] = [(child.tag.split("}")[-1], child.text) for child in el]
+
+    # store the regions in the list of regions of their type:
+    for region_type, region_d in regions:
+        if region_d:
+            if region_type not in page["regions"]:
+                page["regions"][region_type] = []
+            page["regions"][region_type].append(region_d)
+    page["region_types"] = list(page["region_types"])
+    return page
 
 def get_region_type(region_element):
     """Get the region type of a TextRegion element
@@ -64,19 +174,18 @@ def get_region_type(region_element):
         
     return region_type
 
-def select_desired_regions(include_regions, exclude_regions, root, nsmap):
+def select_desired_regions(include_regions, exclude_regions, all_region_types):
     """Select which regions should be extracted from the XML document.
 
     Args:
         include_regions (list): a list of regions to be extracted
         exclude_regions (list): a list of regions to be excluded
-        root (Element): the root element of the XML document
-        nsmap (dict): a dictionary containing the namespaces used in the document
+        all_region_types (list): all region types used in the document
+            (see get_page_model)
 
     Returns:
         list
     """
-    all_region_types = get_all_region_types_in_document(root, nsmap)
     if include_regions == "all":
         #include_regions = all_region_types
         return "all"
@@ -101,97 +210,69 @@ def select_desired_regions(include_regions, exclude_regions, root, nsmap):
                     pass
     return include_regions
 
-def get_regions_on_page(root, nsmap):
-    """Get a dictionary of all regions on a single xml page
+def get_points(el, nsmap):
+    """Get the string of points that define the outline of a region or line element
 
     Args:
-        root (Element): the root element of the XML document
+        el (Element): the region/line XML element
         nsmap (dict): a dictionary containing the namespaces used in the document
+
+    Returns:
+        str (None if the element has no coordinates)
     """
-    all_regions = dict()
-    for region in root.xpath("//default:TextRegion|//default:TextBlock", namespaces=nsmap):
-        # exclude regions that do not have any line of text in them: 
-        #text_lines = sum([1 for text_line in region.xpath("//default:TextLine", namespaces=nsmap)])
-        #text_lines = sum([1 for text_line in region.find("default:TextLine", namespaces=nsmap)])
-        #print(text_lines, "lines in region")
-        #if not text_lines:
-        if len(region.findall("default:TextLine", namespaces=nsmap)) == 0:
-            #print("no lines found in region", region.get("id"))
-            continue
-        #print([text_line for text_line in region.findall("default:TextLine", namespaces=nsmap)])
-        #input()
-        text_lines = sum([1 for text_line in region.findall("default:TextLine", namespaces=nsmap)])
-        #print(text_lines, "lines in region")
-        
-        # gather some relevant metadata about the region:
-        region_d = dict()
-        region_d["id"] = region.get("id")
-        region_type = get_region_type(region)
-        region_d["type"] = region_type
-        bbox, xs, ys = get_bounding_box(region, nsmap, element_type="region")
-        #print(bbox)
-        if not bbox:
-            continue
+    coords = el.find("default:Coords", nsmap)
+    # NB: a Coords element without child elements (i.e., one that only
+    # has a points attribute) is not used; the first Polygon is used instead
+    if coords is None or not len(coords):
+        coords = el.find(".//default:Polygon", nsmap)
+    if coords is None:
+        return None
+    return get_polygon_points(coords)
 
+def get_polygon_points(coords):
+    """Get the points attribute of a Coords (PAGE) or Polygon (ALTO) element
 
-        region_d["bounding_box"] = bbox  # min_x, max_x, min_y, max_y
-        
-        # store the region in the list of regions of its type: 
-        if region_type not in all_regions:
-            all_regions[region_type] = []
-        all_regions[region_type].append(region_d)
-    return all_regions
-        
-def get_bounding_box(el, nsmap, element_type="line"):
-    """Get the bounding box of a region or line element.
+    Args:
+        coords (Element): the Coords/Polygon XML element
+
+    Returns:
+        str
+    """
+    points = coords.get("points") # string of space-separated x,y pairs
+    if not points:
+        points = coords.get("POINTS")
+    return points
+
+def parse_points(points):
+    """Get the bounding box of the outline defined by a string of points.
     Returns the bounding box as a tuple (min_x, max_x, min_y, max_y)
-    as well as a list of all x coordinates of the points
-    that define the outline of the element, and a list of their y coordinates.
+    as well as a list of all x coordinates of the points,
+    and a list of their y coordinates.
+
+    If NumPy is installed, the string is parsed in one go
+    and the coordinates are returned as NumPy arrays
+    (int32 for PAGE, float64 for ALTO).
 
     Args:
-        el (Element): the region/line XML element
-        nsmap (dict): a dictionary containing the namespaces used in the document
-        element_type (str): the type of element you want to get
-            the bounding box for (for use in exception message only)
+        points (str): space-separated x,y pairs (PAGE)
+            or space-separated x and y values (ALTO)
 
     Returns:
         tuple (bbox:tup, xs:list, ys: list) 
     """
-    #print(element_type, el)
-    # get the coordinates of the line/region:
-    coords = el.find("default:Coords", nsmap)
-    if not coords:
-        coords = el.find(".//default:Polygon", nsmap)
-    #print("Coords:", coords)
-    try:
-        points = coords.get("points") # string of space-separated x,y pairs
-        if not points:
-            points = coords.get("POINTS")
-        #print(points)
-    except:
-##        if element_type == "region":
-##            print("Trying to get the bounding box from lines")
-##            line_bboxes = []
-##            line_xss = []
-##            line_yss = []
-##            for line in el.xpath("//default:TextLine", namespaces=nsmap):
-##                line_bbox, line_xs, line_ys = get_bounding_box(line, nsmap, element_type="line")
-##                line_bboxes.append(line_bbox)
-##                line_xss += line_xs
-##                line_yss += line_ys
-##            
-##            min_x = min([b[0] for b in line_bboxes])
-##            max_x = max([b[1] for b in line_bboxes])
-##            min_y = min([b[2] for b in line_bboxes])
-##            max_y = max([b[3] for b in line_bboxes])
-##            
-##            return [min_x, max_x, min_y, max_y], line_xss, line_yss
-##        else:
-            
-        #print("No coordinates found in", element_type, el.get("id"))
-        #print(etree.tostring(el))
-        return None, None, None
-    
+    if np is not None:
+        if "," in points:     # in PAGE xlm: [x,y x,y x,y]
+            coords = np.fromstring(points.replace(",", " "), dtype=np.int32, sep=" ")
+        else:                 # in ALTO:     [x y x y x y]
+            coords = np.fromstring(points, dtype=np.float64, sep=" ")
+        if len(coords) % 2 == 0:
+            coords = coords.reshape(-1, 2)   # one (x, y) row per point
+            min_x, min_y = coords.min(axis=0).tolist()
+            max_x, max_y = coords.max(axis=0).tolist()
+            bbox = (min_x, max_x, min_y, max_y)
+            return [bbox, coords[:, 0], coords[:, 1]]
+        # (an odd number of values is parsed below)
+
     # store the bounding box values of the line mask:
     if "," in points:     # in PAGE xlm: [x,y x,y x,y]
         xs = [int(coord.split(",")[0]) for coord in points.split(" ")]
@@ -208,17 +289,54 @@ def get_bounding_box(el, nsmap, element_type="line"):
     bbox = (min_x, max_x, min_y, max_y)
     return [bbox, xs, ys]
 
-def parse_lines(root, nsmap, include_regions, fp, exclude_regions=[],
-                extremes_ratio=0.1, midpoint_ratio=0.6,
-                skip_orphan_lines=True, col_min_x=0, col_max_x=10000000000000):
-    """Parse the TextLine elements in the XML files as a dictionary
+def get_bounding_box(el, nsmap, element_type="line"):
+    """Get the bounding box of a region or line element.
+    Returns the bounding box as a tuple (min_x, max_x, min_y, max_y)
+    as well as a list of all x coordinates of the points
+    that define the outline of the element, and a list of their y coordinates.
 
     Args:
-        root (Element): the root element of the XML document
+        el (Element): the region/line XML element
         nsmap (dict): a dictionary containing the namespaces used in the document
+        element_type (str): the type of element you want to get
+            the bounding box for (for use in exception message only)
+
+    Returns:
+        tuple (bbox:tup, xs:list, ys: list) 
+    """
+    points = get_points(el, nsmap)
+    if points is None:
+        #print("No coordinates found in", element_type, el.get("id"))
+        return None, None, None
+    return parse_points(points)
+
+def get_line_text(text_line, nsmap):
+    """Get the text content of a TextLine element
+
+    Args:
+        text_line (Element): an etree TextLine element
+        nsmap (dict): a dictionary containing the namespaces used in the document
+
+    Returns:
+        str
+    """
+    line_text = etree.tostring(text_line, method="text", encoding='utf-8')
+    if not line_text:  # ALTO has the line text in CONTENT 
+        line_text = []
+        for word in text_line.findall("default:String", namespaces=nsmap):
+            line_text .append(word.get("CONTENT"))
+        return " ".join(line_text)
+    return line_text.decode("utf-8")
+
+def select_lines(page, include_regions, exclude_regions=[],
+                 extremes_ratio=0.1, midpoint_ratio=0.6,
+                 skip_orphan_lines=True, col_min_x=0, col_max_x=10000000000000):
+    """Select the lines of a page model (see get_page_model)
+    that are in the desired regions and column
+
+    Args:
+        page (dict): the page model
         include_regions (list): a list of regions to be extracted
-        fp (str): path to the file containting the transcription
-            (only for debugging printing)
         exclude_regions (list): a list of region names from which text should
             not be extracted
         extremes_ratio (float): the ratio of X coordinates that should be
@@ -234,19 +352,15 @@ def parse_lines(root, nsmap, include_regions, fp, exclude_regions=[],
             is less than col_max_x will be included
 
     Returns:
-        list
+        tuple (line indices sorted from top to bottom:list,
+               region_midpoints:dict, median_line_height:float)
     """
-    
+    min_xs, max_xs = page["min_x"], page["max_x"]
+    min_ys, max_ys = page["min_y"], page["max_y"]
     lines = []
     region_xs = dict()
     line_heights = []
-    for text_line in root.xpath("//default:TextLine", namespaces=nsmap):
-        line_d = dict()
-        
-        # get the type of the region that contains the line:
-        region = text_line.getparent()
-        region_type = get_region_type(region)
-
+    for i, region_type in enumerate(page["region"]):
         # skip lines that are not within a (named) region:
         if region_type is None and skip_orphan_lines:
             continue
@@ -256,68 +370,28 @@ def parse_lines(root, nsmap, include_regions, fp, exclude_regions=[],
         # skip lines that are not in the whitelist of regions:
         elif (include_regions != "all" and region_type not in include_regions):
             continue
-        # calculate the bounding box of the line mask (min_x, max_x, min_y, max_y)
-        bbox, xs, ys = get_bounding_box(text_line, nsmap, element_type="line")
-        if not bbox:
-            continue
         # skip lines that are not in the desired column (in a multi-column layout):
-        mid_x = (bbox[1] + bbox[0]) / 2    # max_x + min_x
-        #print("midpoint (x) of line:", mid_x)
+        mid_x = (max_xs[i] + min_xs[i]) / 2
         if not col_min_x < mid_x < col_max_x:
-            #print("> midpoint not in desired column")
             continue
 
-        # store the bounding box values of the line mask:
-        line_d["min_x"] = bbox[0]
-        line_d["max_x"] = bbox[1]
-        line_d["min_y"] = bbox[2]
-        line_d["max_y"] = bbox[3]
-        line_d["region"] = region_type
-
-        # get the text content of the line:
-        line_text = etree.tostring(text_line, method="text", encoding='utf-8')
-        if not line_text:  # ALTO has the line text in CONTENT 
-            line_text = []
-            for word in text_line.findall("default:String", namespaces=nsmap):
-                line_text .append(word.get("CONTENT"))
-            line_text = " ".join(line_text)
-            line_d["text"] = line_text
-        else:
-            line_d["text"] = line_text.decode("utf-8")
-        #print(line_text)
-        
-        # add this line's metadata to the list of lines:
-        lines.append(line_d)
-
-        # calculate the line height and add it to the list of line heights:
-        line_height = line_d["max_y"] - line_d["min_y"]
-        line_heights.append(line_height)
-
-        # add the line's x coordinates to the region_xs dictionary:
+        lines.append(i)
+        line_heights.append(max_ys[i] - min_ys[i])
+        # store the line's x coordinates (as a chunk) with those of its region:
         if not region_type in region_xs:
             region_xs[region_type] = []
-        region_xs[region_type] += xs
-        #print(line_d)
-        #print(region, region_type)
+        region_xs[region_type].append(page["xs"][i])
 
-            
-    # sort the regions by their horizontal position on the page:
-    lines = sorted(lines, key=lambda d: (d["min_y"], d["max_x"]))
+    # sort the lines by their vertical position on the page:
+    lines = sorted(lines, key=lambda i: (min_ys[i], max_xs[i]))
 
     # calculate the midpoint of the lines of each region
     # (to help decide whether a line segment is a second hemistych):
     region_midpoints = dict()
     for region in region_xs:
-        all_xs = region_xs[region]
-        # Remove the extremes on both sides:
-        extremes = int(extremes_ratio * len(all_xs))
-        if extremes > 1:
-            all_xs = sorted(all_xs)[extremes:-extremes]
-        #else:
-            #print("too few x values to remove the extremes")
         try:
-            midpoint = midpoint_ratio * (min(all_xs) + max(all_xs))
-            #print(min(all_xs), midpoint, max(all_xs))
+            min_x, max_x = get_trimmed_extremes(region_xs[region], extremes_ratio)
+            midpoint = midpoint_ratio * (min_x + max_x)
         except:
             midpoint = 0
         region_midpoints[region] = midpoint
@@ -326,11 +400,40 @@ def parse_lines(root, nsmap, include_regions, fp, exclude_regions=[],
         median_line_height = statistics.median(line_heights)
     except:
         median_line_height = None
-    #print("median_line_height", median_line_height)
     return lines, region_midpoints, median_line_height
 
-def sort_segments_per_line(line_segments, median_line_height, min_line_overlap=20):
-    """Given a list of line dictionaries, sorted vertically from top to bottom,
+def get_trimmed_extremes(xs_chunks, extremes_ratio=0.1):
+    """Get the lowest and highest x coordinate in a list of chunks
+    of x coordinates, disregarding the extremes on both sides
+
+    Args:
+        xs_chunks (list): a list of lists (or NumPy arrays) of x coordinates
+        extremes_ratio (float): the ratio of X coordinates that should be
+            disregarded
+
+    Returns:
+        tuple (min_x, max_x)
+    """
+    if np is not None:
+        all_xs = np.concatenate(xs_chunks)
+        n = len(all_xs)
+        extremes = int(extremes_ratio * n)
+        if extremes > 1:
+            # only the values at the positions of the new extremes need to be sorted:
+            lo, hi = extremes, n - extremes - 1
+            all_xs = np.partition(all_xs, (lo, hi))
+            return all_xs[lo].item(), all_xs[hi].item()
+        return all_xs.min().item(), all_xs.max().item()
+
+    all_xs = [x for xs in xs_chunks for x in xs]
+    # Remove the extremes on both sides:
+    extremes = int(extremes_ratio * len(all_xs))
+    if extremes > 1:
+        all_xs = sorted(all_xs)[extremes:-extremes]
+    return min(all_xs), max(all_xs)
+
+def sort_segments_per_line(line_segments, page, median_line_height, min_line_overlap=20):
+    """Given a list of line segments, sorted vertically from top to bottom,
     create a new list in which segments that are on the same line
     are in grouped in a list.
 
@@ -341,8 +444,9 @@ def sort_segments_per_line(line_segments, median_line_height, min_line_overlap=2
     Y
 
     Args:
-        line_segments (list): a list of line segment dictionaries,
+        line_segments (list): a list of line indices in the page model,
             sorted vertically from top to bottom based their min_y coordinate
+        page (dict): the page model (see get_page_model)
         median_line_height (int): median line height for this page
             (line height was calculated as max_y - min_y for each line mask)
         min_line_overlap (int): the number of pixels lines should overlap
@@ -359,30 +463,23 @@ def sort_segments_per_line(line_segments, median_line_height, min_line_overlap=2
     except:
         min_line_overlap = None  # no lines found!
 
-    
+    min_xs, max_xs = page["min_x"], page["max_x"]
+    min_ys, max_ys = page["min_y"], page["max_y"]
+    by_min_x = lambda i: min_xs[i]
     prev_max_y = 0
     prev_max_x = 0
     prev_min_x = 0
     line = []
     lines = []
     for segm in line_segments:
-        #print("segm", segm)
-        #print("line height:",  segm["max_y"] - segm["min_y"])
-        #print('segm["min_y"]', segm["min_y"])
         # first check vertical overlap between current and previous line:
-        vertical_overlap = (prev_max_y - segm["min_y"]) > min_line_overlap
-        #print("vertical_overlap", vertical_overlap)
+        vertical_overlap = (prev_max_y - min_ys[segm]) > min_line_overlap
         
         # then check horizontal overlap between current and previous line:
-        #print('segm["max_x"]', segm["max_x"])
-        if segm["max_x"] > prev_max_x:
-            #horizontal_overlap = segm["min_x"] < prev_max_x
-            horizontal_overlap = (prev_max_x - segm["min_x"]) > min_line_overlap
+        if max_xs[segm] > prev_max_x:
+            horizontal_overlap = (prev_max_x - min_xs[segm]) > min_line_overlap
         else:
-            #horizontal_overlap = segm["max_x"] > prev_min_x
-            horizontal_overlap = (segm["max_x"] - prev_min_x) > min_line_overlap
-        #print("horizontal_overlap", horizontal_overlap)
-        #print("--------------")
+            horizontal_overlap = (max_xs[segm] - prev_min_x) > min_line_overlap
 
         # Line segments are on the same line only if they overlap vertically
         # but not horizontally:  (NB: not sure about horizontal overlap!)
@@ -394,25 +491,25 @@ def sort_segments_per_line(line_segments, median_line_height, min_line_overlap=2
             if line:
                 # sort the segments based on their X coordinates
                 # and append the line to the list of lines:
-                lines.append(sorted(line, key=lambda d: d["min_x"], reverse=True))
+                lines.append(sorted(line, key=by_min_x, reverse=True))
             line = [segm, ]
 
         # store the current line's coordinates for comparison with the next line:
-        prev_max_y = segm["max_y"]
-        prev_max_x = segm["max_x"]
-        prev_min_x = segm["min_x"]
+        prev_max_y = max_ys[segm]
+        prev_max_x = max_xs[segm]
+        prev_min_x = min_xs[segm]
 
     # add any line remaining after the end of the loop:
     if line:
-        lines.append(sorted(line, key=lambda d: d["min_x"], reverse=True))
+        lines.append(sorted(line, key=by_min_x, reverse=True))
     
     return lines
 
-def check_indentation(segm_d, indent_threshold):
+def check_indentation(max_x, indent_threshold):
     """Check whether a line is indented
 
     Args:
-        segm_d (dict): a dictionary describing a line segment
+        max_x (int): the rightmost X coordinate of the first segment of the line
         indent_threshold (int): the number of pixels
             (starting from the left of the page) that is considered
             the indentation threshold
@@ -420,46 +517,94 @@ def check_indentation(segm_d, indent_threshold):
     Returns:
         bool
     """
-    if segm_d["max_x"] < indent_threshold:
+    if max_x < indent_threshold:
         return True
     return False
 
-def get_image_fn(root, nsmap):
+def get_image_fn(page):
     """Get the filename of the transcribed image from the XML metadata
 
     Args:
-        root (Element): the root element of the XML document
-        nsmap (dict): a dictionary containing the namespaces used in the document
+        page (dict): the page model (see read_page)
 
     Returns:
         str
     """
-    image_fn = ""
-    try:
-        image_fn = root.find(".//default:Page", nsmap).get("imageFilename")
-    except Exception as e:
-        print("Error extracting image filename", e)
+    image_fn = page["image_fn"]
     if not image_fn:
-        try:
-            el = root.find(".//default:fileName", nsmap)
-            image_fn = etree.tostring(el, method="text", encoding='utf-8')
-            image_fn = image_fn.decode('utf-8').split("/")[-1]
-        except Exception as e:
-            print("Error extracting image filename", e)
+        if page["file_name"] is None:
+            print("Error extracting image filename")
             return ""
+        image_fn = page["file_name"].split("/")[-1]
     #print(image_fn)
     return image_fn
 
-def post_process(text, line_segment_separator):
-    # remove empty lines:
-    text = re.sub(r"\n~~(?:{})*\n".format(line_segment_separator), "\n", text)
-    # remove line numbers:
-    text = re.sub(line_segment_separator+r"\d+\n", "\n", text)
-    text = re.sub(r"(\n[# ~]+)\d+"+line_segment_separator, r"\1", text)
-    # convert lines with a large indentation to titles:
-    text = re.sub(r"# +%~% ", "### | ", text)
-    
-    return text
+def get_post_process_rules(line_segment_separator):
+    """Get the substitution rules used to post-process a page
+    (see substitution_rules); the rules are compiled once per separator
+
+    Args:
+        line_segment_separator (str): the separator between line segments
+
+    Returns:
+        list
+    """
+    if line_segment_separator not in post_process_rules:
+        # (the separator is used as a regex; if it contains an alternation,
+        # matches of the line number rules do not necessarily contain a new line)
+        nl = None if "|" in line_segment_separator else "\n"
+        post_process_rules[line_segment_separator] = substitution_rules.compile_rules([
+            [("empty lines", r"\n~~(?:{})*\n".format(line_segment_separator), "\n", "\n~~")],
+            [("line numbers", line_segment_separator+r"\d+\n", "\n", nl)],
+            [("line numbers at line start", r"(\n[# ~]+)\d+"+line_segment_separator, r"\1", nl)],
+            # convert lines with a large indentation to titles:
+            [("indented lines", r"# +%~% ", "### | ", "%~% ")],
+        ])
+    return post_process_rules[line_segment_separator]
+
+def post_process(text, line_segment_separator, profile=None):
+    """Remove empty lines and line numbers from the text of a page
+    and convert lines with a large indentation to titles
+
+    Args:
+        text (str): text of the page
+        line_segment_separator (str): the separator between line segments
+        profile (dict): if provided, the time and number of substitutions
+            of every rule are added to this dictionary
+            (see substitution_rules.apply_rules)
+
+    Returns:
+        str
+    """
+    return substitution_rules.apply_rules(text, get_post_process_rules(line_segment_separator), profile)
+
+def get_switched_fn(filename, pad_zeros=False):
+    """Get the new name of a page file in a folder in which the left page
+    comes before the right page (see switch_LR_pages)
+
+    Args:
+        filename (str): the name of the page file
+        pad_zeros (int): if defined, the page number in the new name
+            is padded with zeros to this length
+
+    Returns:
+        str
+    """
+    no = re.findall(r"\d+", filename)[-1]
+    #print(no)
+    if int(no)%2 == 1:
+        if pad_zeros:
+            pattern = "{:0" + str(pad_zeros) +"d}"
+            new_filename = re.sub(str(int(no)), pattern.format(int(no)-2), filename)
+        else:
+            new_filename = re.sub(str(int(no)), "{}".format(int(no)-2), filename)
+    else:
+        if pad_zeros:
+            pattern = "{:0" + str(pad_zeros) +"d}"
+            new_filename = re.sub(str(int(no)), pattern.format(int(no)), filename)
+        else:
+            new_filename = filename
+    return new_filename
 
 def switch_LR_pages(folder, ext="xml", rename_files=True, pad_zeros=False):
     """Switch pages that are in the wrong order in the folder: left page before right
@@ -471,20 +616,7 @@ def switch_LR_pages(folder, ext="xml", rename_files=True, pad_zeros=False):
 
     for filename in os.listdir(folder):
         if filename.endswith(ext):
-            no = re.findall(r"\d+", filename)[-1]
-            #print(no)
-            if int(no)%2 == 1:
-                if pad_zeros:
-                    pattern = "{:0" + str(pad_zeros) +"d}"
-                    new_filename = re.sub(str(int(no)), pattern.format(int(no)-2), filename)
-                else:
-                    new_filename = re.sub(str(int(no)), "{}".format(int(no)-2), filename)
-            else:
-                if pad_zeros:
-                    pattern = "{:0" + str(pad_zeros) +"d}"
-                    new_filename = re.sub(str(int(no)), pattern.format(int(no)), filename)
-                else:
-                    new_filename = filename
+            new_filename = get_switched_fn(filename, pad_zeros)
             #print(new_filename)
             if rename_files:
                 os.rename(os.path.join(folder, filename), os.path.join(temp_dir, new_filename))
@@ -493,17 +625,17 @@ def switch_LR_pages(folder, ext="xml", rename_files=True, pad_zeros=False):
     if rename_files:
         for fn in os.listdir(temp_dir):
             os.rename(os.path.join(temp_dir, fn), os.path.join(folder, fn))
-        time.sleep(1)
         os.rmdir(temp_dir)
 
 def convert_file(fp, include_regions=[], exclude_regions=[], page_offset=0, min_line_overlap=20,
                  line_segment_separator="   ", include_image_name=True,
                  skip_orphan_lines=True, first_page=0, transcription_meta=dict(),
-                 main_text_region="Main"):
+                 main_text_region="Main", xml=None):
     """Convert a single eScriptorium Page XML file to OpenITI mARkdown
 
     Args:
         fp (str): path to the xml file
+            (if xml is provided: the name of the page, used for the page number)
         include_regions (list): list of names of region types from which the
             text should be extracted
         exclude_regions (list): list of names of region types from which the
@@ -526,6 +658,8 @@ def convert_file(fp, include_regions=[], exclude_regions=[], page_offset=0, min_
         transcription_meta (dict): contains metadata about the transcription layer 
         main_text_region (str): the name of the region that contains the
             main text of the page; defaults to "Main"
+        xml (bytes): the content of the xml file, if it is not read from fp
+            (e.g., a page in a zip file). Defaults to None
 
     Returns:
         tuple (metadata:str, page_text:str, regions:list)
@@ -533,23 +667,19 @@ def convert_file(fp, include_regions=[], exclude_regions=[], page_offset=0, min_
     """
     #print("-"*60)
 
-    # create an etree representation of the XML file:
-    with open(fp, mode="rb") as file:
-        parser = etree.XMLParser(remove_blank_text=True)
-        tree = etree.parse(file, parser)
-        #print(etree.tostring(tree)[:1000])
-    root = tree.getroot()
-    
-    # create a namespace map
-    # (so we can use the default namespace in our xpath/findall searches)
-    nsmap = {k if k is not None else 'default':v for k,v in root.nsmap.items()}
+    # collect the regions and lines of the page in a single pass through the file:
+    if xml is not None:
+        page = read_page(io.BytesIO(xml))
+    else:
+        page = read_page(fp)
 
     # Define the regions that should be included, if not defined yet:
-    include_regions = select_desired_regions(include_regions, exclude_regions, root, nsmap)
+    include_regions = select_desired_regions(include_regions, exclude_regions,
+                                             page["region_types"])
 
     # check whether the page is a double page spread
     # by checking how many main text regions containing text are on the page:
-    regions_on_page = get_regions_on_page(root, nsmap)
+    regions_on_page = page["regions"]
     if main_text_region in regions_on_page:
         n_columns = len(regions_on_page[main_text_region])
         if n_columns > 1:
@@ -593,24 +723,27 @@ def convert_file(fp, include_regions=[], exclude_regions=[], page_offset=0, min_
         col_max_x = col_max_xs[col_no]
         #print(f"COLUMN NUMBER {col_no}: X: {col_min_x} - {col_max_x}")
         
-        # extract relevant information about line segments and regions:
-        resp = parse_lines(root, nsmap, include_regions, fp, exclude_regions=exclude_regions,
-                           skip_orphan_lines=skip_orphan_lines,
-                           col_min_x=col_min_x, col_max_x=col_max_x)
+        # select the line segments in this column and get information about the regions:
+        resp = select_lines(page, include_regions, exclude_regions=exclude_regions,
+                            skip_orphan_lines=skip_orphan_lines,
+                            col_min_x=col_min_x, col_max_x=col_max_x)
         line_segments, region_midpoints, median_line_height = resp
 
         # group line segments that are horizontally on the same line:
-        lines = sort_segments_per_line(line_segments, median_line_height)
+        lines = sort_segments_per_line(line_segments, page, median_line_height)
+        max_xs = page["max_x"]
+        min_xs = page["min_x"]
+        segm_regions = page["region"]
 
         # Define the treshold for a new paragraph indentation
         # based on the average starting position of lines in the region
         # and the average length of a line:
         try:
-            median_start_x = statistics.median([line[0]["max_x"] for line in lines])
+            median_start_x = statistics.median([max_xs[line[0]] for line in lines])
         except Exception as e:
             #print(e)
             median_start_x = 0
-        line_lengths = [line[0]["max_x"]-line[-1]["min_x"] for line in lines]
+        line_lengths = [max_xs[line[0]]-min_xs[line[-1]] for line in lines]
         try:
             median_line_length = statistics.median(line_lengths)
         except Exception as e:
@@ -623,26 +756,21 @@ def convert_file(fp, include_regions=[], exclude_regions=[], page_offset=0, min_
         for line in lines:
             line_text = ""
             for segm in line:
-                #print('segm["min_x"]:', segm["min_x"], 'segm["max_x"]:', segm["max_x"])
-                #print(segm["text"])
-                if segm["region"] == "Title":
-                    line_text += "\n### | " + segm["text"].strip()
-                elif segm["region"] == "Main" \
-                     and segm["max_x"] < region_midpoints["Main"]:
+                segm_text = page["text"][segm]
+                if segm_regions[segm] == "Title":
+                    line_text += "\n### | " + segm_text.strip()
+                elif segm_regions[segm] == "Main" \
+                     and max_xs[segm] < region_midpoints["Main"]:
                     # segment starts to the left of the region's mid point: add poetry marker
-                    #line_text = "\n# " + line_text + " %~% " + segm["text"].strip()
-                    line_text += " %~% " + segm["text"].strip()
-                    #print('segm["min_x"]:', segm["min_x"],
-                    #      'segm["max_x"]:', segm["max_x"],
-                    #      "midpoint:", region_midpoints["Main"])
+                    line_text += " %~% " + segm_text.strip()
                 else:
                     if line_text:
                         line_text += line_segment_separator
-                    line_text += segm["text"].strip()
+                    line_text += segm_text.strip()
                 
             # Check whether the line is the beginning of a paragraph (indentation):
-            if not line[0]["region"] == "Title":
-                if check_indentation(line[0], indent_offset):
+            if not segm_regions[line[0]] == "Title":
+                if check_indentation(max_xs[line[0]], indent_offset):
                     #line_text = "# " + line_text[len(line_segment_separator):]
                     line_text = "# " + line_text
                 else:
@@ -668,7 +796,7 @@ def convert_file(fp, include_regions=[], exclude_regions=[], page_offset=0, min_
 
     # add image filename:
     if include_image_name:
-        image_fn = get_image_fn(root, nsmap)
+        image_fn = get_image_fn(page)
         page_text = "![image file](./{})\n\n".format(image_fn) + page_text
 
     # remove some conversion artifacts:
@@ -678,12 +806,9 @@ def convert_file(fp, include_regions=[], exclude_regions=[], page_offset=0, min_
 
     # extract metadata from page xml file:
     metadata = ""
-    meta_el = root.find("default:Metadata", nsmap)
-    if meta_el:
-        for child in meta_el:
-            #print(child.tag, child.text)
-            tag = child.tag.split("}")[-1]
-            content = child.text.strip()
+    if page["metadata"]:
+        for tag, content in page["metadata"]:
+            content = content.strip()
             metadata += "#META# {}: {}\n".format(tag, content)
 
         # add metadata from transcription layer:
@@ -693,14 +818,157 @@ def convert_file(fp, include_regions=[], exclude_regions=[], page_offset=0, min_
         
     return metadata, page_text, include_regions, page_offset
 
+def convert_file_in_worker(fp, xml, kwargs):
+    """Convert a single page in a worker process (see convert_file)
+
+    Returns:
+        tuple (metadata:str, page_text:str)
+    """
+    metadata, page_text, include_regions, page_offset = convert_file(fp, xml=xml, **kwargs)
+    return metadata, page_text
+
+def iter_converted_pages(fps, kwargs, workers, max_pending=None, read_xml=None):
+    """Convert pages in a pool of worker processes
+    and yield the results in the order of the pages.
+
+    Only max_pending pages are submitted to the pool at a time,
+    so that no more than max_pending converted pages
+    are kept in memory while they wait for their turn.
+
+    Args:
+        fps (list): paths to the xml files, in page order
+        kwargs (dict): keyword arguments for convert_file
+        workers (int): number of worker processes
+        max_pending (int): maximum number of pages that are being converted
+            or waiting to be written (default: 4 per worker)
+        read_xml (function): if provided, this function is used
+            to get the content of the xml file of each page,
+            which is then sent to the worker (see convert_pages)
+
+    Yields:
+        tuple (metadata:str, page_text:str)
+    """
+    if not max_pending:
+        max_pending = 4 * workers
+    with multiprocessing.Pool(workers) as pool:
+        pending = collections.deque()
+        for fp in fps:
+            xml = read_xml(fp) if read_xml else None
+            pending.append(pool.apply_async(convert_file_in_worker, (fp, xml, kwargs)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+def convert_pages(fps, outfp, include_regions=[], exclude_regions=[],
+                  page_offset=0, min_line_overlap=20, extension="xml",
+                  line_segment_separator="   ", include_image_name=True,
+                  skip_orphan_lines=True, first_page=0,
+                  transcription_meta=dict(), main_text_region="Main",
+                  workers=1, read_xml=None):
+    """Convert a list of eScriptorium XML files
+    to a single OpenITI mARkdown document (see convert_folder and convert_zip)
+
+    If workers > 1, the first page is converted first
+    (to define the regions to be included and the page offset,
+    which can require user input), and the other pages are converted
+    in parallel. The converted pages are written to the output file
+    in page order.
+
+    Args:
+        fps (list): paths to all files in the folder, in page order
+            (files that do not have the extension are skipped)
+        outfp (str): path to the output mARkdown file
+        include_regions (list): list of names of region types from which the
+            text should be extracted
+        exclude_regions (list): list of names of region types from which the
+            text should NOT be extracted
+        page_offset (int): the number that should be added to the
+            page number mentioned in the file name
+        min_line_overlap (int): the number of pixels two line segments
+            should overlap before the overlap is considered meaningful
+        line_segment_separator (str): the separator that should be
+            used to separate line segments that are on the same line
+        include_image_name (bool): if True, the name of the transcribed
+            image will be included at the top of the page.
+        skip_orphan_lines (bool): if True, lines that are not embedded
+            in a (named) region will be discarded
+        first_page (int): if the current file is the first page of a book,
+            first_page will be the real page number of that page;
+            else, it will be 0.
+        transcription_meta (dict): contains metadata about the transcription layer
+        main_text_region (str): the name of the region that contains the
+            main text of the page; defaults to "Main"
+        workers (int): number of processes used to convert the pages
+        read_xml (function): if provided, the files are not read from disk:
+            this function is called with the path of a file
+            to get its content (bytes)
+    """
+    pages = []
+    for i, fp in enumerate(fps):
+        fn = os.path.basename(fp)
+        if not fn.endswith(extension) or fn.startswith("METS"):
+            continue
+        # (first_page is only used if the first file in the folder is a page)
+        if i != 0:
+            first_page = 0
+        pages.append((fp, first_page))
+    kwargs = dict(exclude_regions=exclude_regions,
+                  min_line_overlap=min_line_overlap,
+                  line_segment_separator=line_segment_separator,
+                  include_image_name=include_image_name,
+                  skip_orphan_lines=skip_orphan_lines,
+                  transcription_meta=transcription_meta,
+                  main_text_region=main_text_region)
+
+    # write the pages to a temporary file
+    # (the metadata header is taken from the last page):
+    metadata = ""
+    out_folder, out_fn = os.path.split(os.path.abspath(outfp))
+    handle, temp_fp = tempfile.mkstemp(dir=out_folder, prefix="."+out_fn+".", suffix=".tmp")
+    try:
+        with open(handle, mode="w", encoding="utf-8") as file:
+            # convert the first page(s) one by one, until the regions
+            # that should be included are defined:
+            n_converted = 0
+            for fp, first_page in pages:
+                if workers > 1 and n_converted and include_regions:
+                    break
+                xml = read_xml(fp) if read_xml else None
+                metadata, page_text, include_regions, page_offset = convert_file(fp,
+                    include_regions=include_regions, page_offset=page_offset,
+                    first_page=first_page, xml=xml, **kwargs)
+                file.write(page_text)
+                n_converted += 1
+
+            # convert the other pages in parallel:
+            if n_converted < len(pages):
+                kwargs.update(include_regions=include_regions, page_offset=page_offset)
+                other_fps = [fp for fp, first_page in pages[n_converted:]]
+                for metadata, page_text in iter_converted_pages(other_fps, kwargs, workers,
+                                                                read_xml=read_xml):
+                    file.write(page_text)
+
+        metadata = "######OpenITI#\n\n{}\n\n#META#Header#End#\n\n".format(metadata)
+        with open(outfp, mode="w", encoding="utf-8") as file:
+            file.write(metadata)
+            file.flush()
+            with open(temp_fp, mode="rb") as pages:
+                shutil.copyfileobj(pages, file.buffer)
+    finally:
+        os.remove(temp_fp)
+
 def convert_folder(folder, outfp, include_regions=[], exclude_regions=[],
                    page_offset=0, min_line_overlap=20, extension="xml",
                    line_segment_separator="   ", include_image_name=True,
                    skip_orphan_lines=True, first_page=0,
-                   transcription_meta=dict(), main_text_region="Main"):
+                   transcription_meta=dict(), main_text_region="Main",
+                   workers=1):
     """Convert a folder containing eScriptorium XML files
     to a single OpenITI mARkdown document
 
+    If workers > 1, the pages are converted in parallel (see convert_pages).
+
     Args:
         folder (str): path to the folder containing the xml files
         outfp (str): path to the output mARkdown file
@@ -724,45 +992,32 @@ def convert_folder(folder, outfp, include_regions=[], exclude_regions=[],
         transcription_meta (dict): contains metadata about the transcription layer
         main_text_region (str): the name of the region that contains the
             main text of the page; defaults to "Main"
+        workers (int): number of processes used to convert the pages
 
     Returns:
         tuple (metadata:str, page_text:str, include_regions:list)
     """
-    text = ""
-    for i, fn in enumerate(natural_sort(os.listdir(folder))):
-        if not fn.endswith(extension) or fn.startswith("METS"):
-            continue
-        fp = os.path.join(folder, fn)
-        if i != 0:
-            first_page = 0
-        metadata, page_text, include_regions, page_offset = convert_file(fp,
-            include_regions=include_regions,
-            exclude_regions=exclude_regions,
-            page_offset=page_offset,
-            min_line_overlap=min_line_overlap,
-            line_segment_separator=line_segment_separator,
-            include_image_name=include_image_name,
-            skip_orphan_lines=skip_orphan_lines,
-            first_page=first_page,
-            transcription_meta=transcription_meta,
-            main_text_region=main_text_region)
-        text += page_text
-    metadata = "######OpenITI#\n\n{}\n\n#META#Header#End#\n\n".format(metadata)
-    text = metadata + text
-
-    with open(outfp, mode="w", encoding="utf-8") as file:
-        file.write(text)
-
-
+    fps = [os.path.join(folder, fn) for fn in natural_sort(os.listdir(folder))]
+    convert_pages(fps, outfp, include_regions=include_regions,
+                  exclude_regions=exclude_regions, page_offset=page_offset,
+                  min_line_overlap=min_line_overlap, extension=extension,
+                  line_segment_separator=line_segment_separator,
+                  include_image_name=include_image_name,
+                  skip_orphan_lines=skip_orphan_lines,
+                  first_page=first_page, transcription_meta=transcription_meta,
+                  main_text_region=main_text_region, workers=workers)
 
 def convert_zip(zip_fp, outfp, include_regions=[], exclude_regions=[],
                 page_offset=0, min_line_overlap=20,
                 line_segment_separator="   ", include_image_name=True,
                 reorder_pages=False, skip_orphan_lines=True, first_page=0,
-                transcription_meta=dict(), main_text_region="Main"):
+                transcription_meta=dict(), main_text_region="Main", workers=1):
     """Convert a zip file containing eScriptorium XML files
     to a single OpenITI mARkdown document
 
+    The xml files are read directly from the zip file
+    (without extracting them), in natural order.
+
     Args:
         zip_fp (str): path to the xml file
         outfp (str): path to the output mARkdown file
@@ -790,34 +1045,37 @@ def convert_zip(zip_fp, outfp, include_regions=[], exclude_regions=[],
         transcription_meta (dict): contains metadata about the transcription layer
         main_text_region (str): the name of the region that contains the
             main text of the page; defaults to "Main"
+        workers (int): number of processes used to convert the pages
 
     Returns:
         tuple (metadata:str, page_text:str, include_regions:list)
     """
-    # create a temporary directory to store the xml files extracted
-    # from the zip archive:
-    temp_folder = zip_fp+"_temp"
-    if not os.path.exists(temp_folder):
-        os.makedirs(temp_folder)
-
-    # Extract the xml files from the zip archive to the temporary directory
-    with ZipFile(zip_fp, "r") as file:
-        file.extractall(temp_folder)
-
-    # reorder pages if the left page is before the right page:
-    if reorder_pages:
-        switch_LR_pages(temp_folder, ext="xml", rename_files=True, pad_zeros=3)
-
-    convert_folder(temp_folder, outfp, include_regions=include_regions,
-                   exclude_regions=exclude_regions, page_offset=page_offset,
-                   min_line_overlap=min_line_overlap,
-                   line_segment_separator=line_segment_separator,
-                   include_image_name=include_image_name,
-                   skip_orphan_lines=skip_orphan_lines,
-                   first_page=first_page, transcription_meta=transcription_meta,
-                   main_text_region=main_text_region)
-    time.sleep(1)
-    shutil.rmtree(temp_folder)
+    with ZipFile(zip_fp, "r") as zip_file:
+        # list the files (and folders) in the root of the zip file
+        # (key: the name under which a file is converted, value: its name in the zip file):
+        members = dict()
+        for member in zip_file.namelist():
+            fn = member.split("/")[0]
+            if fn != member:  # a file in a folder: only the folder is listed
+                members.setdefault(fn, None)
+                continue
+            # reorder pages if the left page is before the right page
+            # (by giving the files the names they get in switch_LR_pages):
+            if reorder_pages and fn.endswith("xml") and re.search(r"\d", fn):
+                fn = get_switched_fn(fn, pad_zeros=3)
+            members[fn] = member
+
+        fps = [os.path.join(zip_fp, fn) for fn in natural_sort(list(members))]
+        read_xml = lambda fp: zip_file.read(members[os.path.basename(fp)])
+        convert_pages(fps, outfp, include_regions=include_regions,
+                      exclude_regions=exclude_regions, page_offset=page_offset,
+                      min_line_overlap=min_line_overlap,
+                      line_segment_separator=line_segment_separator,
+                      include_image_name=include_image_name,
+                      skip_orphan_lines=skip_orphan_lines,
+                      first_page=first_page, transcription_meta=transcription_meta,
+                      main_text_region=main_text_region, workers=workers,
+                      read_xml=read_xml)
 
 def download_transcriptions(escr, download_folder, output_type="pagexml", projects=None,  
                             document_names=None, transcription_layers=None,
@@ -951,7 +1209,9 @@ def download_transcriptions(escr, download_folder, output_type="pagexml", projec
 
 
 def add_to_yml(yml_fp, based, link, notes, issues, uri=None):
-    yml = readYML(yml_fp)
+    """Add metadata to a version yml file
+    (saved in the yml store: call yml_store.flush to write it to disk)"""
+    yml = yml_store.read_yml(yml_fp)
     if based:
         yml["80#VERS#BASED####:"] = based
     if link:
@@ -974,8 +1234,7 @@ def add_to_yml(yml_fp, based, link, notes, issues, uri=None):
         yml["90#VERS#ISSUES###:"] = "UNCORRECTED_OCR"
     if uri:
         yml["00#VERS#URI######:"] = uri
-    with open(yml_fp, mode="w", encoding="utf-8") as file:
-        file.write(dicToYML(yml))
+    yml_store.write_yml(yml_fp, yml)
   
 
 
@@ -1003,6 +1262,7 @@ def add_OCR_pipeline_files(meta_fp, ocr_folder, dest_folder):
                 copyfile(fp, dest_fp)
                 if fn.endswith(".yml"):
                     add_to_yml(dest_fp, row[1], row[2], row[4], row[5])
+                    yml_store.flush()
                 new_uri = row[6].strip()
                 if new_uri: # replacement URI
                     new_fp = re.sub(book_uri, new_uri, dest_fp)
@@ -1039,7 +1299,8 @@ def add_eScriptorium_files(meta_fp, download_folder, dest_folder,
                            include_image_name=True, reorder_pages=False,
                            skip_orphan_lines=True, reconvert=False, redownload=False,
                            main_text_region="Main",
-                           default_transcription_layer=None, add_languages=["ara"]):
+                           default_transcription_layer=None, add_languages=["ara"],
+                           workers=1):
     """Add files from eScriptorium to barzakh
     
     Args:
@@ -1075,6 +1336,7 @@ def add_eScriptorium_files(meta_fp, download_folder, dest_folder,
             main text of the page; defaults to "Main"
         add_languages (list): if the value in the language code column is
             not in this list, the row will be skipped.
+        workers (int): number of processes used to convert the pages of a text
     """
     print("Connecting to main eScriptorium instance...")
     main_instance = connect_to_escr()
@@ -1189,12 +1451,12 @@ def add_eScriptorium_files(meta_fp, download_folder, dest_folder,
                         skip_orphan_lines=skip_orphan_lines,
                         first_page=first_page,
                         transcription_meta=transcription_meta,
-                        main_text_region=main_text_region)
+                        main_text_region=main_text_region,
+                        workers=workers)
 
             # create a version yml file and store it:
             yml_fp = outfp + ".yml"
-            with open(yml_fp, mode="w", encoding="utf-8") as file:
-                file.write(version_yml_template)
+            yml_store.write_yml(yml_fp, yml_store.parse_yml(version_yml_template, yml_fp))
 
             # fill in relevant YML fields:
             based = row["BASED LINK (WORLDCAT)"]
@@ -1221,27 +1483,24 @@ def add_eScriptorium_files(meta_fp, download_folder, dest_folder,
             book_uri = ".".join(uri.split(".")[:2])
             if relations or title_transcr:
                 yml_fp = os.path.join(dest_folder, book_uri + ".yml")
-                with open(yml_fp, mode="w", encoding="utf-8") as file:
-                    file.write(book_yml_template)
-                yml_d = readYML(yml_fp)
+                yml_d = yml_store.parse_yml(book_yml_template, yml_fp)
                 yml_d["00#BOOK#URI######:"] = book_uri
                 yml_d["40#BOOK#RELATED##:"] = relations
                 yml_d["10#BOOK#TITLEA#AR:"] = title_transcr
-                with open(yml_fp, mode="w", encoding="utf-8") as file:
-                    file.write(dicToYML(yml_d))
+                yml_store.write_yml(yml_fp, yml_d)
 
             # create an author YML file if the metadata author transcription:
             author_transcr = row["AUTHOR_TRANSCRIPTION"]
             author_uri = book_uri.split(".")[0]
             if author_transcr:
                 yml_fp = os.path.join(dest_folder, author_uri + ".yml")
-                with open(yml_fp, mode="w", encoding="utf-8") as file:
-                    file.write(author_yml_template)
-                yml_d = readYML(yml_fp)
+                yml_d = yml_store.parse_yml(author_yml_template, yml_fp)
                 yml_d["00#AUTH#URI######:"] = author_uri
                 yml_d["10#AUTH#SHUHRA#AR:"] = author_transcr
-                with open(yml_fp, mode="w", encoding="utf-8") as file:
-                    file.write(dicToYML(yml_d))
+                yml_store.write_yml(yml_fp, yml_d)
+
+            # write the version, book and author yml files at once:
+            yml_store.flush()
 
         # merge multivolume books:
         if multivol:
@@ -1283,7 +1542,7 @@ def add_alto_files(meta_fp, download_folder, dest_folder, coll_id="AOCP2",
                    include_image_name=True, reorder_pages=False,
                    skip_orphan_lines=True, reconvert=False, 
                    main_text_region="Main", language_code="ara",
-                   default_transcription_layer=None, common_meta={}):
+                   default_transcription_layer=None, common_meta={}, workers=1):
     """Add files exported from Yufei's OCR pipeline to barzakh
     
     Args:
@@ -1311,6 +1570,7 @@ def add_alto_files(meta_fp, download_folder, dest_folder, coll_id="AOCP2",
             convered again.
         main_text_region (str): the name of the region that contains the
             main text of the page; defaults to "Main"
+        workers (int): number of processes used to convert the pages of a text
     """
     # collect the metadata from the OCR spreadsheet:
     meta_d = dict()
@@ -1387,17 +1647,17 @@ def add_alto_files(meta_fp, download_folder, dest_folder, coll_id="AOCP2",
                        extension="xml", line_segment_separator="   ",
                        include_image_name=True, skip_orphan_lines=True,
                        first_page=first_page, transcription_meta=dict(),
-                       main_text_region="main_text_block"
+                       main_text_region="main_text_block", workers=workers
                        )
 
         
         # create a version yml file and store it:
         yml_fp = outfp + ".yml"
-        with open(yml_fp, mode="w", encoding="utf-8") as file:
-            file.write(version_yml_template)
+        yml_store.write_yml(yml_fp, yml_store.parse_yml(version_yml_template, yml_fp))
 
         # create metadata files if there is metadata:
         if not row:
+            yml_store.flush()
             continue
 
         # fill in relevant YML fields:
@@ -1434,14 +1694,11 @@ def add_alto_files(meta_fp, download_folder, dest_folder, coll_id="AOCP2",
         book_uri = ".".join(uri.split(".")[:2])
         if relations or title_transcr:
             yml_fp = os.path.join(dest_folder, book_uri + ".yml")
-            with open(yml_fp, mode="w", encoding="utf-8") as file:
-                file.write(book_yml_template)
-            yml_d = readYML(yml_fp)
+            yml_d = yml_store.parse_yml(book_yml_template, yml_fp)
             yml_d["00#BOOK#URI######:"] = book_uri
             yml_d["40#BOOK#RELATED##:"] = relations
             yml_d["10#BOOK#TITLEA#AR:"] = title_transcr
-            with open(yml_fp, mode="w", encoding="utf-8") as file:
-                file.write(dicToYML(yml_d))
+            yml_store.write_yml(yml_fp, yml_d)
 
         # create an author YML file if the metadata author transcription:
         if "author_transcr" in row:
@@ -1453,13 +1710,13 @@ def add_alto_files(meta_fp, download_folder, dest_folder, coll_id="AOCP2",
         author_uri = book_uri.split(".")[0]
         if author_transcr:
             yml_fp = os.path.join(dest_folder, author_uri + ".yml")
-            with open(yml_fp, mode="w", encoding="utf-8") as file:
-                file.write(author_yml_template)
-            yml_d = readYML(yml_fp)
+            yml_d = yml_store.parse_yml(author_yml_template, yml_fp)
             yml_d["00#AUTH#URI######:"] = author_uri
             yml_d["10#AUTH#SHUHRA#AR:"] = author_transcr
-            with open(yml_fp, mode="w", encoding="utf-8") as file:
-                file.write(dicToYML(yml_d))
+            yml_store.write_yml(yml_fp, yml_d)
+
+        # write the version, book and author yml files at once:
+        yml_store.flush()
 
     # merge multivolume books:
     if multivol:
@@ -13,100 +13,195 @@
 !!!! BEFORE RUNNING THIS SCRIPT!
 
 """
+import contextlib
+import csv
+import hashlib
+import io
+import json
 import math
+import multiprocessing
 import os
-import pandas as pd
 import re
-import textwrap
+import shutil
+import tempfile
+import time
 import unicodedata
 
-from openiti.helper.ara import normalize_composites, denoise, allowed_chars_regex, unwanted_chars_regex, ar_tok_cnt, ar_tok, decode_unicode_name
 from openiti.helper.rgx import auth, book, version
-from openiti.helper.yml import readYML, fix_broken_yml, dicToYML
-from openiti.new_books.add.add_books import initialize_new_text
 
+import char_audit
+import line_wrap
+import substitution_rules
+import text_access
+import yml_store
 
+# NB: to keep importing this module cheap, heavier modules
+# (openiti.helper.ara, openiti.helper.yml, openiti.new_books.add.add_books,
+# urllib.request) are only imported in the functions that need them,
+# and the replacement tuples are decoded and the URI regexes compiled
+# on first use (see get_repl_tup and get_uri_regexes).
 
-author_uri_regex = auth
-book_uri_regex = book
-version_uri_regex = version
+
+
+uri_regexes = None  # compiled on first use by get_uri_regexes
+# problems that can be found in a filename, in the order in which they are checked
+# (see get_uri_problem); these are also the problems recorded in the decision ledger:
+uri_problems = ("author URI", "book URI", "version URI", "unknown collection", "unknown extension")
+known_extensions = ("completed", "mARkdown", "inProgress")
+# regex that splits the path to a text file into the parts
+# needed to build the paths to its yml files (see get_yml_fps):
+yml_fp_regex = re.compile(r"(.+?)(-(?:[a-z]{3}\d+)+)(.*)")
+# results of the yml files that were already checked by check_yml_file
+# (key: (yml_store key, yml type); value: bool):
+checked_yml_files = dict()
 
 # list of collection names in which line endings of texts should be kept as is:
 keep_line_endings_ids = "|".join(["eScr", "EScr", "Kraken", "Tess", "GVDB"])
 
+# increase the pipeline version whenever a change to the pipeline
+# changes its output (this invalidates the pipeline cache):
+PIPELINE_VERSION = 1
+# file in the barzakh folder in which the pipeline stores
+# the hashes of the files it already normalised:
+pipeline_cache_fn = ".pipeline_cache.jsonl"
+
+
+# Snapshot of the known source collections of OpenITI texts,
+# used when the OpenITI metadata cannot be downloaded:
+default_known_collections = (
+    'ALCorpus',
+    'AQ',
+    'ArabCommAph',
+    'BibleCorpus',
+    'DARE',
+    'ER',
+    'EShia',
+    'Filaha',
+    'GRAR',
+    'GVDB',
+    'Hindawi',
+    'JK',
+    'JMIHE',
+    'JT',
+    'Kalema',
+    'KetabOnline',
+    'Khismatulin',
+    'Kraken',
+    'LMN',
+    'MAB',
+    'MMS',
+    'MSG',
+    'Masaha',
+    'Meshkat',
+    'NH',
+    'NLIAG',
+    'Noorlib',
+    'Other',
+    'PAL',
+    'PES',
+    'PV',
+    'Qaemiyeh',
+    'QuranAnalysis',
+    'Rafed',
+    'SAWS',
+    'Sham',
+    'ShamAY',
+    'ShamDhahabiyya',
+    'ShamDhayabiyya',
+    'ShamIbadiyya',
+    'Shamela',
+    'Shia',
+    'SyriacStudies',
+    'Tafsir',
+    'Tanzil',
+    'Tess',
+    'WG',
+    'Wiki',
+    'Zaydiyya',
+    'EScr',
+)
+
+meta_url = "https://github.com/OpenITI/kitab-metadata-automation/raw/master/output/OpenITI_Github_clone_metadata_light.csv"
+# the collections in the OpenITI metadata are cached in this file
+# and downloaded again when the cache is older than known_collections_ttl seconds:
+known_collections_cache_fp = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                          ".known_collections_cache.txt")
+known_collections_ttl = 7 * 24 * 60 * 60
+known_collections = None  # loaded on first use by get_known_collections
+# set of the known collections and their lengths, built on first use by is_known_collection:
+known_collections_lookup = None
+# collections accepted by the user (or the decision ledger) during this run:
+accepted_collections = set()
+
+
+def download_known_collections(url=meta_url, timeout=5):
+    """Download the OpenITI metadata and collect the source collections of all texts
+
+    The metadata file is streamed; only the id column is parsed.
+
+    Args:
+        url (str): url of the OpenITI metadata file (tab-separated)
+        timeout (int): number of seconds to wait for the server
+
+    Returns:
+        tup
+    """
+    import urllib.request
+
+    collections = set()
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        reader = csv.reader(io.TextIOWrapper(response, encoding="utf-8"), delimiter="\t")
+        id_col = next(reader).index("id")
+        for row in reader:
+            coll = re.findall("[a-zA-Z]+", row[id_col])
+            if coll:
+                collections.add(coll[0])
+    if not collections:
+        raise ValueError("no collections found in " + url)
+    return tuple(sorted(collections))
+
 
 def get_known_collections():
     """Get a tuple containg all known source collections of OpenITI texts from OpenITI metadata
-    
+
+    The collections are loaded only once, from the cache file if it is recent enough,
+    otherwise from the OpenITI metadata on GitHub. If the metadata cannot
+    be downloaded, the (outdated) cache is used (and the download is not
+    attempted again until the cache has expired) or, if there is no cache,
+    the default_known_collections (which are not cached: the next run
+    tries to download the collections again).
+
     Returns:
         tup
     """
-    meta_url = "https://github.com/OpenITI/kitab-metadata-automation/raw/master/output/OpenITI_Github_clone_metadata_light.csv"
-    df = pd.read_csv(meta_url, sep="\t")
-    known_collections = tuple()
-    for coll in sorted(list(set([re.findall("[a-zA-Z]+", id_)[0] for id_ in df["id"]]))):
-        known_collections = known_collections + (coll, )
-    return known_collections
+    global known_collections
+    if known_collections is not None:
+        return known_collections
+
+    cache_exists = os.path.exists(known_collections_cache_fp)
+    if cache_exists and time.time() - os.path.getmtime(known_collections_cache_fp) < known_collections_ttl:
+        with open(known_collections_cache_fp, mode="r", encoding="utf-8") as file:
+            known_collections = tuple(file.read().split())
+        return known_collections
 
-try:
-    known_collections = get_known_collections()
-except Exception as e:
-    print("Error getting known collections:", e)
-    print("Falling back to default")
-    known_collections = (
-        'ALCorpus',
-        'AQ',
-        'ArabCommAph',
-        'BibleCorpus',
-        'DARE',
-        'ER',
-        'EShia',
-        'Filaha',
-        'GRAR',
-        'GVDB',
-        'Hindawi',
-        'JK',
-        'JMIHE',
-        'JT',
-        'Kalema',
-        'KetabOnline',
-        'Khismatulin',
-        'Kraken',
-        'LMN',
-        'MAB',
-        'MMS',
-        'MSG',
-        'Masaha',
-        'Meshkat',
-        'NH',
-        'NLIAG',
-        'Noorlib',
-        'Other',
-        'PAL',
-        'PES',
-        'PV',
-        'Qaemiyeh',
-        'QuranAnalysis',
-        'Rafed',
-        'SAWS',
-        'Sham',
-        'ShamAY',
-        'ShamDhahabiyya',
-        'ShamDhayabiyya',
-        'ShamIbadiyya',
-        'Shamela',
-        'Shia',
-        'SyriacStudies',
-        'Tafsir',
-        'Tanzil',
-        'Tess',
-        'WG',
-        'Wiki',
-        'Zaydiyya',
-        'EScr',
-    )
-
-print(known_collections)
+    try:
+        known_collections = download_known_collections()
+    except Exception as e:
+        print("Error getting known collections:", e)
+        if cache_exists:
+            print("Falling back to cached collections")
+            with open(known_collections_cache_fp, mode="r", encoding="utf-8") as file:
+                known_collections = tuple(file.read().split())
+            os.utime(known_collections_cache_fp)
+            return known_collections
+        # (the default is not written to the cache file,
+        # so that the next run tries to download the collections again):
+        print("Falling back to default")
+        known_collections = default_known_collections
+        return known_collections
+    with open(known_collections_cache_fp, mode="w", encoding="utf-8") as file:
+        file.write("\n".join(known_collections))
+    return known_collections
 
 # Create replacement tuples for cleaning text:
 
@@ -122,8 +217,8 @@ SMALL_MADDAH = "ۤ"
 # """
 # ZWNJ = [x.split("\t")[0] for x in zw.splitlines()][0]
 # ZWJ  = [x.split("\t")[0] for x in zw.splitlines()][1]
-ZWNJ = decode_unicode_name("ZERO WIDTH NON-JOINER")
-ZWJ = decode_unicode_name("ZERO WIDTH JOINER")
+ZWNJ = unicodedata.lookup("ZERO WIDTH NON-JOINER")
+ZWJ = unicodedata.lookup("ZERO WIDTH JOINER")
 
 # then, build replacement tuples for (combinations of) characters 
 # that should be replaced in any text:
@@ -189,7 +284,9 @@ ZWJ = decode_unicode_name("ZERO WIDTH JOINER")
 
 #     ]
 
-repl_tup = [
+# (the replacement tuples may contain unicode names;
+# use get_repl_tup to get the decoded replacement tuples)
+repl_tup_names = [
     ("…", "..."), # HORIZONTAL ELLIPSIS
     ("٭", "*"),   # ARABIC FIVE POINTED STAR
     ("∗", "*"),   # ASTERISK OPERATOR
@@ -260,8 +357,34 @@ repl_tup = [
 
     ]
 
-repl_tup = [(decode_unicode_name(k), decode_unicode_name(v)) for k,v in repl_tup]
-repl_dict = {k:v for k,v in repl_tup}
+repl_tup = None   # decoded on first use by get_repl_tup
+repl_dict = None  # built on first use by get_repl_dict
+
+
+def get_repl_tup():
+    """Get the general replacement tuples, with unicode names decoded
+
+    Returns:
+        list (of (pattern, replacement) tuples)
+    """
+    global repl_tup
+    if repl_tup is None:
+        from openiti.helper.ara import decode_unicode_name
+
+        repl_tup = [(decode_unicode_name(k), decode_unicode_name(v)) for k,v in repl_tup_names]
+    return repl_tup
+
+
+def get_repl_dict():
+    """Get a dictionary of the general replacement tuples
+
+    Returns:
+        dict (key: pattern, value: replacement)
+    """
+    global repl_dict
+    if repl_dict is None:
+        repl_dict = {k:v for k,v in get_repl_tup()}
+    return repl_dict
 
 
 # finally, replace some glyphs in a specific language only:
@@ -334,9 +457,336 @@ repl_tup_urd = [
     ]
 
 
-def ask_replace_permission(text, pattern, repl, auto=False):
+# cache for the compiled replacement tables (key: tuple of language codes):
+replacement_tables = dict()
+# maximum number of memoized runs per replacement table
+# (the memo is cleared when it grows larger):
+max_memo_size = 100000
+
+
+def get_lang_repl_tups(fn):
+    """Get the language-specific replacement tuples that apply to a text file
+
+    Args:
+        fn (str): file name of the text file
+
+    Returns:
+        list (of tuples (lang_code, repl_tup))
+    """
+    lang_repl_tups = []
+    if re.findall("-(?:[a-z]{3})*ara", fn):  # Arabic
+        lang_repl_tups.append(("ara", repl_tup_ara))
+    if re.findall("-(?:[a-z]{3})*per", fn):  # Persian
+        lang_repl_tups.append(("per", repl_tup_per))
+    if re.findall("-(?:[a-z]{3})*urd", fn):  # Urdu
+        lang_repl_tups.append(("urd", repl_tup_urd))
+    return lang_repl_tups
+
+
+def get_pattern_chars(pattern):
+    """Get the characters that a replacement pattern can match.
+
+    Only literal patterns and patterns consisting of characters
+    that are optionally followed by a question mark (e.g., "ۂ‌?")
+    are supported.
+
+    Args:
+        pattern (str): regex pattern from a replacement tuple
+
+    Returns:
+        tuple (mandatory_chars:list, all_chars:set),
+        or None if the pattern is not supported
+    """
+    if re.fullmatch(pattern, ""):
+        return None
+    if re.escape(pattern) == pattern:
+        return list(pattern), set(pattern)
+    if re.fullmatch(r"(?:[^\\.^$*+?{}\[\]|()]\??)+", pattern):
+        mandatory_chars = [c for i, c in enumerate(pattern)
+                           if c != "?" and pattern[i+1:i+2] != "?"]
+        return mandatory_chars, set(pattern) - {"?"}
+    return None
+
+
+def compile_replacement_table(repl_tups):
+    """Compile a list of replacement tuples into a table that
+    can be applied to a text in a single pass.
+
+    Every pattern in the table only matches characters from a small
+    alphabet (the characters in all patterns). A character outside
+    this alphabet is never replaced and no match can span it,
+    so applying the replacement tuples one after the other
+    to the whole text gives the same result as applying them
+    to each run of alphabet characters separately.
+
+    The compiled table searches the text once for "anchor" characters
+    (one mandatory character per pattern, preferably a rare one)
+    and applies the replacement tuples in their original order
+    only to the runs of alphabet characters around those anchors.
+    The result for each run is memoized (up to max_memo_size runs).
+
+    Args:
+        repl_tups (list): list of (pattern, replacement) tuples
+
+    Returns:
+        dict (or None if the table contains a pattern that is not supported)
+    """
+    from openiti.helper.ara import allowed_chars_regex
+
+    alphabet = set()
+    anchors = set()
+    for pattern, repl in repl_tups:
+        pattern_chars = get_pattern_chars(pattern)
+        if not pattern_chars:
+            print("Pattern cannot be compiled into a replacement table:", [pattern])
+            return None
+        mandatory_chars, all_chars = pattern_chars
+        alphabet = alphabet.union(all_chars)
+        # prefer unallowed characters and diacritics over letters as anchor:
+        mandatory_chars.sort(key=lambda c: (bool(re.match(allowed_chars_regex, c)),
+                                            unicodedata.category(c).startswith("L")))
+        anchors.add(mandatory_chars[0])
+
+    def char_class(chars):
+        return "[{}]".format("".join(re.escape(c) for c in sorted(chars)))
+
+    table = dict()
+    table["anchor_regex"] = re.compile(char_class(anchors))
+    table["run_regex"] = re.compile(char_class(alphabet) + "*")
+    table["alphabet"] = alphabet
+    table["repl_tups"] = [(re.compile(pattern), repl) for pattern, repl in repl_tups]
+    table["memo"] = dict()
+    return table
+
+
+def apply_replacement_table(text, table):
+    """Apply all replacement tuples in a compiled replacement table
+    to a text in a single pass.
+
+    The result is identical to applying the replacement tuples
+    one after the other using re.sub.
+
+    Args:
+        text (str): the text to be cleaned
+        table (dict): replacement table compiled by compile_replacement_table
+
+    Returns:
+        str
+    """
+    alphabet = table["alphabet"]
+    memo = table["memo"]
+    new_text = []
+    last = 0
+    for m in table["anchor_regex"].finditer(text):
+        start = m.start()
+        if start < last:  # anchor is part of a run that was already replaced
+            continue
+        # extend the match to the full run of alphabet characters:
+        while start > last and text[start-1] in alphabet:
+            start -= 1
+        end = table["run_regex"].match(text, m.end()).end()
+        run = text[start:end]
+        try:
+            repl = memo[run]
+        except KeyError:
+            repl = run
+            for pattern, r in table["repl_tups"]:
+                repl = pattern.sub(r, repl)
+            if len(memo) >= max_memo_size:
+                memo.clear()
+            memo[run] = repl
+        new_text.append(text[last:start])
+        new_text.append(repl)
+        last = end
+    new_text.append(text[last:])
+    return "".join(new_text)
+
+
+def get_replacement_table(fn):
+    """Get the compiled replacement table (general + language-specific
+    replacement tuples) for a text file.
+
+    Args:
+        fn (str): file name of the text file
+
+    Returns:
+        dict (or None if the replacement tuples could not be compiled)
+    """
+    lang_repl_tups = get_lang_repl_tups(fn)
+    key = tuple([lang for lang, tups in lang_repl_tups])
+    if key not in replacement_tables:
+        all_repl_tups = list(get_repl_tup())
+        for lang, tups in lang_repl_tups:
+            all_repl_tups += tups
+        replacement_tables[key] = compile_replacement_table(all_repl_tups)
+    return replacement_tables[key]
+
+
+# kinds of decisions in a decision ledger:
+decision_kinds = ("uris", "extensions", "collections", "replacements", "chars")
+
+
+def load_decisions(decisions_fp):
+    """Load a decision ledger from a json file
+
+    A decision ledger collects all questions the pipeline would ask the user
+    (see get_decision), so that they can be answered at once,
+    in the json file, instead of one by one while the pipeline runs.
+    For every kind of decision (see decision_kinds), the ledger contains
+    a dictionary of questions (key: the file name, collection, pattern
+    or character the question is about; value: dictionary containing
+    the decision and context information).
+
+    Decisions (null means: not decided yet):
+
+    * uris: the corrected filename (an empty string skips the file)
+    * extensions: the corrected extension (an empty string removes the extension)
+    * collections: true (add the collection to the known collections) or false
+    * replacements: true (replace the pattern) or false
+    * chars: the replacement string (an empty string removes the character),
+      or false (keep the character)
+
+    Args:
+        decisions_fp (str): path to the json file
+
+    Returns:
+        dict
+    """
+    decisions = dict()
+    if os.path.exists(decisions_fp):
+        with open(decisions_fp, mode="r", encoding="utf-8") as file:
+            decisions = json.load(file)
+    for kind in decision_kinds:
+        decisions.setdefault(kind, dict())
+    return decisions
+
+
+def save_decisions(decisions_fp, decisions):
+    """Save a decision ledger to a json file
+
+    Args:
+        decisions_fp (str): path to the json file
+        decisions (dict): decision ledger (see load_decisions)
+    """
+    with open(decisions_fp, mode="w", encoding="utf-8") as file:
+        json.dump(decisions, file, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def get_decision(decisions, kind, key, fn, **context):
+    """Look up a decision in a decision ledger
+
+    If the decision has not been taken yet, the question is added
+    to the ledger, together with the file it concerns
+    and context information to help the user decide.
+
+    Args:
+        decisions (dict): decision ledger (see load_decisions)
+        kind (str): kind of decision (see decision_kinds)
+        key (str): the file name, collection, pattern or character
+            the decision is about
+        fn (str): filename of the text file that raised the question
+        **context: context information; counts are added up,
+            examples are collected (max. 10)
+
+    Returns:
+        the decision (None if the decision has not been taken yet)
+    """
+    entry = decisions.setdefault(kind, dict()).setdefault(key, dict(decision=None, files=[]))
+    if entry["decision"] is None and fn not in entry["files"]:
+        entry["files"].append(fn)
+        for k, v in context.items():
+            if k == "count":
+                entry[k] = entry.get(k, 0) + v
+            elif k == "examples":
+                entry[k] = (entry.get(k, []) + v)[:10]
+            else:
+                entry.setdefault(k, v)
+    return entry["decision"]
+
+
+def get_pending_decisions(decisions, fn):
+    """Get all questions about a text file that have not been decided yet
+
+    Args:
+        decisions (dict): decision ledger (see load_decisions)
+        fn (str): filename of the text file
+
+    Returns:
+        dict (a decision ledger that contains only the pending questions)
+    """
+    pending = {kind: dict() for kind in decision_kinds}
+    for kind, entries in decisions.items():
+        for key, entry in entries.items():
+            if entry["decision"] is None and fn in entry["files"]:
+                pending.setdefault(kind, dict())[key] = entry
+    return pending
+
+
+def merge_decisions(decisions, new_decisions):
+    """Add the questions of one decision ledger to another ledger
+
+    Args:
+        decisions (dict): decision ledger (see load_decisions)
+        new_decisions (dict): decision ledger with new questions
+    """
+    for kind, entries in new_decisions.items():
+        for key, new_entry in entries.items():
+            entry = decisions.setdefault(kind, dict()).get(key)
+            if entry is None:
+                decisions[kind][key] = json.loads(json.dumps(new_entry))
+            elif entry["decision"] is None:
+                new_files = [fn for fn in new_entry["files"] if fn not in entry["files"]]
+                if not new_files:
+                    continue
+                entry["files"] += new_files
+                for k, v in new_entry.items():
+                    if k == "count":
+                        entry[k] = entry.get(k, 0) + v
+                    elif k == "examples":
+                        entry[k] = (entry.get(k, []) + v)[:10]
+                    elif k not in ("decision", "files"):
+                        entry.setdefault(k, v)
+
+
+def count_pending_decisions(decisions):
+    """Count the questions in a decision ledger that have not been decided yet
+
+    Args:
+        decisions (dict): decision ledger (see load_decisions)
+
+    Returns:
+        int
+    """
+    return sum(1 for entries in decisions.values()
+               for entry in entries.values() if entry["decision"] is None)
+
+
+def ask_replace_permission(text, pattern, repl, auto=False, decisions=None, fn=None):
+    """Replace a pattern in the text, after asking the user's permission
+
+    Args:
+        text (str): the text
+        pattern (str): regex pattern
+        repl (str): replacement string
+        auto (bool): if True, replace without asking
+        decisions (dict): decision ledger (see load_decisions). If provided,
+            the user is not asked for permission: the decision is looked up
+            in the ledger (and the text is not changed if it has not been decided yet)
+        fn (str): filename of the text file (used in the decision ledger)
+
+    Returns:
+        str
+    """
     if auto:
         return re.sub(pattern, repl, text)
+    if decisions is not None:
+        matches = re.findall(".*"+pattern+".*", text)
+        if matches:
+            decision = get_decision(decisions, "replacements", pattern, fn, replacement=repl,
+                                    count=len(matches), examples=matches[:3])
+            if decision:
+                text = re.sub(pattern, repl, text)
+        return text
     matches = re.findall(".*"+pattern+".*", text)
     if matches:
         for m in matches[:10]:
@@ -354,19 +804,24 @@ def ask_replace_permission(text, pattern, repl, auto=False):
     return text
 
 
-def milestone(text, fn, prev_ms=0, ms_length=300):
-    """Add milestones to the text
-    
+# milestone tags (as inserted by the milestone function) and tokens:
+ms_tag_regex = re.compile(r" ms[A-Z]?\d+")
+tok_regex = re.compile(r"\w+|\W+")
+
+
+def get_ms_tag_format(fn, text, ms_length=300):
+    """Get the prefix and the number of digits of the milestone tags of a text
+
     Args:
-        text (str): the content of the text files, with old milestone tags removed
         fn (str): filename of the text file
-        prev_ms (int): number of the last milestone in the previous text. Default: 0.
+        text (str): the content of the text file, without milestone tags
         ms_length (int): number of tokens in a milestone
-    
-    Returns: 
-        tup (str, int)
+
+    Returns:
+        tup (tag prefix (" ms", or e.g. " msB" for continuous texts),
+             number of digits, continuous version letter or False)
     """
-    #ara_tok = re.compile("^[ذ١٢٣٤٥٦٧٨٩٠ّـضصثقفغعهخحجدًٌَُلإإشسيبلاتنمكطٍِلأأـئءؤرلاىةوزظْلآآ]+$")
+    from openiti.helper.ara import ar_tok
 
     # Check whether the milestone numbering should continue from another text file
     # (that is, the filename ends with)
@@ -376,80 +831,464 @@ def milestone(text, fn, prev_ms=0, ms_length=300):
     else:
         continuous = False
 
-    # make sure the last milestone will not be added on a new line: 
-    text = text.rstrip()
-
     # find the number of digits in the milestone IDs based on the last milestone number:
-    ara_toks_count = ar_tok_cnt(text)
+    ara_toks_count = sum(1 for m in ar_tok.finditer(text))
     ms_tag_str_len = len(str(math.floor(ara_toks_count / ms_length)))
 
-    # Insert the milestones:
-    all_toks = re.findall(r"\w+|\W+", text)
+    if continuous:  # use the pattern msA001
+        return " ms" + continuous, ms_tag_str_len, continuous
+    else:           # use the pattern ms001
+        return " ms", ms_tag_str_len, continuous
 
-    token_count = 0
-    if continuous and version_id[-1] != "A":
-        ms_count = prev_ms
-    else:
-        ms_count = 0
 
-    new_data = []
+def write_milestone_tags(text, outfile, checksum, ms_count, ms_length, tag_prefix, ms_tag_str_len):
+    """Write a text to an output stream, with a milestone tag after every
+    ms_length Arabic tokens and at the end of the text
+
+    Args:
+        text (str): the text, without milestone tags
+        outfile (file): output stream
+        checksum (hashlib hash object): hash that is updated
+            with the text (without the milestone tags)
+        ms_count (int): number of the milestone before the text
+        ms_length (int): number of tokens in a milestone
+        tag_prefix (str): prefix of the milestone tags (see get_ms_tag_format)
+        ms_tag_str_len (int): number of digits in the milestone tags
+
+    Returns:
+        tup (number of the last milestone, bool: True if a milestone tag
+        absorbed a digit of the text)
+    """
+    from openiti.helper.ara import ar_tok
 
-    for i in range(0, len(all_toks)):
-        #if ara_tok.search(all_toks[i]):  
-        if re.fullmatch(ar_tok, all_toks[i]):  # only Arabic tokens count for milestoning!
-                                               # an Arabic token is every token that consists
-                                               # entirely of Arabic letters or numbers
+    damaged = False
+    token_count = 0
+    toks = tok_regex.finditer(text)
+    tok = next(toks, None)
+    while tok is not None:
+        next_tok = next(toks, None)
+        tok = tok.group()
+        if ar_tok.fullmatch(tok):  # only Arabic tokens count for milestoning!
+                                   # an Arabic token is every token that consists
+                                   # entirely of Arabic letters or numbers
             token_count += 1
-        new_data.append(all_toks[i])
-        
+        outfile.write(tok)
+        checksum.update(tok.encode("utf-8"))
+
         # Insert milestone tag after ms_length Arabic tokens (and at the end of the text):
-        if token_count == ms_length or i == len(all_toks) - 1:
+        if token_count == ms_length or next_tok is None:
             ms_count += 1
-            if continuous:  # use the pattern msA001
-                milestone = " ms" + version_id[-1] + str(ms_count).zfill(ms_tag_str_len)
-            else:           # use the pattern ms001
-                milestone = " ms" + str(ms_count).zfill(ms_tag_str_len)
-            new_data.append(milestone)
+            milestone = tag_prefix + str(ms_count).zfill(ms_tag_str_len)
+            # a milestone tag followed by a digit would absorb it:
+            if next_tok is not None and re.match(r"\d", next_tok.group()):
+                damaged = True
+            outfile.write(milestone)
             token_count = 0
+        tok = next_tok
+    return ms_count, damaged
 
-    ms_text = "".join(new_data)
 
-    # check whether the text has been damaged by adding the milestones:
-    test = re.sub(" ms([A-Z])?\d+", "", ms_text)
-    # test = re.sub(" +", " ", test)
-    if test == text:
-        #print("\t\tThe file has not been damaged!")
-        ms = re.findall("ms[A-Z]?\d+", ms_text)
-        #print("\t\t%d milestones (%d words)" % (len(ms), ms_length))
-        return ms_text, ms_count
+def write_milestones(text, fn, outfile, prev_ms=0, ms_length=300):
+    """Write the text to an output stream, adding milestones on the fly
+
+    The text is tokenized lazily (no list of tokens is built),
+    and the integrity of the output is checked incrementally
+    by comparing a running hash of everything that was written
+    (minus the milestone tags) with the hash of the input text.
+
+    Args:
+        text (str): the content of the text files, with old milestone tags removed
+        fn (str): filename of the text file
+        outfile (file): stream to which the milestoned text will be written
+        prev_ms (int): number of the last milestone in the previous text. Default: 0.
+        ms_length (int): number of tokens in a milestone
+
+    Returns:
+        int (number of the last milestone; None if milestoning damaged the text)
+    """
+    # make sure the last milestone will not be added on a new line: 
+    text = text.rstrip()
+
+    tag_prefix, ms_tag_str_len, continuous = get_ms_tag_format(fn, text, ms_length)
+
+    # milestone tags that are already in the text could not be told apart
+    # from the new milestone tags:
+    damaged = bool(ms_tag_regex.search(text))
+    checksum = hashlib.sha1()
+
+    # Insert the milestones:
+    if continuous and continuous != "A":
+        ms_count = prev_ms
     else:
+        ms_count = 0
+    ms_count, absorbed = write_milestone_tags(text, outfile, checksum, ms_count, ms_length,
+                                              tag_prefix, ms_tag_str_len)
+
+    # check whether the text has been damaged by adding the milestones:
+    if damaged or absorbed or checksum.digest() != hashlib.sha1(text.encode("utf-8")).digest():
         print("\t\tMilestoning damaged the text. Rolling back...")
-        return text, None
+        return None
+    return ms_count
+
+
+def milestone(text, fn, prev_ms=0, ms_length=300):
+    """Add milestones to the text
+    
+    Args:
+        text (str): the content of the text files, with old milestone tags removed
+        fn (str): filename of the text file
+        prev_ms (int): number of the last milestone in the previous text. Default: 0.
+        ms_length (int): number of tokens in a milestone
+    
+    Returns: 
+        tup (str, int)
+    """
+    outfile = io.StringIO()
+    ms_count = write_milestones(text, fn, outfile, prev_ms=prev_ms, ms_length=ms_length)
+    if ms_count is None:
+        return text.rstrip(), None
+    return outfile.getvalue(), ms_count
+
+
+def is_ms_position(text, i):
+    """Check whether a milestone tag can be inserted at a position in a text
+    (that is, at the end of a token, see tok_regex)"""
+    is_word_char = lambda c: c.isalnum() or c == "_"  # cf. \w
+    return i > 0 and (i == len(text) or is_word_char(text[i-1]) != is_word_char(text[i]))
+
+
+def incremental_milestone(old_text, text, fn, prev_ms=0, ms_length=300):
+    """Add milestones to a new version of a text,
+    keeping the milestones of the previous version where possible
+
+    The milestones of the previous version are kept in the parts
+    at the start and end of the text that did not change;
+    only the changed part in between is milestoned again.
+    The changed part is divided into as many milestones of about
+    ms_length tokens as fit in it, so that the milestones after it
+    only need to be renumbered if the number of tokens changed considerably.
+    This keeps the diff between the versions small.
+
+    If the milestone tags of the previous version do not have the
+    expected format (prefix, number of digits, first number),
+    if the new milestones would need more digits,
+    or if the integrity check fails, the whole text is milestoned again
+    (see milestone).
 
+    Args:
+        old_text (str): the previous version of the text, with milestones
+        text (str): the new version of the text, with old milestone tags removed
+        fn (str): filename of the text file
+        prev_ms (int): number of the last milestone in the previous text. Default: 0.
+        ms_length (int): number of tokens in a milestone
+
+    Returns:
+        tup (str, int)
+    """
+    from openiti.helper.ara import ar_tok
 
-def post_process(text):
+    text = text.rstrip()
+    tag_prefix, ms_tag_str_len, continuous = get_ms_tag_format(fn, text, ms_length)
+    first_ms = prev_ms + 1 if continuous and continuous != "A" else 1
+
+    # split the previous version into milestone segments:
+    old_text = old_text.rstrip()
+    old_segments = []
+    tag_regex = re.compile(re.escape(tag_prefix) + r"(\d+)")
+    start = 0
+    for m in tag_regex.finditer(old_text):
+        if len(m.group(1)) != ms_tag_str_len or int(m.group(1)) != first_ms + len(old_segments):
+            return milestone(text, fn, prev_ms, ms_length)
+        old_segments.append(old_text[start:m.start()])
+        start = m.end()
+    if not old_segments or start != len(old_text) or ms_tag_regex.search(text):
+        return milestone(text, fn, prev_ms, ms_length)
+
+    # keep the unchanged segments at the start and end of the text:
+    prefix_end = 0
+    n_prefix = 0
+    for seg in old_segments:
+        end = prefix_end + len(seg)
+        if not text.startswith(seg, prefix_end) or not is_ms_position(text, end):
+            break
+        prefix_end = end
+        n_prefix += 1
+    suffix_start = len(text)
+    n_suffix = 0
+    for seg in reversed(old_segments[n_prefix:]):
+        start = suffix_start - len(seg)
+        if start < prefix_end or not text.endswith(seg, 0, suffix_start) \
+           or not is_ms_position(text, start):
+            break
+        suffix_start = start
+        n_suffix += 1
+    # make sure the changed part contains tokens to be milestoned:
+    while prefix_end < suffix_start and not ar_tok.search(text, prefix_end, suffix_start):
+        if n_prefix:
+            n_prefix -= 1
+            prefix_end -= len(old_segments[n_prefix])
+        elif n_suffix:
+            suffix_start += len(old_segments[len(old_segments) - n_suffix])
+            n_suffix -= 1
+        else:
+            break
+    if not n_prefix and not n_suffix:
+        return milestone(text, fn, prev_ms, ms_length)
+
+    # re-assemble the text:
+    checksum = hashlib.sha1()
+    outfile = io.StringIO()
+    ms_count = first_ms - 1
+    for seg in old_segments[:n_prefix]:
+        ms_count += 1
+        outfile.write(seg + tag_prefix + str(ms_count).zfill(ms_tag_str_len))
+        checksum.update(seg.encode("utf-8"))
+    absorbed = False
+    if prefix_end < suffix_start:
+        changed = text[prefix_end:suffix_start]
+        n_toks = sum(1 for m in ar_tok.finditer(changed))
+        n_ms = max(1, round(n_toks / ms_length))
+        ms_count, absorbed = write_milestone_tags(changed, outfile, checksum, ms_count,
+                                                  math.ceil(n_toks / n_ms), tag_prefix, ms_tag_str_len)
+    for seg in old_segments[len(old_segments)-n_suffix:]:
+        ms_count += 1
+        outfile.write(seg + tag_prefix + str(ms_count).zfill(ms_tag_str_len))
+        checksum.update(seg.encode("utf-8"))
+    ms_text = outfile.getvalue()
+
+    # check the number of digits of the last milestone and the integrity of the text:
+    if len(str(ms_count)) > ms_tag_str_len or absorbed or checksum.digest() != hashlib.sha1(text.encode("utf-8")).digest() \
+       or ms_tag_regex.sub("", ms_text) != text:
+        return milestone(text, fn, prev_ms, ms_length)
+    return ms_text, ms_count
+
+
+# final cleaning of replacement artifacts (see post_process and substitution_rules):
+post_process_rules = [
+    [("title on new line", " ###", "\n\n###", " ###")],
+    #[("header end tildas", r"(#META#Header#End#)~~[ \r\n]+~~", r"\1\n\n# ", "~~")],
+    #[("header end tilda", "(#META#Header#End#)~~[ \r\n]+", r"\1\n\n", "~~")],
+    [("leading tildas", r"\A~~[ \r\n]+~~", r"\n\n# ", "~~"),
+     ("leading tilda", r"\A~~[ \r\n]+", r"\n\n", "~~")],
+    [("empty lines", r"[\r\n]+~~ *(?:[\r\n]+|\Z)", "\n", "~~")],
+    # fix leading and trailing alif issue (OCR):
+    [("isolated alif", "(?<=# |~~) *ا\s+| +ا *(?=[\r\n])", "", "ا")],
+    [("space after tildas", "~~ ", "~~", "~~ ")],
+    # (the lookahead lets the regex engine skip positions that cannot start a match):
+    [("al-shay'", r"(?=[وفبلكاش])\b([وفبلك]*(?:ا?ل)?)شئ\b", r"\1شيء", "شئ")],
+]
+compiled_post_process_rules = None
+
+def post_process(text, profile=None):
     """Final cleaning of replacement artifacts in the text file
     
     Args:
         text (str): content of the text file
+        profile (dict): if provided, the time and number of substitutions
+            of every rule are added to this dictionary
+            (see substitution_rules.apply_rules)
     
     Returns:
         str
     """
-    text = re.sub(" ###", "\n\n###", text)
-    #text = re.sub(r"(#META#Header#End#)~~[ \r\n]+~~", r"\1\n\n# ", text)
-    #text = re.sub("(#META#Header#End#)~~[ \r\n]+", r"\1\n\n", text)
-    text = re.sub(r"\A~~[ \r\n]+~~", r"\n\n# ", text)
-    text = re.sub(r"\A~~[ \r\n]+", r"\n\n", text)
-    text = re.sub(r"[\r\n]+~~ *(?:[\r\n]+|\Z)", "\n", text)
-    text = re.sub("(?<=# |~~) *ا\s+| +ا *(?=[\r\n])", "", text) # fix leading and trailing alif issue (OCR)
-    text = re.sub("~~ ", "~~", text)
-    text = re.sub(r"\b([وفبلك]*(?:ا?ل)?)شئ\b", r"\1شيء", text)  # al-shay'
-    return text
+    global compiled_post_process_rules
+    if compiled_post_process_rules is None:
+        compiled_post_process_rules = substitution_rules.compile_rules(post_process_rules)
+    return substitution_rules.apply_rules(text, compiled_post_process_rules, profile)
+
+# paragraph marks (see add_paragraph_marks):
+page_or_ms_tok = r"(?:PageV\w{2}P\d+[abAB]?|ms\d+)"
+page_or_ms_line_regex = re.compile(r"(?:"+page_or_ms_tok+r" *)+")
+sentence_end_regex = re.compile(r"[.؟!] *(?:"+page_or_ms_tok+r" *)*\Z")
+title_regex = re.compile("### .")
+line_regex = re.compile(r"([^\r\n]*)([\r\n]*)")
+poetry_regex = re.compile(r"~~(.+?%~%)")
+
+def split_lines(chunks):
+    """Split a stream of text into lines
+
+    Args:
+        chunks (iterable): strings that together form the text
+
+    Yields:
+        tup (line, separator): the separator contains the line break
+            characters after the line ("" after the last line;
+            like re.split, a text that ends with a line break
+            ends with an empty line)
+    """
+    rest = ""
+    for chunk in chunks:
+        rest += chunk
+        end = 0
+        for m in line_regex.finditer(rest):
+            if m.end() == len(rest):  # the line or separator may continue in the next chunk
+                break
+            yield m.groups()
+            end = m.end()
+        rest = rest[end:]
+    line, sep = line_regex.match(rest).groups()
+    yield line, sep
+    if sep:
+        yield "", ""
+
+def ends_sentence(line, sep, start=0):
+    """Check whether a line ends with a full stop, question or exclamation mark
+    (optionally followed by page numbers and milestones)"""
+    return sentence_end_regex.search(line, start)
+
+def contains_title(line, sep, start=0):
+    """Check whether a line contains a section title"""
+    if title_regex.search(line, start):
+        return True
+    # a carriage return can complete the title tag:
+    return line.endswith("### ") and len(line) - 4 >= start and sep[:1] == "\r" and len(sep) > 1
+
+def mark_paragraphs_after(lines, ends_paragraph):
+    """Add a paragraph mark to the first line after every line that ends a paragraph
+
+    Lines that contain only page numbers and milestones are skipped;
+    if the next line starts with a hashtag or a P, the mark is added
+    to the last milestone line in between (if any).
+
+    Args:
+        lines (iterable): (line, separator) tuples (see split_lines)
+        ends_paragraph (func): function that takes a line, its separator
+            and the position from which to search, and returns True
+            if the line ends a paragraph
+
+    Yields:
+        tup (line, separator)
+    """
+    run = None  # page number and milestone lines after the end of a paragraph
+    for line, sep in lines:
+        start = 0
+        if run is not None:
+            if page_or_ms_line_regex.fullmatch(line):
+                run.append([line, sep])
+                continue
+            if line and line[0] not in "#P":
+                line = "# " + line
+                start = 3  # the first character of the line was part of the match
+            else:
+                for page_line in reversed(run):
+                    if page_line[0].startswith("m"):
+                        page_line[0] = "# " + page_line[0]
+                        break
+            for page_line in run:
+                yield tuple(page_line)
+            run = None
+        if sep and ends_paragraph(line, sep, start):
+            run = []
+        yield line, sep
+    if run:
+        for page_line in reversed(run):
+            if page_line[0].startswith("m"):
+                page_line[0] = "# " + page_line[0]
+                break
+        for page_line in run:
+            yield tuple(page_line)
+
+def mark_continued_lines(lines):
+    """Add tildas to all lines that do not start a paragraph,
+    a page number or a section title
+
+    Args:
+        lines (iterable): (line, separator) tuples (see split_lines)
+
+    Yields:
+        str
+    """
+    for line, sep in lines:
+        if not line.startswith(("P", "#", "~~")):
+            line = "~~"+line
+        if "~~" in line:
+            # Fix cases where tildes were introduced before hashtags:
+            line = line.replace("~~#", "#")
+            # Fix cases where tildes were introduced before a line of poetry:
+            if "%~%" in line:
+                line = poetry_regex.sub(r"# \1", line)
+            # disregard "parent folder" pattern:
+            line = line.replace("~~../", "../")
+        yield line + sep
+
+def stream_paragraph_marks(chunks):
+    """Add paragraph marks to a stream of text, keeping the line endings
+
+    All lines are processed in a single pass: the first line after
+    a sentence or a section title gets a hashtag (`# `),
+    other lines get tildas (`~~`), except page numbers and titles.
+
+    Args:
+        chunks (iterable): strings that together form the text
+            (without bare carriage returns, see add_paragraph_marks)
+
+    Yields:
+        str
+    """
+    lines = split_lines(chunks)
+    lines = mark_paragraphs_after(lines, ends_sentence)
+    lines = mark_paragraphs_after(lines, contains_title)
+    return mark_continued_lines(lines)
 
 def add_paragraph_marks(text, keep_line_endings=True, maxlength=72):
     """Add paragraph marks (hashtags and tildas) to one file.
 
+    Args:
+        text (str): text as string
+        keep_line_endings (bool): if True, line endings in the original file
+            will be kept; if False, long lines will be broken into
+            shorter lines.
+        maxlength (int): maximum number of characters per line
+    
+    Returns:
+        str
+    """
+    if re.search(r"\r[^\r\n]", text):
+        # regexes can match across bare carriage returns:
+        return add_paragraph_marks_with_regexes(text, keep_line_endings, maxlength)
+
+    if keep_line_endings:
+        return "".join(stream_paragraph_marks([text]))
+
+    lines = split_lines([text])
+    lines = mark_paragraphs_after(lines, ends_sentence)
+    lines = mark_paragraphs_after(lines, contains_title)
+    text = "".join(line + sep for line, sep in lines)
+    # move page number to the previous line:
+    ptrn = r"([^ \r\n.؟!]) *[\r\n]+(PageV[^P]+P[\w]+) *[\r\n]+"
+    text = re.sub(ptrn, r"\1 \2\n", text)
+    # Add paragraph signs before every new line:
+    ptrn = r"(\A|[\r\n]+)([^\r\n#~P\s])"
+    text = re.sub(ptrn, r"\1# \2", text)
+    # break long lines into shorter lines:
+    new_text = wrap(text, maxlength)
+
+    # Fix cases where tildes were introduced before hashtags:
+    new_text = re.sub("~~#", "#", new_text)
+    # Fix cases where tildes were introduced before a line of poetry:
+    new_text = re.sub(r"~~(.+?%~%)", r"# \1", new_text)
+    # disregard "parent folder" pattern:
+    new_text = re.sub(r"~~\.\./", "../", new_text)
+
+    return new_text
+
+def add_paragraph_marks_to_file(fp, out_fp, chunk_size=1000000):
+    """Add paragraph marks to a text file, keeping the line endings,
+    without reading the whole file into memory
+
+    Args:
+        fp (str): path to the text file
+        out_fp (str): path to the output file (must be different from fp)
+        chunk_size (int): number of bytes decoded at a time
+    """
+    chunks = text_access.iter_chunks(fp, encoding="utf-8", size=chunk_size)
+    with open(out_fp, mode="w", encoding="utf-8") as outfile:
+        outfile.writelines(stream_paragraph_marks(chunks))
+
+def add_paragraph_marks_with_regexes(text, keep_line_endings=True, maxlength=72):
+    """Add paragraph marks (hashtags and tildas) to one file, using regexes
+    over the whole text (used for texts with bare carriage returns).
+
     Args:
         text (str): text as string
         keep_line_endings (bool): if True, line endings in the original file
@@ -508,15 +1347,8 @@ def wrap(text, max_length=72, wrapped_line_marker="\n~~"):
     Returns:
         str
     """
-    wrapped = []
-    for line in re.split("([\r\n]+)", text):
-        if line.startswith(("###", "\r", "\n")):
-            wrapped.append(line)
-        else:
-            lines = textwrap.wrap(line, max_length, break_long_words=False)
-            wrapped.append(wrapped_line_marker.join(lines))
-
-    return "".join(wrapped)
+    lines = split_lines([text])
+    return "".join(line_wrap.wrap_lines(lines, max_length, wrapped_line_marker))
 
 def check_paragraph_marks(text, fn):
     """Check whether paragraphs are marked using OpenITI mARkdown `# ` and `~~` tags
@@ -564,7 +1396,7 @@ def check_meta_header(text):
         print("END OF HEADER NOT FOUND!")
         return None, text
 
-def clean(text, fn, auto=False):
+def clean(text, fn, auto=False, denoised=False, decisions=None):
     """Clean the text of a new OpenITI text
     
     Args:
@@ -572,44 +1404,68 @@ def clean(text, fn, auto=False):
         fn (str): file name of the text file
         auto (bool): if True, all unallowed files will automatically be replaced;
             if False, user input will be asked for each file
+        denoised (bool): if True, the text has already been denoised
+            and its composites normalized (see scan_folder)
+        decisions (dict): decision ledger (see load_decisions). If provided,
+            the user is not asked for input; the decisions are looked up
+            in the ledger instead.
             
     Returns:
-        str
+        str (None if the ledger does not contain all decisions
+        needed to clean the text)
     """
+    from openiti.helper.ara import normalize_composites, denoise, allowed_chars_regex, unwanted_chars_regex
 
     # remove unwanted characters from text:
-    text = denoise(text)
-    text = normalize_composites(text)
+    if not denoised:
+        text = denoise(text)
+        text = normalize_composites(text)
 
     # replace all patterns for which an auto replacement has been defined:
-
-    # first, general replacement patterns
-    for pattern, repl in repl_tup:
-        text = ask_replace_permission(text, pattern, repl, auto)
-    
-    # second, replacement patterns for specific languages:
-    if re.findall("-(?:[a-z]{3})*ara", fn):  # Arabic
-        for pattern, repl in repl_tup_ara:
-            print([pattern])
-            text = ask_replace_permission(text, pattern, repl, auto)
-    if re.findall("-(?:[a-z]{3})*per", fn):  # Persian
-        print("Going through replacement patterns for Persian text...")
-        for pattern, repl in repl_tup_per:
-            text = ask_replace_permission(text, pattern, repl, auto)
-    if re.findall("-(?:[a-z]{3})*urd", fn):  # Urdu
-        print("Going through replacement patterns for Urdu text...")
-        for pattern, repl in repl_tup_urd:
-            text = ask_replace_permission(text, pattern, repl, auto)
+    table = None
+    if auto:
+        # apply the general and language-specific patterns in a single pass:
+        table = get_replacement_table(fn)
+        if table:
+            text = apply_replacement_table(text, table)
+
+    if not table:
+        # first, general replacement patterns
+        for pattern, repl in get_repl_tup():
+            text = ask_replace_permission(text, pattern, repl, auto, decisions, fn)
+
+        # second, replacement patterns for specific languages:
+        for lang, lang_repl_tup in get_lang_repl_tups(fn):
+            if lang == "per":
+                print("Going through replacement patterns for Persian text...")
+            elif lang == "urd":
+                print("Going through replacement patterns for Urdu text...")
+            for pattern, repl in lang_repl_tup:
+                if lang == "ara":
+                    print([pattern])
+                text = ask_replace_permission(text, pattern, repl, auto, decisions, fn)
 
     # replace all remaining unwanted characters:
     if auto:
         text = re.sub(unwanted_chars_regex, "", text)
     else:
-        all_chars = "".join(set(text))
-        filtered_chars = re.sub(allowed_chars_regex, "", all_chars)
+        # count the unallowed characters in the text and find their first occurrences:
+        inventory = char_audit.get_unallowed_char_inventory(text, allowed_chars_regex)
+        filtered_chars = "".join(inventory)
         print("REMAINING SUSPICIOUS CHARACTERS AFTER FIRST CLEANING:", len(filtered_chars))
         not_found = []
         for c in sorted(filtered_chars):
+            count, offsets = inventory[c]
+            if decisions is not None:
+                decision = get_decision(decisions, "chars", c, fn,
+                                        name=unicodedata.name(c, ""),
+                                        suggestion=get_repl_dict().get(c),
+                                        count=count,
+                                        examples=char_audit.get_examples(text, offsets[:3]))
+                if decision or decision == "":
+                    text = text.replace(c, decision)
+                    inventory = char_audit.get_unallowed_char_inventory(text, allowed_chars_regex)
+                continue
             # print the character and its unicode name (if found)
             try:
                 print(c, "\t", unicodedata.name(c))
@@ -617,20 +1473,27 @@ def clean(text, fn, auto=False):
                 print(c, "\t(unicode name for this character not found)")
             # print the first 10 examples of the use of the character in the text:
             print("Examples of the character's use in the text (character highlighted with kashidas):")
-            for x in re.findall("[^%s]{,20}ـــ%sـــ+[^%s]{,20}"%(c,c,c), text)[:10]:
+            for x in char_audit.get_examples(text, offsets):
                 print(x)
                 print("-"*30)
-            print("({} times present in the text)".format(len(re.findall(c, text))))
+            print("({} times present in the text)".format(count))
             resp = input("Do you want to replace all? Y/n  ")
             if not resp.lower() == "n":
-                if c in repl_dict:
-                    text = re.sub(c, repl_dict[c], text)
+                if c in get_repl_dict():
+                    text = re.sub(c, get_repl_dict()[c], text)
                 else:
                     print("What character do you want to replace it by? ")
                     r = input("(None if you don't want to replace)  ")
                     if r != "None":
                         text = re.sub(c, r, text)
                 print("replaced", unicodedata.name(c))
+                # the offsets of the remaining characters may have changed:
+                inventory = char_audit.get_unallowed_char_inventory(text, allowed_chars_regex)
+
+    if decisions is not None:
+        pending = get_pending_decisions(decisions, fn)
+        if pending["replacements"] or pending["chars"]:
+            return None
 
     return text
 
@@ -648,7 +1511,7 @@ def rewrap(text, maxlength=72):
             new += el
         elif not el.startswith("##"):
             #print(textwrap.wrap(el))
-            new += "\n~~".join(textwrap.wrap(el, maxlength))
+            new += "\n~~".join(line_wrap.wrap_line(el, maxlength, break_long_words=True))
         else:
             new += el
     #new = re.sub("([\r\n]+)([^P#~])", r"\1# \2", new)
@@ -659,12 +1522,162 @@ def rewrap(text, maxlength=72):
 
 
 
-def check_extension(folder, fn):
-    """Check whether the file extension in the OpenITI file header is known"""
+def get_collection(fn):
+    """Get the collection part of the version URI in a filename
+
+    Args:
+        fn (str): filename of the text file
+
+    Returns:
+        str (None if the filename does not have a version URI part)
+    """
+    try:
+        return re.split(r"\d", fn.split(".")[2], 1)[0]
+    except IndexError:
+        return None
+
+
+def is_known_collection(collection):
+    """Check whether a collection name starts with a known collection
+    (or a collection accepted during this run)
+
+    Instead of checking every known collection with str.startswith,
+    the prefixes of the collection name that have the length
+    of a known collection are looked up in a set.
+
+    Args:
+        collection (str): collection part of a version URI
+
+    Returns:
+        bool
+    """
+    global known_collections_lookup
+    if known_collections_lookup is None:
+        collections = set(get_known_collections())
+        known_collections_lookup = (collections, sorted(set(len(c) for c in collections)))
+    collections, lengths = known_collections_lookup
+    for n in lengths:
+        if n > len(collection):
+            break
+        if collection[:n] in collections:
+            return True
+    return collection.startswith(tuple(accepted_collections))
+
+
+def get_uri_regexes():
+    """Get the compiled regexes that validate the levels of an OpenITI URI
+
+    Besides the author, book and version regexes, the dictionary contains
+    a single regex that matches as many levels of a URI (author, book, version)
+    as are valid; this is equivalent to matching the three regexes separately
+    (None if the openiti regexes are not nested, see get_uri_problem).
+
+    Returns:
+        dict (keys: "author", "book", "version", "levels")
+    """
+    global uri_regexes
+    if uri_regexes is None:
+        if version.startswith(book) and book.startswith(auth):
+            levels_regex = re.compile("{}(?P<book>{}(?P<version>{})?)?".format(
+                auth, book[len(auth):], version[len(book):]))
+        else:
+            levels_regex = None
+        uri_regexes = dict(author=re.compile(auth), book=re.compile(book),
+                           version=re.compile(version), levels=levels_regex)
+    return uri_regexes
+
+
+def get_uri_problem(fn):
+    """Check whether a filename is a valid OpenITI version URI
+    (with a known collection and extension)
+
+    Args:
+        fn (str): filename of the text file
+
+    Returns:
+        str (the first problem found, see uri_problems; None if the filename is valid)
+    """
+    regexes = get_uri_regexes()
+    if regexes["levels"]:
+        m = regexes["levels"].match(fn)
+        levels = 0 if not m else 1 if m.group("book") is None else 2 if m.group("version") is None else 3
+    else:
+        levels = 0
+        for regex in (regexes["author"], regexes["book"], regexes["version"]):
+            if not regex.match(fn):
+                break
+            levels += 1
+    if levels < 3:
+        return uri_problems[levels]
+    if not is_known_collection(get_collection(fn)):
+        return "unknown collection"
+    parts = fn.split(".")
+    if len(parts) == 4 and parts[3] not in known_extensions:
+        return "unknown extension"
+    return None
+
+
+def validate_uris(fns):
+    """Check a batch of filenames (e.g., a whole directory listing)
+    without asking the user for corrections (see get_uri_problem)
+
+    Args:
+        fns (list): filenames
+
+    Returns:
+        dict (key: filename, value: problem (see uri_problems); None if the filename is valid)
+    """
+    return {fn: get_uri_problem(fn) for fn in fns}
+
+
+def validate_folder_uris(folder, recursive=True):
+    """Check the filenames of all text files in a folder
+    (e.g., all 25 years repos, as a check before committing)
+
+    Args:
+        folder (str): path to the folder
+        recursive (bool): if True, the subfolders are checked as well
+            (hidden folders, like .git, are skipped)
+
+    Returns:
+        dict (key: path to a text file with an invalid filename,
+              value: problem (see uri_problems))
+    """
+    invalid = dict()
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".")) if recursive else []
+        fns = [fn for fn in sorted(files) if get_skip_reason(root, fn) is None]
+        for fn, problem in validate_uris(fns).items():
+            if problem:
+                invalid[os.path.join(root, fn)] = problem
+    return invalid
+
+
+def check_extension(folder, fn, decisions=None):
+    """Check whether the file extension in the OpenITI file header is known
+
+    Args:
+        folder (str): path to the folder containing the text file
+        fn (str): file name of the text file
+        decisions (dict): decision ledger (see load_decisions). If provided,
+            the corrected extension is looked up in the ledger
+            instead of asking the user.
+
+    Returns:
+        str (the (corrected) filename; None if the extension is unknown
+        and the ledger does not contain a decision yet)
+    """
     if  len(fn.split(".")) == 4:
         extension = fn.split(".")[3]
         fn_without_ext = ".".join(fn.split(".")[:3])
-        if extension not in ("completed", "mARkdown", "inProgress"):
+        if extension not in known_extensions and decisions is not None:
+            new_ext = get_decision(decisions, "extensions", fn, fn, extension=extension)
+            if new_ext is None:
+                return None
+            new_fn = fn_without_ext + "." + new_ext.strip() if new_ext.strip() else fn_without_ext
+            os.rename(os.path.join(folder, fn), os.path.join(folder, new_fn))
+            return new_fn
+        if extension not in known_extensions:
             print("Extension not recognized:", extension)
             new_ext = input("Write your corrected extension (or press Enter to remove extension): ")
             if not new_ext:
@@ -679,32 +1692,37 @@ def check_extension(folder, fn):
     return fn
 
 
-def check_collection(fn):
+def check_collection(fn, decisions=None):
     """Check whether the collection part of a URI is among the known collections in OpenITI
     
     Args:
         fn (str): filename of the text file
+        decisions (dict): decision ledger (see load_decisions). If provided,
+            unknown collections are looked up in the ledger
+            instead of asking the user.
 
     Returns:
         bool
     """
-    try:
-        collection = re.split("\d", fn.split(".")[2])[0]
-    except:
+    collection = get_collection(fn)
+    if collection is None:
         return False
-    global known_collections
-    if collection.startswith(known_collections):
+    if is_known_collection(collection):
         return True
+    elif decisions is not None:
+        if get_decision(decisions, "collections", collection, fn):
+            accepted_collections.add(collection)
+            return True
     else: 
         print("This collection is not known:", collection)
         r = input("Add it to the known collections? Y/n: ")
         if not r.lower() == "n":
-            known_collections = known_collections + (collection,)
+            accepted_collections.add(collection)
             print(collection, "added to the known collections")
             return True
     return False
 
-def check_uri(folder, fn):
+def check_uri(folder, fn, decisions=None):
     """Check whether the filename contains a valid OpenITI URI.
 
     If the URI is not valid, ask the user to provide a corrected version.
@@ -712,18 +1730,41 @@ def check_uri(folder, fn):
     Args:
         folder (str): path to the folder containing the text file
         fn (str): file name of the text file
+        decisions (dict): decision ledger (see load_decisions). If provided,
+            the corrected filename is looked up in the ledger
+            instead of asking the user.
 
-    
+    Returns:
+        str (the (corrected) filename; False if the URI is not valid)
     """
-    if re.match(version_uri_regex, fn):
-        if check_collection(fn):
+    regexes = get_uri_regexes()
+    if regexes["version"].match(fn):
+        if check_collection(fn, decisions):
             return fn
+        if decisions is not None:
+            collection = get_collection(fn)
+            if decisions["collections"].get(collection, {}).get("decision") is None:
+                return False  # wait for the decision about the collection
+
+    if decisions is not None:
+        problem = get_uri_problem(fn) or "unknown collection"
+        corrected_fn = get_decision(decisions, "uris", fn, fn, problem=problem)
+        if not corrected_fn or not regexes["version"].match(corrected_fn):
+            return False
+        if not check_collection(corrected_fn, decisions):
+            return False
+        os.rename(os.path.join(folder, fn), os.path.join(folder, corrected_fn))
+        old_yml_fp = re.sub(r"(-[a-z]{3}\d).*", r"\1.yml", os.path.join(folder, fn))
+        new_yml_fp = re.sub(r"(-[a-z]{3}\d).*", r"\1.yml", os.path.join(folder, corrected_fn))
+        if os.path.exists(old_yml_fp):
+            os.rename(old_yml_fp, new_yml_fp)
+        return corrected_fn
     
     # Identify the problem in the URI:
     old_fp = os.path.join(folder, fn)
     
     corrected_fn = fn
-    if not re.match(author_uri_regex, corrected_fn):
+    if not regexes["author"].match(corrected_fn):
         print("Error in author URI:", corrected_fn)
         print("Please check the author URI has the following structure:")
         print("1. starts with 4 digits")
@@ -731,16 +1772,16 @@ def check_uri(folder, fn):
         print("3. Author name does not contain any special characters")
         print()
         corrected_fn = input("Write your corrected filename here:")
-    if not re.match(book_uri_regex, corrected_fn):
-        print(book_uri_regex)
-        print(re.findall(book_uri_regex, corrected_fn))
+    if not regexes["book"].match(corrected_fn):
+        print(regexes["book"].pattern)
+        print(regexes["book"].findall(corrected_fn))
         print("Error in book URI:", corrected_fn)
         print("Please check the book title :")
         print("1. It should start with a capital letter")
         print("2. It should not contain any special characters apart from a-z and A-Z")
         print()
         corrected_fn = input("Write your corrected filename here:")
-    if not re.match(version_uri_regex, corrected_fn):
+    if not regexes["version"].match(corrected_fn):
         print("Error in version URI:", corrected_fn)
         print("Example of a correct version URI: 0255Jahiz.Hayawan.Shamela00023775-ara1")
         print("Please check whether the last part of the URI consists of:")
@@ -750,7 +1791,7 @@ def check_uri(folder, fn):
         print("4. A number that refers to the edition used (by default: 1)")
         corrected_fn = input("Write your corrected filename here:")
     
-    if re.match(version_uri_regex, fn):
+    if regexes["version"].match(fn):
         print("The filename will be changed to", corrected_fn)
         confirm = input("Agreed? Y/n : ")
         if not confirm.lower() == "n":
@@ -769,32 +1810,37 @@ def check_uri(folder, fn):
     print("URI still incorrect. Skipping this file")
     return False
 
-def get_all_non_allowed_chars_in_file(fp):
+def get_all_non_allowed_chars_in_file(fp, char_index=None):
     """Collect a list of unallowed characters in all text files in a file.
 
     Args:
         fp (str): path to the text file
+        char_index (dict): character index of the folder (see char_audit.load_char_index).
+            Defaults to None (do not use an index)
     
     Returns:
         set
     """
-    with open(fp, mode="r", encoding="utf-8") as file:
-        text = file.read()
-    text = normalize_composites(denoise(text))
-    all_chars = "".join(set(text))
-    unallowed_chars = re.sub(allowed_chars_regex, "", all_chars)
-    return set(unallowed_chars)
+    from openiti.helper.ara import allowed_chars_regex
+
+    inventory = char_audit.get_file_inventory(fp, char_index)
+    return set(char_audit.get_unallowed_chars(inventory, allowed_chars_regex))
 
-def get_all_non_allowed_chars_in_folder(folder):
+def get_all_non_allowed_chars_in_folder(folder, use_index=True):
     """Collect a list of unallowed characters in all text files in the folder.
 
     Args:
         folder (str): Folder containing the text files
+        use_index (bool): if True, use (and update) the character index
+            of the folder, so that only new and changed files are read
     
     Returns:
-        set
+        dict (key: unallowed character, value: [count, number of files])
     """
-    unall_chars = set()
+    from openiti.helper.ara import allowed_chars_regex
+
+    char_index = char_audit.load_char_index(folder) if use_index else None
+    unall_chars = dict()
     for fn in os.listdir(folder):
         if fn.endswith((".py", ".yml", ".docx", ".md")):
             continue
@@ -802,14 +1848,22 @@ def get_all_non_allowed_chars_in_folder(folder):
             continue
         fp = os.path.join(folder, fn)
         if not os.path.isdir(fp):
-            unall_chars = unall_chars.union(get_all_non_allowed_chars_in_file(fp))
+            inventory = char_audit.get_file_inventory(fp, char_index)
+            for c in char_audit.get_unallowed_chars(inventory, allowed_chars_regex):
+                unall_chars.setdefault(c, [0, 0])
+                unall_chars[c][0] += inventory[c][0]
+                unall_chars[c][1] += 1
+    if use_index:
+        char_audit.save_char_index(folder, char_index)
     return unall_chars
 
 def confirm_auto_clean(unall_chars):
     """Ask user to confirm that all unallowed characters may be automatically replaced:
     
     Args:
-        unall_chars (set): a set of characters that are not allowed in OpenITI texts
+        unall_chars (set): a set of characters that are not allowed in OpenITI texts,
+            or a dictionary (key: character, value: [count, number of files];
+            see get_all_non_allowed_chars_in_folder)
     
     Returns:
         bool
@@ -824,20 +1878,23 @@ def confirm_auto_clean(unall_chars):
     print("AND THAT ARE NOT REMOVED BY THE NORMALIZATION AND DENOISE FUNCTIONS:")
 
     # print the non-allowed characters in the folder, together with their unicode names:
+    repl_dict = get_repl_dict()
+    counts = unall_chars if isinstance(unall_chars, dict) else dict()
     unall_chars = "".join(unall_chars)
     not_found = []
     for c in sorted(unall_chars):
+        freq = ["\t({} times in {} files)".format(*counts[c])] if c in counts else []
         try:
             if repl_dict[c] == "":
-                print(c, "\t", unicodedata.name(c), "\t-> (REMOVED)")
+                print(c, "\t", unicodedata.name(c), "\t-> (REMOVED)", *freq)
             else:
                 try:
-                    print(c, "\t", unicodedata.name(c), "\t->", repl_dict[c], "\t", unicodedata.name(repl_dict[c]))
+                    print(c, "\t", unicodedata.name(c), "\t->", repl_dict[c], "\t", unicodedata.name(repl_dict[c]), *freq)
                 except:
-                    print(c, "\t", unicodedata.name(c), "\t->", '"' + repl_dict[c] + '"')
+                    print(c, "\t", unicodedata.name(c), "\t->", '"' + repl_dict[c] + '"', *freq)
         except:
             try:
-                print(c, "\t", unicodedata.name(c), "\t-> ?")
+                print(c, "\t", unicodedata.name(c), "\t-> ?", *freq)
             except:
                 not_found.append(c)
     if not_found:
@@ -856,21 +1913,36 @@ def confirm_auto_clean(unall_chars):
 
 def check_yml_file(yml_fp, yml_type):
     """Check whether a yml file is well-formed and contains the correct URI
+
+    Every yml file is checked only once (as long as it does not change),
+    even if it is shared by many text files (e.g., author yml files).
+    Corrections are saved in the yml store (see yml_store.write_yml);
+    they are written to disk by yml_store.flush.
     
+    Args:
+        yml_fp (str): path to the yml file
+        yml_type (str): type of the yml file ("AUTH", "BOOK" or "VERS")
+
     Returns:
         bool
     """
+    from openiti.helper.yml import fix_broken_yml
+
+    key = (yml_store.get_key(yml_fp), yml_type)
+    if key in checked_yml_files:
+        return checked_yml_files[key]
+
     uri = os.path.basename(yml_fp).replace(".yml", "")
     try:
-        yml_d = readYML(yml_fp)
+        yml_d = yml_store.read_yml(yml_fp)
     except Exception as e:
         fixed_yml_d = fix_broken_yml(yml_fp)
         if fixed_yml_d:
-            with open(yml_fp, mode="w", encoding="utf-8") as file:
-                file.write(dicToYML(fixed_yml_d))
+            yml_store.write_yml(yml_fp, fixed_yml_d)
             yml_d = fixed_yml_d
         else:
             print("Error in", yml_fp, e)
+            checked_yml_files[key] = False
             return False
     
     # check if the URI in the yml file is the same as in the filename:
@@ -879,40 +1951,619 @@ def check_yml_file(yml_fp, yml_type):
         # if not: replace the uri in the yml file with the filename's uri
         print ("replacing URI in yml file:",  yml_d[uri_key], ">", uri)
         yml_d[uri_key] = uri
-        with open(yml_fp, mode="w", encoding="utf-8") as file:
-            file.write(dicToYML(yml_d))
+        yml_store.write_yml(yml_fp, yml_d)
 
+    checked_yml_files[key] = True
     return True
 
-def check_yml_files(fp):
+def get_yml_fps(fp):
+    """Get the paths to the version, book and author yml files of a text file
+
+    Args:
+        fp (str): path to a text file
+
+    Returns:
+        list (of (yml_fp, yml_type) tuples)
+    """
+    fp_without_ext, lang, ext = yml_fp_regex.findall(fp)[0]
+    return [(fp_without_ext + lang + ".yml", "VERS"),
+            (".".join(fp_without_ext.split(".")[:-1]) + ".yml", "BOOK"),
+            (fp_without_ext.split(".")[0] + ".yml", "AUTH")]
+
+def check_yml_files(fp, write_counts=None):
     """Check whether yml files accompanying the text file are well-formed.
+
+    The corrected yml files are written at once, at the end of the check.
     
     Args:
         fp (str): path to a text file
+        write_counts (dict): if provided, the number of (un)changed yml files
+            that were (not) written is counted in this dictionary
+            (see text_access.write_text). Defaults to None
     Returns:
         bool
     """
     yml_ok = True
-    fp_without_ext, lang, ext = re.findall("(.+?)(-(?:[a-z]{3}\d+)+)(.*)", fp)[0]
-    ## version yml file:
-    yml_fp = fp_without_ext + lang + ".yml"
-    if os.path.exists(yml_fp):
-        yml_ok = check_yml_file(yml_fp, "VERS")
-    ## book yml file:
-    yml_fp = ".".join(fp_without_ext.split(".")[:-1]) + ".yml"
-    if os.path.exists(yml_fp):
-        yml_ok = check_yml_file(yml_fp, "BOOK")
-    # author yml file:
-    yml_fp = fp_without_ext.split(".")[0] + ".yml"
-    if os.path.exists(yml_fp):
-        yml_ok = check_yml_file(yml_fp, "AUTH")
+    for yml_fp, yml_type in get_yml_fps(fp):
+        if os.path.exists(yml_fp):
+            yml_ok = check_yml_file(yml_fp, yml_type)
+    yml_store.flush(write_counts)
     
     return yml_ok
 
+def get_skip_reason(folder, fn, match_uri=None):
+    """Check whether a file in the folder is a text file that should be processed
+
+    Args:
+        folder (str): path to the folder containing the new files
+        fn (str): filename of the file
+        match_uri (str): only process files that match this regular expression.
+
+    Returns:
+        str (the reason why the file should be skipped; None if it should be processed)
+    """
+    if fn.endswith((".yml", ".md", ".py", ".txt", ".docx", ".jpg", ".jpeg", ".png", ".zip")):
+        return "extension"
+    elif fn.startswith("."):
+        return "starts with dot"
+    elif not os.path.isfile(os.path.join(folder, fn)):
+        return "not a file"
+    # Check if the URI matches certain criteria
+    if match_uri and not re.findall(match_uri, fn):
+        return "does not match regex " + match_uri
+    return None
+
+
+def select_file(folder, fn, start_date=0, end_date=10000, match_uri=None, decisions=None):
+    """Check whether a file in the folder should be processed by the pipeline
+
+    Non-text files and files outside the date range are skipped;
+    the user is asked to correct malformed filenames and extensions
+    (or the corrections are looked up in a decision ledger).
+
+    Args:
+        folder (str): path to the folder containing the new files
+        fn (str): filename of the file
+        start_date (int): only files written by authors who died after this date will be processed
+        end_date (int): only files written by authors who died before this date will be processed
+        match_uri (str): only process files that match this regular expression.
+        decisions (dict): decision ledger (see load_decisions).
+            Defaults to None (ask the user)
+
+    Returns:
+        str (the (corrected) filename; None if the file should not be processed)
+    """
+    # ignore all files that are not text files:
+    print(fn)
+    skip_reason = get_skip_reason(folder, fn, match_uri)
+    if skip_reason:
+        print("--> aborted:", skip_reason)
+        return None
+
+    # check filename and extension:
+    fn = check_uri(folder, fn, decisions)
+    if not fn:
+        return None  # don't process this file if no correct filename was provided
+    fn = check_extension(folder, fn, decisions)
+    if not fn:
+        return None  # don't process this file until a decision about the extension was taken
+
+    # check if the date of the author's death falls in the desired date range
+    try:
+        date = int(fn[:4])
+        if not start_date < date < end_date:
+            return None  # do not process this file
+    except Exception as e:
+        print("Error processing", fn, ":", e)
+        print("Does the filename start with 4 digits?")
+        return None  # do not process this file: filename not correct
+
+    return fn
+
+
+def scan_folder(folder, match_uri=None, max_memory=100000000, cache=None,
+                ms_pattern=" *ms[A-Z]?\d+", ms_length=300, incremental_ms=False):
+    """Read and denoise all text files in the folder once,
+    and collect the unallowed characters in their main text.
+
+    The denoised texts are kept in a store, so that the processing stage
+    (see ingest_file) does not need to read and denoise them again.
+    When the texts in memory exceed max_memory characters,
+    further texts are spilled to a temporary folder.
+    Texts with a problem in the metadata header are not stored
+    (ingest_file will report the problem).
+
+    If a pipeline cache is provided, files that were already normalised
+    with the same settings (see ingest_file) are only read and hashed:
+    they are not denoised, stored or included in the unallowed characters.
+    Since the cache key depends on the last milestone of the previous file
+    in the same chain (see get_chain_id), a file only counts as normalised
+    if all previous files in its chain do too.
+
+    Args:
+        folder (str): path to the folder containing the new files
+        match_uri (str): only scan files that match this regular expression.
+        max_memory (int): maximum number of characters kept in memory
+        cache (dict): pipeline cache (see load_pipeline_cache).
+            Defaults to None (scan all files)
+        ms_pattern (str): regular expression describing old milestone tags
+        ms_length (int): number of tokens in a milestone
+        incremental_ms (bool): see ingest_file
+            (ms_pattern, ms_length and incremental_ms are only used
+            to build the cache key)
+
+    Returns:
+        tup (dict of unallowed characters (key: character,
+            value: [count, number of files]), store)
+    """
+    from openiti.helper.ara import normalize_composites, denoise, allowed_chars_regex
+
+    store = dict(texts=dict(), folder=None, size=0, max_size=max_memory)
+    unall_chars = dict()
+    # last milestone of each chain whose files were all normalised before
+    # (None once a file in the chain needs to be processed):
+    prev_ms = dict()
+    for fn in sorted(os.listdir(folder)):
+        if get_skip_reason(folder, fn, match_uri):
+            continue
+        with open(os.path.join(folder, fn), mode="r", encoding="utf-8-sig") as file:
+            text = file.read()
+        text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        # skip files that were already normalised with the same settings:
+        if cache is not None:
+            chain_id = get_chain_id(fn)
+            entry = cache.get(fn)
+            chain_ms = prev_ms.get(chain_id, 0)
+            if entry and chain_ms is not None and entry["text_hash"] == text_hash \
+                    and entry["key"] == get_pipeline_cache_key(fn, True, ms_pattern, ms_length,
+                                                               chain_ms, incremental_ms):
+                prev_ms[chain_id] = entry["ms_count"]
+                continue
+            prev_ms[chain_id] = None
+        # header problems will be reported by ingest_file:
+        with contextlib.redirect_stdout(io.StringIO()):
+            header, body = check_meta_header(text)
+        if header:
+            body = normalize_composites(denoise(body))
+            store_scanned_text(store, fn, header, body, text_hash)
+        else:
+            body = normalize_composites(denoise(text))
+        inventory = char_audit.get_unallowed_char_inventory(body, allowed_chars_regex, max_offsets=0)
+        for c in inventory:
+            unall_chars.setdefault(c, [0, 0])
+            unall_chars[c][0] += inventory[c][0]
+            unall_chars[c][1] += 1
+    return unall_chars, store
+
+
+def store_scanned_text(store, fn, header, text, text_hash):
+    """Add a denoised text to the store of scan_folder
+
+    Args:
+        store (dict): the store created by scan_folder
+        fn (str): filename of the text file
+        header (str): metadata header of the text
+        text (str): denoised main text
+        text_hash (str): sha1 hash of the text file as it was read
+    """
+    entry = dict(header=header, text_hash=text_hash)
+    if store["size"] + len(text) <= store["max_size"]:
+        entry["text"] = text
+        store["size"] += len(text)
+    else:
+        if not store["folder"]:
+            store["folder"] = tempfile.mkdtemp(prefix="barzakh_scan_")
+        entry["fp"] = os.path.join(store["folder"], "{}.txt".format(len(store["texts"])))
+        with open(entry["fp"], mode="w", encoding="utf-8", newline="") as file:
+            file.write(text)
+    store["texts"][fn] = entry
+
+
+def pop_scanned_text(store, fn):
+    """Remove a denoised text from the store of scan_folder and return it
+
+    Args:
+        store (dict): the store created by scan_folder
+        fn (str): filename of the text file
+
+    Returns:
+        tup (header, denoised main text, text_hash), or None if the text is not in the store
+    """
+    entry = store["texts"].pop(fn, None)
+    if not entry:
+        return None
+    if "fp" in entry:
+        with open(entry["fp"], mode="r", encoding="utf-8", newline="") as file:
+            text = file.read()
+        os.remove(entry["fp"])
+    else:
+        text = entry["text"]
+        store["size"] -= len(text)
+    return entry["header"], text, entry["text_hash"]
+
+
+def remove_scan_store(store):
+    """Remove the temporary folder of the store of scan_folder, if any
+
+    Args:
+        store (dict): the store created by scan_folder
+    """
+    store["texts"] = dict()
+    if store["folder"]:
+        shutil.rmtree(store["folder"], ignore_errors=True)
+        store["folder"] = None
+
+
+def get_chain_id(fn):
+    """Get the identifier of the chain of files to which a text file belongs
+
+    Continuous versions (e.g., 0255Jahiz.Hayawan.Shamela0001A-ara1
+    and 0255Jahiz.Hayawan.Shamela0001B-ara1) share the milestone numbering,
+    so they must be milestoned one after the other, in sorted order.
+    All other files form a chain on their own.
+
+    Args:
+        fn (str): filename of the text file
+
+    Returns:
+        str
+    """
+    version_uri = fn.split("-")[0]
+    if re.findall("[A-Z]$", version_uri.split(".")[-1]):
+        return version_uri[:-1]
+    return fn
+
+
+def load_pipeline_cache(folder):
+    """Load the pipeline cache of a folder
+
+    The cache is a JSON lines file; if a file is listed more than once,
+    the last entry counts.
+
+    Args:
+        folder (str): path to the folder containing the new files
+
+    Returns:
+        dict (key: filename, value: cache entry)
+    """
+    cache = dict()
+    cache_fp = os.path.join(folder, pipeline_cache_fn)
+    if not os.path.exists(cache_fp):
+        return cache
+    with open(cache_fp, mode="r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+                cache[entry["fn"]] = entry
+            except Exception as e:
+                print("Skipping broken line in pipeline cache:", e)
+    return cache
+
+
+def save_pipeline_cache_entry(folder, entry):
+    """Append a new entry to the pipeline cache of a folder
+
+    Args:
+        folder (str): path to the folder containing the new files
+        entry (dict): cache entry (see ingest_file)
+    """
+    cache_fp = os.path.join(folder, pipeline_cache_fn)
+    with open(cache_fp, mode="a", encoding="utf-8") as file:
+        file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def compact_pipeline_cache(folder, cache):
+    """Rewrite the pipeline cache of a folder with one entry per file
+
+    Only the latest entry of each file that is still in the folder is kept,
+    so that the cache does not keep growing with every run.
+
+    Args:
+        folder (str): path to the folder containing the new files
+        cache (dict): pipeline cache (see load_pipeline_cache)
+
+    Returns:
+        bool: True if the cache file was rewritten
+    """
+    cache_fp = os.path.join(folder, pipeline_cache_fn)
+    if not cache and not os.path.exists(cache_fp):
+        return False
+    lines = []
+    for fn in sorted(cache):
+        if os.path.exists(os.path.join(folder, fn)):
+            lines.append(json.dumps(cache[fn], ensure_ascii=False) + "\n")
+    return text_access.write_text(cache_fp, "".join(lines))
+
+
+def get_pipeline_cache_key(fn, auto_clean, ms_pattern, ms_length, prev_ms, incremental_ms=False):
+    """Get a hash of all settings that influence the output of ingest_file
+
+    Args:
+        fn (str): filename of the text file
+        auto_clean (bool): if True, unallowed characters are automatically removed
+        ms_pattern (str): regular expression describing old milestone tags
+        ms_length (int): number of tokens in a milestone
+        prev_ms (int): number of the last milestone in the previous text
+        incremental_ms (bool): if True, milestones are added incrementally
+
+    Returns:
+        str
+    """
+    settings = [PIPELINE_VERSION, auto_clean, ms_pattern, ms_length, prev_ms, incremental_ms,
+                keep_line_endings_ids, get_repl_tup(), get_lang_repl_tups(fn)]
+    settings = json.dumps(settings, ensure_ascii=False)
+    return hashlib.sha1(settings.encode("utf-8")).hexdigest()
+
+
+def ingest_file(folder, fn, auto_clean=True, ms_pattern=" *ms[A-Z]?\d+",
+                ms_length=300, prev_ms=0, cache=None, store=None, decisions=None,
+                incremental_ms=False):
+    """Clean a text file, add paragraph marks and milestones, and save it
+
+    If a cache is provided, files that were already normalised
+    with the same settings (see get_pipeline_cache_key) are not processed
+    again, and the cache is updated for every file that is saved.
+
+    Args:
+        folder (str): path to the folder containing the new files
+        fn (str): filename of the text file
+        auto_clean (bool): if True, unallowed characters will be automatically removed
+        ms_pattern (str): regular expression describing old milestone tags
+        ms_length (int): number of tokens in a milestone
+        prev_ms (int): number of the last milestone in the previous text
+            of the same chain (see get_chain_id)
+        cache (dict): pipeline cache (see load_pipeline_cache).
+            Defaults to None (do not use a cache)
+        store (dict): store of texts that were already read and denoised
+            (see scan_folder). Defaults to None (read the file)
+        decisions (dict): decision ledger used for cleaning (see load_decisions).
+            Defaults to None (ask the user)
+        incremental_ms (bool): if True, keep the milestones of the unchanged
+            parts of the text (see incremental_milestone). Defaults to False
+
+    Returns:
+        tup (status, ms_count): status is "ok", "unchanged" (the file
+            was not written because its contents did not change),
+            "header" (problem with the
+            metadata header), "decisions" (the decision ledger does not
+            contain all decisions needed to clean the text)
+            or "milestone" (milestoning damaged the text);
+            ms_count is the number of the last milestone in the text
+            (None if the file was not saved)
+    """
+    # Check the contents of the text file
+    # (unless it was already read and denoised by scan_folder):
+    fp = os.path.join(folder, fn)
+    scanned = pop_scanned_text(store, fn) if store else None
+    if scanned:
+        header, text, text_hash = scanned
+    else:
+        with open(fp, mode="r", encoding="utf-8-sig") as file:
+            text = file.read()
+        text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    # Skip the file if it was already normalised with the same settings:
+    if cache is not None:
+        cache_key = get_pipeline_cache_key(fn, auto_clean, ms_pattern, ms_length, prev_ms, incremental_ms)
+        entry = cache.get(fn)
+        if entry and entry["text_hash"] == text_hash and entry["key"] == cache_key:
+            print("--> already normalised: not cleaned and milestoned again")
+            return "unchanged", entry["ms_count"]
+
+    # Check whether the metadata header is present:
+    if not scanned:
+        header, text = check_meta_header(text)
+        if not header:
+            print(fn, ": problem with metadata header")
+            return "header", None  # do not process this file: problem with metadata header
+
+    old_text = text
+
+    # Remove unallowed characters from the main body of the text:
+    text = clean(text, fn, auto_clean, denoised=bool(scanned), decisions=decisions)
+    if text is None:
+        print(fn, ": waiting for decisions in the decision ledger")
+        return "decisions", None
+
+    # Add mARkdown paragraph marks if necessary:
+    text = check_paragraph_marks(text, fn)
+
+    # final cleaning:
+    text = post_process(text)
+
+    # remove any existing milestone IDs and create new ones:
+    text = re.sub(ms_pattern, "", text)
+    text = re.sub(" *Milestone\d+", "", text)
+    if incremental_ms:
+        text, ms_count = incremental_milestone(old_text, text, fn, prev_ms=prev_ms, ms_length=ms_length)
+    else:
+        text, ms_count = milestone(text, fn, prev_ms=prev_ms, ms_length=ms_length)
+    if ms_count is None:
+        return "milestone", None  # do not process this file: something went wrong with milestoning!
+
+    # re-assemble the header and text:
+    text = header + "#META#Header#End#" + text
+
+    # write the changes to the text file (if there are any):
+    written = text_access.write_text(fp, text)
+
+    if cache is not None:
+        cache[fn] = dict(fn=fn, text_hash=hashlib.sha1(text.encode("utf-8")).hexdigest(),
+                         key=cache_key, ms_count=ms_count)
+
+    return ("ok" if written else "unchanged"), ms_count
+
+
+def ingest_chain(args):
+    """Ingest a chain of text files (see get_chain_id) in a worker process
+
+    The console output for each file is captured,
+    so that it can be printed in a stable order by the main process.
+
+    Args:
+        args (tup): folder, list of filenames in the chain,
+            and a dictionary of keyword arguments for ingest_file
+
+    Returns:
+        list (of (fn, status, output, cache entry, pending decisions) tuples)
+    """
+    folder, chain, kwargs = args
+    results = []
+    prev_ms = 0
+    for fn in chain:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            try:
+                status, ms_count = ingest_file(folder, fn, prev_ms=prev_ms, **kwargs)
+            except Exception as e:
+                print("Error processing", fn, ":", e)
+                status, ms_count = "error", None
+        if ms_count is not None:
+            prev_ms = ms_count
+        entry = kwargs["cache"].get(fn) if "cache" in kwargs else None
+        pending = get_pending_decisions(kwargs["decisions"], fn) if "decisions" in kwargs else None
+        results.append((fn, status, output.getvalue(), entry, pending))
+    return results
+
+
+def collect_file_decisions(args):
+    """Collect all decisions needed to process a text file
+    (without changing the file), in a worker process
+
+    Args:
+        args (tup): folder, filename, auto_clean
+
+    Returns:
+        tup (fn, decision ledger with the pending decisions for this file)
+    """
+    folder, fn, auto_clean = args
+    decisions = {kind: dict() for kind in decision_kinds}
+    with contextlib.redirect_stdout(io.StringIO()):
+        if check_uri(folder, fn, decisions):
+            check_extension(folder, fn, decisions)
+        if not auto_clean:
+            with open(os.path.join(folder, fn), mode="r", encoding="utf-8-sig") as file:
+                header, text = check_meta_header(file.read())
+            if header:
+                clean(text, fn, auto_clean, decisions=decisions)
+    return fn, decisions
+
+
+def collect_decisions(folder, decisions_fp, auto_clean=True, match_uri=None, workers=1):
+    """Phase one of the batch mode: collect all decisions needed
+    to process the text files in the folder into a decision ledger
+
+    The files are checked (in parallel if workers > 1) but not changed.
+    Fill in the decisions in the ledger and run main with the ledger
+    (phase two) to process all files without further user input.
+    Decisions that are already in the ledger are kept; questions that
+    depend on earlier decisions (e.g., about the extension of a file
+    that still has to be renamed) are added when main is run.
+
+    Args:
+        folder (str): path to the folder containing the new files
+        decisions_fp (str): path to the json file of the decision ledger
+        auto_clean (bool): if False, decisions are also needed
+            about the replacement patterns and unallowed characters
+        match_uri (str): only check files that match this regular expression.
+        workers (int): number of processes used to check the files
+
+    Returns:
+        dict (the decision ledger)
+    """
+    decisions = load_decisions(decisions_fp)
+    fns = [fn for fn in sorted(os.listdir(folder)) if not get_skip_reason(folder, fn, match_uri)]
+    args = [(folder, fn, auto_clean) for fn in fns]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            for fn, file_decisions in pool.imap(collect_file_decisions, args):
+                merge_decisions(decisions, file_decisions)
+    else:
+        for fn, file_decisions in map(collect_file_decisions, args):
+            merge_decisions(decisions, file_decisions)
+    save_decisions(decisions_fp, decisions)
+    print(count_pending_decisions(decisions), "decisions to be taken in", decisions_fp)
+    return decisions
+
+
+def finalize_file(folder, fn, out_folder, do_not_move_regex="[Nn]oorlib",
+                  non_25Y_folder=None, execute=True, write_counts=None):
+    """Check the yml files of a cleaned text file and move it into the corpus
+
+    Args:
+        folder (str): path to the folder containing the new files
+        fn (str): filename of the text file
+        out_folder (str): parent folder of the AH folders of the Arabic files
+        do_not_move_regex (str): Regular expression describing all files
+            that should not be moved to the out_folder (e.g., Noorlib files)
+        non_25Y_folder (str): name of the parent folder for the new files,
+            to be used instead of the 25 years folder (0025AH, 0050AH, ...).
+        execute (bool): if False, the proposed moves will only be printed
+        write_counts (dict): see check_yml_file
+
+    Returns:
+        tup (yml_ok, repo): repo is the path to the repo
+            to which the text file was moved (None if it was not moved)
+    """
+    from openiti.new_books.add.add_books import initialize_new_text
+
+    fp = os.path.join(folder, fn)
+    lang_code = re.findall(".+-([a-z]{3})", fn)[0]
+
+    # check whether any related yml files are well-formed:
+    yml_ok = check_yml_files(fp, write_counts)
+    if not yml_ok:
+        return False, None  # skip this text file because its yml files are not ok!
+
+    # Move the text file to the corpus folder
+    # (except files that match a specified regex: do_not_move_regex)
+    # If a text file has an accompanying yml file, it will be moved as well;
+    # if not, a blank yml file will be created in the destination repo.
+    corpus_type = "normal"
+    if re.findall(do_not_move_regex, fn):
+        print(fn, "cleaned but not moved to folder: on ignore list")
+    elif os.path.isfile(fp):
+        # make sure the Arabic files are in a different folder from the Persian, Urdu, etc. files:
+        if fn.startswith("MS"):
+            lang_out_folder = os.path.join(os.path.split(out_folder)[0], "MSS")
+            corpus_type = "manuscripts"
+        elif lang_code == "ara":
+            lang_out_folder = out_folder
+        else:
+            lang_out_folder = out_folder + "_" + lang_code.upper()
+        print("outfolder:", lang_out_folder)
+
+        # DEBUG:
+        if corpus_type == "normal":
+            initialize_new_text(fp, lang_out_folder, execute=execute, 
+                                non_25Y_folder=non_25Y_folder)
+        else:
+            initialize_new_text(fp, lang_out_folder, execute=execute, 
+                                non_25Y_folder=None)
+
+        # return the repo to which the new text was added:
+        if fn.startswith("MS"):
+            return True, lang_out_folder
+        y = int(fn[:4])
+        if non_25Y_folder:
+            repo = non_25Y_folder
+        elif y % 25:
+            repo = "{:04d}AH".format((int(y/25) + 1)*25)
+        else:
+            repo = "{:04d}AH".format(y)
+        # take into account the different repo name format for Arabic and other languages:
+        if lang_code != "ara":
+            repo = lang_code.upper() + repo
+        return True, os.path.join(lang_out_folder, repo)
+
+    return True, None
+
+
 def main(folder, out_folder, start_date=0, end_date=10000, 
          auto_clean=True, silent=False, do_not_move_regex="[Nn]oorlib", 
          ms_pattern=" *ms[A-Z]?\d+", ms_length=300, non_25Y_folder=None,
-         match_uri=None, execute=True):
+         match_uri=None, execute=True, workers=1, use_cache=True,
+         max_scan_memory=100000000, decisions_fp=None, incremental_ms=False):
     """Check and clean new text files and move them into the corpus
     
     Args:
@@ -932,6 +2583,28 @@ def main(folder, out_folder, start_date=0, end_date=10000,
             Defaults to None (that is: use the auto-generated 25 years folder)
         match_uri (str): only process files that match this regular expression.
             Defaults to None (that is: process all text and yml files)
+        execute (bool): if False, the proposed moves will only be printed
+            (the user will be asked to execute them for each file)
+        workers (int): number of processes used to clean and milestone
+            the text files. Continuous versions (A, B, ...) are processed
+            in order by the same process; yml files are checked and
+            files are moved by the main process, in sorted order.
+            Defaults to 1 (process the files one by one)
+        use_cache (bool): if True, files that were already normalised
+            by an earlier run with the same settings are not cleaned
+            and milestoned again (see ingest_file)
+        max_scan_memory (int): maximum number of characters of denoised text
+            kept in memory between the scan of the folder and the processing
+            of the files; further texts are temporarily stored on disk
+        decisions_fp (str): path to the json file of a decision ledger
+            (see collect_decisions). If provided, the user is not asked
+            for any input: decisions are taken from the ledger, files for which
+            a decision is missing are skipped and their questions added
+            to the ledger. Defaults to None (ask the user)
+        incremental_ms (bool): if True, the milestones in the unchanged parts
+            of texts that were milestoned before are kept, so that small
+            corrections do not change all milestones
+            (see incremental_milestone). Defaults to False
     
     Returns:
         None
@@ -939,136 +2612,142 @@ def main(folder, out_folder, start_date=0, end_date=10000,
     changed_repos = set()
     header_issues = []
     broken_yml_files = []
-    prev_ms = 0
+    prev_ms = dict()  # last milestone number of each chain of files
+    decisions = load_decisions(decisions_fp) if decisions_fp else None
+    waiting_files = []
+    # number of files written and skipped (unchanged):
+    text_counts = dict(written=0, skipped=0)
+    yml_counts = dict(written=0, skipped=0)
+
+    cache = load_pipeline_cache(folder) if use_cache else None
 
+    store = None
     if auto_clean:
-        # Collect a list of unallowed characters in all text files in the folder:
-        unall_chars = get_all_non_allowed_chars_in_folder(folder)
+        # Collect a list of unallowed characters in all text files in the folder
+        # (and keep the denoised texts for the processing stage);
+        # files that were already normalised with the same settings are skipped:
+        unall_chars, store = scan_folder(folder, match_uri, max_scan_memory, cache=cache,
+                                         ms_pattern=ms_pattern, ms_length=ms_length,
+                                         incremental_ms=incremental_ms)
         # Ask user to confirm that all these characters may be automatically replaced in all texts:
-        if not silent: 
+        if not silent and decisions is None: 
             auto_clean = confirm_auto_clean(unall_chars)
+        if not auto_clean:
+            remove_scan_store(store)
+            store = None
     
-    for fn in sorted(os.listdir(folder)):
-        # ignore all files that are not text files:
-        print(fn)
-        if fn.endswith((".yml", ".md", ".py", ".txt", ".docx", ".jpg", ".jpeg", ".png", ".zip")):
-            print("--> aborted: extension")
-            continue
-        elif fn.startswith("."):
-            print("--> aborted: starts with dot")
-            continue
-        elif not os.path.isfile(os.path.join(folder, fn)):
-            print("--> aborted: not a file")
-            continue
-        # Check if the URI matches certain criteria
-        if match_uri and not re.findall(match_uri, fn):
-            print("--> aborted: does not match regex", match_uri)
-            continue
-
-        # get the language code:
-        lang_code = re.findall(".+-([a-z]{3})", fn)[0]
-
-        # check filename and extension:
-        fn = check_uri(folder, fn)
-        if not fn:
-            continue  # don't process this file if no correct filename was provided
-        fn = check_extension(folder, fn)
-
-        # check if the date of the author's death falls in the desired date range
-        try:
-            date = int(fn[:4])
-            if not start_date < date < end_date:
-                continue  # do not process this file
-        except Exception as e:
-            print("Error processing", fn, ":", e)
-            print("Does the filename start with 4 digits?")
-            continue  # do not process this file: filename not correct
-
-        # Check the contents of the text file:
-        fp = os.path.join(folder, fn)
-        with open(fp, mode="r", encoding="utf-8-sig") as file:
-            text = file.read()
-           
-            # Check whether the metadata header is present:
-            header, text = check_meta_header(text)
-            if not header:
-                print(fn, ": problem with metadata header")
+    ingest_kwargs = dict(auto_clean=auto_clean, ms_pattern=ms_pattern, ms_length=ms_length,
+                         incremental_ms=incremental_ms)
+    if decisions is not None:
+        ingest_kwargs["decisions"] = decisions
+    finalize_kwargs = dict(do_not_move_regex=do_not_move_regex,
+                           non_25Y_folder=non_25Y_folder, execute=execute,
+                           write_counts=yml_counts)
+    if workers > 1 and not auto_clean and decisions is None:
+        print("Manual cleaning requires user input: processing the files one by one")
+        workers = 1
+
+    if workers <= 1:
+        for fn in sorted(os.listdir(folder)):
+            old_fn = fn
+            fn = select_file(folder, fn, start_date, end_date, match_uri, decisions)
+            if not fn:
+                continue
+            if store and fn != old_fn and old_fn in store["texts"]:
+                store["texts"][fn] = store["texts"].pop(old_fn)
+            chain_id = get_chain_id(fn)
+            entry = cache.get(fn) if use_cache else None
+            status, ms_count = ingest_file(folder, fn, prev_ms=prev_ms.get(chain_id, 0),
+                                           cache=cache, store=store, **ingest_kwargs)
+            if use_cache and cache.get(fn) is not entry:
+                save_pipeline_cache_entry(folder, cache[fn])
+            if status == "ok":
+                text_counts["written"] += 1
+            elif status == "unchanged":
+                text_counts["skipped"] += 1
+            elif status == "header":
                 header_issues.append(fn)
-                continue  # do not process this file: problem with metadata header
-            
-            # Remove unallowed characters from the main body of the text:
-            text = clean(text, fn, auto_clean)
-
-            # Add mARkdown paragraph marks if necessary:
-            text = check_paragraph_marks(text, fn)
-
-            # final cleaning:
-            text = post_process(text)
-
-            # remove any existing milestone IDs and create new ones:
-            text = re.sub(ms_pattern, "", text)
-            text = re.sub(" *Milestone\d+", "", text)
-            text, prev_ms = milestone(text, fn, prev_ms=prev_ms, ms_length=ms_length)
-            if prev_ms is None:
-                continue  # do not process this file: something went wrong with milestoning!
-
-            # re-assemble the header and text:
-            text = header + "#META#Header#End#" + text
-        
-        # DEBUG:
-        # write the changes to the text file:
-        with open(fp, mode="w", encoding="utf-8") as file:
-            file.write(text)
-
- 
-        # check whether any related yml files are well-formed:
-        yml_ok = check_yml_files(fp)
-        if not yml_ok:
-            broken_yml_files.append(fp)
-            continue  # skip this text file because its yml files are not ok!
-
-
-        # Move the text file to the corpus folder
-        # (except files that match a specified regex: do_not_move_regex)
-        # If a text file has an accompanying yml file, it will be moved as well;
-        # if not, a blank yml file will be created in the destination repo.
-        corpus_type = "normal"
-        if re.findall(do_not_move_regex, fn):
-            print(fn, "cleaned but not moved to folder: on ignore list")
-        elif os.path.isfile(fp):
-            # make sure the Arabic files are in a different folder from the Persian, Urdu, etc. files:
-            if fn.startswith("MS"):
-                lang_out_folder = os.path.join(os.path.split(out_folder)[0], "MSS")
-                corpus_type = "manuscripts"
-            elif lang_code == "ara":
-                lang_out_folder = out_folder
-            else:
-                lang_out_folder = out_folder + "_" + lang_code.upper()
-            print("outfolder:", lang_out_folder)
-
-            # DEBUG:
-            if corpus_type == "normal":
-                initialize_new_text(fp, lang_out_folder, execute=execute, 
-                                    non_25Y_folder=non_25Y_folder)
-            else:
-                initialize_new_text(fp, lang_out_folder, execute=execute, 
-                                    non_25Y_folder=None)
-
-            # store repo to a list of all repos to which new texts were added:
-            if fn.startswith("MS"):
-                changed_repos.add(lang_out_folder)
-            else:
-                y = int(fn[:4])
-                if non_25Y_folder:
-                    repo = non_25Y_folder
-                elif y % 25:
-                    repo = "{:04d}AH".format((int(y/25) + 1)*25)
-                else:
-                    repo = "{:04d}AH".format(y)
-                # take into account the different repo name format for Arabic and other languages:
-                if lang_code != "ara":
-                    repo = lang_code.upper() + repo
-                changed_repos.add(os.path.join(lang_out_folder, repo))
+            elif status == "decisions":
+                waiting_files.append(fn)
+            if ms_count is None:
+                continue
+            prev_ms[chain_id] = ms_count
+            yml_ok, repo = finalize_file(folder, fn, out_folder, **finalize_kwargs)
+            if not yml_ok:
+                broken_yml_files.append(os.path.join(folder, fn))
+            elif repo:
+                changed_repos.add(repo)
+    else:
+        # plan: check all filenames first (this may require user input),
+        # and group continuous versions into chains:
+        chains = dict()
+        for fn in sorted(os.listdir(folder)):
+            old_fn = fn
+            fn = select_file(folder, fn, start_date, end_date, match_uri, decisions)
+            if not fn:
+                continue
+            if store and fn != old_fn and old_fn in store["texts"]:
+                store["texts"][fn] = store["texts"].pop(old_fn)
+            chains.setdefault(get_chain_id(fn), []).append(fn)
+        chains = sorted(chains.values(), key=lambda chain: chain[0])
+        selected = sorted(fn for chain in chains for fn in chain)
+
+        # clean and milestone the chains in parallel;
+        # check the yml files and move the files in sorted order
+        # (related files share yml files, and moving may require user input):
+        with multiprocessing.Pool(workers) as pool:
+            args = []
+            for chain in chains:
+                chain_kwargs = dict(ingest_kwargs)
+                if use_cache:
+                    chain_kwargs["cache"] = {fn: cache[fn] for fn in chain if fn in cache}
+                if store:
+                    # give each chain its own part of the store:
+                    texts = {fn: store["texts"].pop(fn) for fn in chain if fn in store["texts"]}
+                    chain_kwargs["store"] = dict(store, texts=texts)
+                args.append((folder, chain, chain_kwargs))
+            results = pool.imap(ingest_chain, args)
+            done = dict()
+            for fn in selected:
+                while fn not in done:
+                    for result in next(results):
+                        done[result[0]] = result[1:]
+                status, output, entry, pending = done.pop(fn)
+                # (the filename was already printed by select_file while planning)
+                print(output, end="")
+                if entry and entry != cache.get(fn):
+                    cache[fn] = entry
+                    save_pipeline_cache_entry(folder, entry)
+                if pending:
+                    merge_decisions(decisions, pending)
+                if status == "ok":
+                    text_counts["written"] += 1
+                elif status == "unchanged":
+                    text_counts["skipped"] += 1
+                elif status == "header":
+                    header_issues.append(fn)
+                elif status == "decisions":
+                    waiting_files.append(fn)
+                if status not in ("ok", "unchanged"):
+                    continue
+                yml_ok, repo = finalize_file(folder, fn, out_folder, **finalize_kwargs)
+                if not yml_ok:
+                    broken_yml_files.append(os.path.join(folder, fn))
+                elif repo:
+                    changed_repos.add(repo)
+
+    if store:
+        remove_scan_store(store)
+
+    if use_cache:
+        compact_pipeline_cache(folder, cache)
+
+    if decisions is not None:
+        save_decisions(decisions_fp, decisions)
+
+    print("---------------")
+    print("Text files written: {written}, unchanged (not written): {skipped}".format(**text_counts))
+    print("Yml files written: {written}, unchanged (not written): {skipped}".format(**yml_counts))
 
     if changed_repos:
         print("---------------")
@@ -1088,6 +2767,12 @@ def main(folder, out_folder, start_date=0, end_date=10000,
         for fp in broken_yml_files:
             print(fp)
 
+    if decisions is not None and count_pending_decisions(decisions):
+        print("---------------")
+        print(count_pending_decisions(decisions), "decisions to be taken in", decisions_fp)
+        for fn in waiting_files:
+            print(fn)
+
 
 
 if __name__ == "__main__":
@@ -10,7 +10,6 @@ import os
 import re
 import csv
 from shutil import copyfile
-from openiti.helper.yml import readYML, dicToYML
 from  openiti.helper.templates import version_yml_template, book_yml_template, author_yml_template
 import urllib.request
 
@@ -24,6 +23,8 @@ import shutil
 from openiti.helper.funcs import natural_sort
 from datetime import datetime
 
+import yml_store
+
 
 escript_message = """This text was OCR'ed as part of the second phase of the\
 ¶    OpenITI AOCP project, generously funded by the Andrew W. Mellon Foundation."""
@@ -896,7 +897,9 @@ def download_transcriptions(escr, download_folder, output_type="pagexml", projec
 
 
 def add_to_yml(yml_fp, based, link, notes, issues, uri=None):
-    yml = readYML(yml_fp)
+    """Add metadata to a version yml file
+    (saved in the yml store: call yml_store.flush to write it to disk)"""
+    yml = yml_store.read_yml(yml_fp)
     if based:
         yml["80#VERS#BASED####:"] = based
     if link:
@@ -919,8 +922,7 @@ def add_to_yml(yml_fp, based, link, notes, issues, uri=None):
         yml["90#VERS#ISSUES###:"] = "UNCORRECTED_OCR"
     if uri:
         yml["00#VERS#URI######:"] = uri
-    with open(yml_fp, mode="w", encoding="utf-8") as file:
-        file.write(dicToYML(yml))
+    yml_store.write_yml(yml_fp, yml)
   
 
 
@@ -948,6 +950,7 @@ def add_OCR_pipeline_files(meta_fp, ocr_folder, dest_folder):
                 copyfile(fp, dest_fp)
                 if fn.endswith(".yml"):
                     add_to_yml(dest_fp, row[1], row[2], row[4], row[5])
+                    yml_store.flush()
                 new_uri = row[6].strip()
                 if new_uri: # replacement URI
                     new_fp = re.sub(book_uri, new_uri, dest_fp)
@@ -1137,8 +1140,7 @@ def add_eScriptorium_files(meta_fp, download_folder, dest_folder,
 
             # create a version yml file and store it:
             yml_fp = outfp + ".yml"
-            with open(yml_fp, mode="w", encoding="utf-8") as file:
-                file.write(version_yml_template)
+            yml_store.write_yml(yml_fp, yml_store.parse_yml(version_yml_template, yml_fp))
 
             # fill in relevant YML fields:
             based = row["BASED LINK (WORLDCAT)"]
@@ -1164,27 +1166,24 @@ def add_eScriptorium_files(meta_fp, download_folder, dest_folder,
             book_uri = ".".join(uri.split(".")[:2])
             if relations or title_transcr:
                 yml_fp = os.path.join(dest_folder, book_uri + ".yml")
-                with open(yml_fp, mode="w", encoding="utf-8") as file:
-                    file.write(book_yml_template)
-                yml_d = readYML(yml_fp)
+                yml_d = yml_store.parse_yml(book_yml_template, yml_fp)
                 yml_d["00#BOOK#URI######:"] = book_uri
                 yml_d["40#BOOK#RELATED##:"] = relations
                 yml_d["10#BOOK#TITLEA#AR:"] = title_transcr
-                with open(yml_fp, mode="w", encoding="utf-8") as file:
-                    file.write(dicToYML(yml_d))
+                yml_store.write_yml(yml_fp, yml_d)
 
             # create an author YML file if the metadata author transcription:
             author_transcr = row["AUTHOR_TRANSCRIPTION"]
             author_uri = book_uri.split(".")[0]
             if author_transcr:
                 yml_fp = os.path.join(dest_folder, author_uri + ".yml")
-                with open(yml_fp, mode="w", encoding="utf-8") as file:
-                    file.write(author_yml_template)
-                yml_d = readYML(yml_fp)
+                yml_d = yml_store.parse_yml(author_yml_template, yml_fp)
                 yml_d["00#AUTH#URI######:"] = author_uri
                 yml_d["10#AUTH#SHUHRA#AR:"] = author_transcr
-                with open(yml_fp, mode="w", encoding="utf-8") as file:
-                    file.write(dicToYML(yml_d))
+                yml_store.write_yml(yml_fp, yml_d)
+
+            # write the version, book and author yml files at once:
+            yml_store.flush()
 
         # merge multivolume books:
         if multivol:
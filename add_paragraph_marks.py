@@ -1,6 +1,7 @@
 import os
 import re
-import textwrap
+
+import line_wrap
 
 
 def get_avg_line_len(text):
@@ -21,7 +22,7 @@ def wrap(text, max_length=72):
         if line.startswith(("###", "\r", "\n")):
             wrapped.append(line)
         else:
-            lines = textwrap.wrap(line, max_length, break_long_words=False)
+            lines = line_wrap.wrap_line(line, max_length)
             wrapped.append("\n~~".join(lines))
 
     return header + "".join(wrapped)
@@ -1,14 +1,15 @@
 import re
 import os
 
+import text_access
+
 meta_fp = r"D:\London\publications\co-authored vol\PeterChapterOnOpenITI\meta"
 meta_fp = r"D:\London\OpenITI\metadata\automation\kitab-metadata-automation\kitab-metadata-automation\output"
 meta_fp += r"\OpenITI_Github_clone_metadata_light.csv"
 
 
-with open(meta_fp, encoding="utf-8") as file:
-    meta = file.read().splitlines()
-    header = meta.pop(0)
+meta = text_access.iter_lines(meta_fp, encoding="utf-8")
+header = next(meta)
 
 authors = set()
 books = set()
@@ -26,9 +27,10 @@ for row in meta:
 ##    input()
 
 
-with open("log.md", encoding="utf-8") as file:
-    log = file.read()
-last = re.split("---+", log)[-1]
+# only decode the last section of the log (after the last horizontal rule):
+with text_access.open_mapped("log.md") as buf:
+    i = buf.rfind(b"---")
+    last = "".join(text_access.decode_chunks(buf, i+3 if i >= 0 else 0))
 last = re.findall("    to (\S+)", last)
 new_authors = set()
 new_books = set()
@@ -0,0 +1,391 @@
+"""Benchmarks for the functions in the _pipeline script.
+
+Each benchmark compares the output and the speed of the current
+implementation with the previous (reference) implementation,
+using the text files in the barzakh folder.
+
+Run this script from the barzakh folder:
+
+    python benchmark_pipeline.py
+"""
+import contextlib
+import io
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import textwrap
+import time
+import tempfile
+import tracemalloc
+
+import _pipeline
+import char_audit
+import substitution_rules
+import openiti.helper.ara
+from openiti.helper.ara import normalize_composites, denoise, ar_tok
+
+
+def get_text_files(folder):
+    """Get a sorted list of the paths to all text files in the folder
+
+    Args:
+        folder (str): path to the folder containing the text files
+
+    Returns:
+        list
+    """
+    text_files = []
+    for fn in sorted(os.listdir(folder)):
+        if fn.endswith((".yml", ".md", ".py", ".txt", ".docx", ".jpg", ".jpeg", ".png", ".zip")):
+            continue
+        elif fn.startswith("."):
+            continue
+        fp = os.path.join(folder, fn)
+        if os.path.isfile(fp) and re.findall(r"-[a-z]{3}\d", fn):
+            text_files.append(fp)
+    return text_files
+
+
+def replace_sequentially(text, fn):
+    """Reference implementation: apply the replacement tuples one by one
+    (the way _pipeline.clean did it before the compiled replacement tables)"""
+    for pattern, repl in _pipeline.get_repl_tup():
+        text = _pipeline.ask_replace_permission(text, pattern, repl, auto=True)
+    for lang, lang_repl_tup in _pipeline.get_lang_repl_tups(fn):
+        for pattern, repl in lang_repl_tup:
+            text = _pipeline.ask_replace_permission(text, pattern, repl, auto=True)
+    return text
+
+
+def benchmark_replacements(folder="."):
+    """Compare the sequential replacements with the compiled replacement table
+
+    Args:
+        folder (str): path to the folder containing the text files
+    """
+    print("REPLACEMENT TABLES: sequential vs. compiled (single pass)")
+    total_seq = 0
+    total_compiled = 0
+    for fp in get_text_files(folder):
+        fn = os.path.basename(fp)
+        with open(fp, mode="r", encoding="utf-8-sig") as file:
+            text = file.read()
+        text = normalize_composites(denoise(text))
+
+        start = time.perf_counter()
+        seq_text = replace_sequentially(text, fn)
+        seq_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        table = _pipeline.get_replacement_table(fn)
+        compiled_text = _pipeline.apply_replacement_table(text, table)
+        compiled_time = time.perf_counter() - start
+
+        if seq_text != compiled_text:
+            print("!! OUTPUT DIFFERS:", fn)
+        total_seq += seq_time
+        total_compiled += compiled_time
+        print("  {:>8d} chars  {:.4f}s > {:.4f}s  {}".format(len(text), seq_time, compiled_time, fn))
+    print("  total: {:.4f}s > {:.4f}s".format(total_seq, total_compiled))
+
+
+def milestone_from_token_list(text, fn, prev_ms=0, ms_length=300):
+    """Reference implementation: build a list of all tokens and
+    check the milestoned text by removing the milestone tags again
+    (the way _pipeline.milestone did it before streaming milestones)"""
+    version_id = fn.split("-")[0].split(".")[-1]
+    continuous = bool(re.findall(r"[A-Z]$", version_id))
+    text = text.rstrip()
+    ara_toks_count = len(ar_tok.findall(text))
+    ms_tag_str_len = len(str(math.floor(ara_toks_count / ms_length)))
+    all_toks = re.findall(r"\w+|\W+", text)
+    token_count = 0
+    if continuous and version_id[-1] != "A":
+        ms_count = prev_ms
+    else:
+        ms_count = 0
+    new_data = []
+    for i in range(0, len(all_toks)):
+        if re.fullmatch(ar_tok, all_toks[i]):
+            token_count += 1
+        new_data.append(all_toks[i])
+        if token_count == ms_length or i == len(all_toks) - 1:
+            ms_count += 1
+            if continuous:
+                milestone = " ms" + version_id[-1] + str(ms_count).zfill(ms_tag_str_len)
+            else:
+                milestone = " ms" + str(ms_count).zfill(ms_tag_str_len)
+            new_data.append(milestone)
+            token_count = 0
+    ms_text = "".join(new_data)
+    if re.sub(r" ms([A-Z])?\d+", "", ms_text) == text:
+        return ms_text, ms_count
+    return text, None
+
+
+def measure(func, *args, **kwargs):
+    """Run a function and measure its run time and peak memory use
+
+    Returns:
+        tup (result of the function, seconds, peak memory in bytes)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    duration = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, duration, peak
+
+
+def benchmark_milestones(folder="."):
+    """Compare the token list milestoner with the streaming milestoner
+
+    Args:
+        folder (str): path to the folder containing the text files
+    """
+    print("MILESTONES: token list vs. streaming")
+    for fp in get_text_files(folder):
+        fn = os.path.basename(fp)
+        with open(fp, mode="r", encoding="utf-8-sig") as file:
+            text = file.read()
+        text = re.sub(r" *ms[A-Z]?\d+", "", text)
+
+        ref, ref_time, ref_peak = measure(milestone_from_token_list, text, fn)
+        new, new_time, new_peak = measure(_pipeline.milestone, text, fn)
+
+        if ref != new:
+            print("!! OUTPUT DIFFERS:", fn)
+        print("  {:>8d} chars  {:.4f}s > {:.4f}s  {:6.1f} MB > {:6.1f} MB  {}".format(
+            len(text), ref_time, new_time, ref_peak/1e6, new_peak/1e6, fn))
+
+
+def get_import_time(statement, folder="."):
+    """Measure the cumulative import time of all modules
+    imported by a statement, in a fresh Python process
+
+    Args:
+        statement (str): Python statement that imports modules
+        folder (str): working directory of the Python process
+
+    Returns:
+        float (import time in seconds)
+    """
+    cmd = [sys.executable, "-X", "importtime", "-c", statement]
+    proc = subprocess.run(cmd, cwd=folder, capture_output=True, text=True)
+    total = 0
+    for line in proc.stderr.splitlines():
+        # top-level imports are not indented in the importtime output:
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S.*)", line)
+        if m:
+            total += int(m.group(1))
+    return total / 1e6
+
+
+def benchmark_import_time(folder=".", repeat=5):
+    """Compare the import time of _pipeline with the import time
+    of _pipeline plus the modules and tables it now loads on first use
+
+    Args:
+        folder (str): path to the folder containing _pipeline.py
+        repeat (int): number of measurements (the fastest is reported)
+    """
+    print("IMPORT TIME: eager vs. lazy (python -X importtime)")
+    eager = "import _pipeline; import openiti.helper.ara, openiti.helper.yml, "
+    eager += "openiti.new_books.add.add_books, urllib.request; _pipeline.get_repl_dict()"
+    eager_time = min(get_import_time(eager, folder) for i in range(repeat))
+    lazy_time = min(get_import_time("import _pipeline", folder) for i in range(repeat))
+    print("  import _pipeline: {:.4f}s > {:.4f}s".format(eager_time, lazy_time))
+
+
+def benchmark_char_classification(fp="conversion_test2.txt", repeat=5):
+    """Compare the regex check for unallowed characters (set + re.sub)
+    with the vectorised codepoint classifier in char_audit
+
+    Args:
+        fp (str): path to a (large) text file
+        repeat (int): number of measurements (the fastest is reported)
+    """
+    from openiti.helper.ara import allowed_chars_regex
+
+    print("UNALLOWED CHARACTERS: set + regex vs. codepoint lookup table")
+    with open(fp, mode="r", encoding="utf-8") as file:
+        text = file.read()
+    char_audit.get_allowed_table(allowed_chars_regex)  # (built once per regex)
+
+    regex_time = classifier_time = float("inf")
+    for i in range(repeat):
+        start = time.perf_counter()
+        regex_chars = re.sub(allowed_chars_regex, "", "".join(set(text)))
+        regex_time = min(regex_time, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        inventory = char_audit.get_unallowed_char_inventory(text, allowed_chars_regex)
+        classifier_time = min(classifier_time, time.perf_counter() - start)
+
+    if set(regex_chars) != set(inventory):
+        print("!! OUTPUT DIFFERS:", fp)
+    print("  {:>8d} chars  {:.4f}s > {:.4f}s  ({} unallowed characters, with counts and offsets)".format(
+        len(text), regex_time, classifier_time, len(inventory)))
+
+
+def benchmark_paragraph_marks(fp="conversion_test2.txt", repeat=20):
+    """Compare the regex passes over the whole text with
+    the single-pass line state machine for adding paragraph marks
+
+    Args:
+        fp (str): path to a (large) text file
+        repeat (int): the text is repeated to simulate a huge OCR output
+    """
+    print("PARAGRAPH MARKS: regex passes vs. line state machine")
+    with open(fp, mode="r", encoding="utf-8") as file:
+        text = file.read()
+    text = re.sub(r"^(?:~~|# )", "", text, flags=re.M) * repeat
+
+    ref, ref_time, ref_peak = measure(_pipeline.add_paragraph_marks_with_regexes, text)
+    new, new_time, new_peak = measure(_pipeline.add_paragraph_marks, text)
+
+    if ref != new:
+        print("!! OUTPUT DIFFERS:", fp)
+    print("  {:>8d} chars  {:.4f}s > {:.4f}s  {:6.1f} MB > {:6.1f} MB".format(
+        len(text), ref_time, new_time, ref_peak/1e6, new_peak/1e6))
+
+
+def post_process_with_regexes(text):
+    """Reference implementation: apply the post-processing regexes one by one
+    (the way _pipeline.post_process did it before the substitution rules)"""
+    text = re.sub(" ###", "\n\n###", text)
+    text = re.sub(r"\A~~[ \r\n]+~~", r"\n\n# ", text)
+    text = re.sub(r"\A~~[ \r\n]+", r"\n\n", text)
+    text = re.sub(r"[\r\n]+~~ *(?:[\r\n]+|\Z)", "\n", text)
+    text = re.sub("(?<=# |~~) *ا\s+| +ا *(?=[\r\n])", "", text)
+    text = re.sub("~~ ", "~~", text)
+    text = re.sub(r"\b([وفبلك]*(?:ا?ل)?)شئ\b", r"\1شيء", text)
+    return text
+
+
+def benchmark_post_process(folder=".", fp="conversion_test2.txt"):
+    """Compare the sequential post-processing regexes with the substitution
+    rules, and print the time and number of hits of every rule
+
+    Args:
+        folder (str): path to the folder containing the text files
+        fp (str): path to an additional (large) text file
+    """
+    print("POST-PROCESSING: sequential regexes vs. substitution rules")
+    texts = []
+    for text_fp in get_text_files(folder) + [fp]:
+        with open(text_fp, mode="r", encoding="utf-8-sig") as file:
+            texts.append(file.read())
+
+    start = time.perf_counter()
+    ref = [post_process_with_regexes(text) for text in texts]
+    ref_time = time.perf_counter() - start
+    start = time.perf_counter()
+    new = [_pipeline.post_process(text) for text in texts]
+    new_time = time.perf_counter() - start
+
+    if ref != new:
+        print("!! OUTPUT DIFFERS")
+    print("  {:>8d} chars  {:.4f}s > {:.4f}s".format(sum(map(len, texts)), ref_time, new_time))
+    profile = dict()
+    for text in texts:
+        _pipeline.post_process(text, profile)
+    substitution_rules.print_profile(profile)
+
+
+def wrap_with_textwrap(text, max_length=72, wrapped_line_marker="\n~~"):
+    """Reference implementation: wrap every line with textwrap
+    (the way _pipeline.wrap did it before line_wrap)"""
+    wrapped = []
+    for line in re.split("([\r\n]+)", text):
+        if line.startswith(("###", "\r", "\n")):
+            wrapped.append(line)
+        else:
+            lines = textwrap.wrap(line, max_length, break_long_words=False)
+            wrapped.append(wrapped_line_marker.join(lines))
+    return "".join(wrapped)
+
+
+def benchmark_wrap(folder=".", fp="conversion_test2.txt"):
+    """Compare textwrap with line_wrap on paragraph-length lines
+    (the wrapped lines of the texts are joined into paragraphs first)
+
+    Args:
+        folder (str): path to the folder containing the text files
+        fp (str): path to an additional (large) text file
+    """
+    print("WRAPPING: textwrap vs. line_wrap")
+    total_ref = 0
+    total_new = 0
+    for text_fp in get_text_files(folder) + [fp]:
+        with open(text_fp, mode="r", encoding="utf-8-sig") as file:
+            text = file.read()
+        text = re.sub(r"[\r\n]+~~", " ", text)
+
+        start = time.perf_counter()
+        ref = wrap_with_textwrap(text)
+        ref_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = _pipeline.wrap(text)
+        new_time = time.perf_counter() - start
+
+        if ref != new:
+            print("!! OUTPUT DIFFERS:", text_fp)
+        total_ref += ref_time
+        total_new += new_time
+        print("  {:>8d} chars  {:.4f}s > {:.4f}s  {}".format(len(text), ref_time, new_time, os.path.basename(text_fp)))
+    print("  total: {:.4f}s > {:.4f}s".format(total_ref, total_new))
+
+
+def check_cached_rerun(folder=".", workers=1):
+    """Check that a second run of _pipeline.main over unchanged files
+    does not denoise any text (all files are found in the pipeline cache)
+
+    The text and yml files are copied to a temporary folder,
+    which is processed twice (without moving the files).
+
+    Args:
+        folder (str): path to the folder containing the text files
+        workers (int): number of processes used by _pipeline.main
+    """
+    print("PIPELINE CACHE: denoised texts in a second run over unchanged files")
+    temp_folder = tempfile.mkdtemp(prefix="barzakh_rerun_")
+    for fn in os.listdir(folder):
+        fp = os.path.join(folder, fn)
+        if fp in get_text_files(folder) or (fn.endswith(".yml") and os.path.isfile(fp)):
+            shutil.copy(fp, temp_folder)
+
+    # count the calls to denoise (_pipeline imports it when it is called):
+    calls = [0]
+    def counting_denoise(text, *args, **kwargs):
+        calls[0] += 1
+        return denoise(text, *args, **kwargs)
+    openiti.helper.ara.denoise = counting_denoise
+    try:
+        for run in (1, 2):
+            calls[0] = 0
+            with contextlib.redirect_stdout(io.StringIO()):
+                _pipeline.main(temp_folder, temp_folder, silent=True, do_not_move_regex=".",
+                               workers=workers)
+            print("  run {}: {} texts denoised".format(run, calls[0]))
+        if calls[0]:
+            print("!! UNCHANGED FILES WERE DENOISED AGAIN")
+    finally:
+        openiti.helper.ara.denoise = denoise
+        shutil.rmtree(temp_folder)
+
+
+if __name__ == "__main__":
+    benchmark_import_time(".")
+    benchmark_replacements(".")
+    benchmark_milestones(".")
+    benchmark_char_classification("conversion_test2.txt")
+    benchmark_paragraph_marks("conversion_test2.txt")
+    benchmark_post_process(".", "conversion_test2.txt")
+    benchmark_wrap(".", "conversion_test2.txt")
+    check_cached_rerun(".")
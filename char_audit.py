@@ -0,0 +1,274 @@
+"""Character inventories for the unallowed-character audits.
+
+A character inventory of a text lists, for every character in the text,
+the number of times it occurs and the offsets of its first occurrences.
+The audits (_pipeline, clean_before_push, check_folder_for_disallowed_characters)
+can then find the unallowed characters in a text, count them and show
+examples of their use without searching the whole text for each character.
+
+The inventories of the files in a folder are stored in a persistent index
+(a json file in the folder), keyed by the path of the file;
+an inventory is only rebuilt if the modification time or size of the file changed.
+
+The inventory of a file is based on its content after
+denoise and normalize_composites, like the audits themselves.
+
+If NumPy is installed (it is imported on first use, see get_numpy),
+texts are classified as arrays of codepoints:
+each codepoint is looked up in a boolean table that covers
+the Basic Multilingual Plane (see get_allowed_table).
+Without NumPy, the same results are produced with the standard library.
+"""
+import json
+import os
+import re
+from collections import Counter
+
+import text_access
+
+# name of the file in which the index of a folder is stored:
+char_index_fn = ".char_index.json"
+# number of offsets stored for each character:
+max_offsets = 10
+# cache for the lookup tables of allowed characters (key: allowed characters regex):
+allowed_tables = dict()
+# NumPy module, imported on first use by get_numpy (None if it is not installed):
+numpy_module = None
+numpy_checked = False
+
+
+def get_numpy():
+    """Import NumPy on first use (importing it takes longer than
+    importing all modules of the pipeline)
+
+    Returns:
+        the numpy module, or None if NumPy is not installed
+    """
+    global numpy_module, numpy_checked
+    if not numpy_checked:
+        try:
+            import numpy
+            numpy_module = numpy
+        except ImportError:  # NumPy is optional
+            pass
+        numpy_checked = True
+    return numpy_module
+
+
+def get_codepoints(text):
+    """Convert a text into a NumPy array of its codepoints
+
+    Args:
+        text (str): the text
+
+    Returns:
+        numpy.ndarray (uint32)
+    """
+    np = get_numpy()
+    return np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+
+
+def get_allowed_table(allowed_chars_regex):
+    """Get a boolean lookup table that tells for each codepoint
+    in the Basic Multilingual Plane whether it is allowed
+
+    The table is built once for every regex.
+
+    Args:
+        allowed_chars_regex (str): regex that matches all allowed characters
+
+    Returns:
+        numpy.ndarray (bool, 65536 elements)
+    """
+    if allowed_chars_regex not in allowed_tables:
+        np = get_numpy()
+        bmp = "".join(map(chr, range(0x10000)))
+        unallowed = re.sub(allowed_chars_regex, "", bmp)
+        table = np.ones(0x10000, dtype=bool)
+        table[[ord(c) for c in unallowed]] = False
+        allowed_tables[allowed_chars_regex] = table
+    return allowed_tables[allowed_chars_regex]
+
+
+def get_char_inventory(text, max_offsets=max_offsets):
+    """Count all characters in a text and find their first occurrences
+
+    Args:
+        text (str): the text
+        max_offsets (int): maximum number of offsets stored for each character
+
+    Returns:
+        dict (key: character, value: [count, list of offsets])
+    """
+    np = get_numpy()
+    if np is not None:
+        counts = np.bincount(get_codepoints(text))
+        codepoints = np.flatnonzero(counts)
+        char_counts = zip(map(chr, codepoints.tolist()), counts[codepoints].tolist())
+    else:
+        char_counts = Counter(text).items()
+    inventory = dict()
+    for c, count in char_counts:
+        offsets = []
+        i = -1
+        # (stop searching once the last occurrence was found)
+        while len(offsets) < min(count, max_offsets):
+            i = text.find(c, i+1)
+            offsets.append(i)
+        inventory[c] = [count, offsets]
+    return inventory
+
+
+def get_unallowed_chars(inventory, allowed_chars_regex):
+    """Get the characters in an inventory that are not allowed
+
+    Args:
+        inventory (dict): character inventory (see get_char_inventory)
+        allowed_chars_regex (str): regex that matches all allowed characters
+
+    Returns:
+        str
+    """
+    return re.sub(allowed_chars_regex, "", "".join(inventory))
+
+
+def get_unallowed_char_inventory(text, allowed_chars_regex, max_offsets=max_offsets):
+    """Find all unallowed characters in a text, with their counts
+    and the offsets of their first occurrences
+
+    With NumPy, all codepoints of the text are classified in one vectorised
+    lookup (characters outside the Basic Multilingual Plane,
+    which are rare, are checked with the regex).
+
+    Args:
+        text (str): the text
+        allowed_chars_regex (str): regex that matches all allowed characters
+        max_offsets (int): maximum number of offsets stored for each character
+
+    Returns:
+        dict (key: unallowed character, value: [count, list of offsets])
+    """
+    np = get_numpy()
+    if np is None:
+        inventory = get_char_inventory(text, max_offsets)
+        return {c: inventory[c] for c in get_unallowed_chars(inventory, allowed_chars_regex)}
+
+    codepoints = get_codepoints(text)
+    table = get_allowed_table(allowed_chars_regex)
+    unallowed = ~table[np.minimum(codepoints, 0xFFFF)]
+    astral = codepoints > 0xFFFF
+    if astral.any():
+        astral_codepoints = np.unique(codepoints[astral]).tolist()
+        allowed = [cp for cp in astral_codepoints if not re.sub(allowed_chars_regex, "", chr(cp))]
+        unallowed[astral] = ~np.isin(codepoints[astral], allowed)
+
+    # group the positions of the unallowed characters by codepoint
+    # (a stable sort keeps the positions of each codepoint in ascending order):
+    positions = np.flatnonzero(unallowed)
+    order = np.argsort(codepoints[positions], kind="stable")
+    positions = positions[order]
+    unique, starts, counts = np.unique(codepoints[positions], return_index=True, return_counts=True)
+    inventory = dict()
+    for cp, start, count in zip(unique.tolist(), starts.tolist(), counts.tolist()):
+        offsets = positions[start:start+min(count, max_offsets)].tolist()
+        inventory[chr(cp)] = [count, offsets]
+    return inventory
+
+
+def get_examples(text, offsets, context=20, highlight="ـــ"):
+    """Get examples of the use of a character in a text
+
+    Args:
+        text (str): the text (as it was when the inventory was made)
+        offsets (list): offsets of the character in the text
+        context (int): number of characters shown before and after the character
+        highlight (str): string used to highlight the character (default: kashidas)
+
+    Returns:
+        list (of strings)
+    """
+    examples = []
+    for i in offsets:
+        before = text[max(0, i-context):i]
+        after = text[i+1:i+1+context]
+        examples.append(before + highlight + text[i] + highlight + after)
+    return examples
+
+
+def load_char_index(folder):
+    """Load the character index of a folder
+
+    Args:
+        folder (str): path to the folder
+
+    Returns:
+        dict (key: path to the file,
+              value: dict with the mtime, size and inventory of the file)
+    """
+    index_fp = os.path.join(folder, char_index_fn)
+    if not os.path.exists(index_fp):
+        return dict()
+    try:
+        with open(index_fp, mode="r", encoding="utf-8") as file:
+            return json.load(file)
+    except Exception as e:
+        print("Error loading character index:", e)
+        return dict()
+
+
+def save_char_index(folder, index):
+    """Save the character index of a folder
+
+    Entries for files that no longer exist are removed.
+
+    Args:
+        folder (str): path to the folder
+        index (dict): character index (see load_char_index)
+    """
+    index = {fp: entry for fp, entry in index.items() if os.path.exists(fp)}
+    index_fp = os.path.join(folder, char_index_fn)
+    with open(index_fp, mode="w", encoding="utf-8") as file:
+        json.dump(index, file, ensure_ascii=False)
+
+
+def get_file_inventory(fp, index=None):
+    """Get the character inventory of a file (after denoising and
+    normalizing its composite characters)
+
+    Args:
+        fp (str): path to the file
+        index (dict): character index (see load_char_index).
+            If the index contains an inventory for the file
+            with the same modification time and size, that inventory is used;
+            otherwise, the inventory is built and stored in the index.
+            Defaults to None (do not use an index)
+
+    Returns:
+        dict (key: character, value: [count, list of offsets])
+    """
+    from openiti.helper.ara import normalize_composites, denoise
+
+    key = os.path.abspath(fp)
+    stat = os.stat(fp)
+    if index is not None:
+        entry = index.get(key)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return entry["inventory"]
+
+    # denoising and normalization do not work across lines,
+    # so the file can be processed in chunks that end with a new line:
+    inventory = dict()
+    n_chars = 0
+    for chunk in text_access.iter_chunks(fp, encoding="utf-8"):
+        chunk = normalize_composites(denoise(chunk))
+        for c, (count, offsets) in get_char_inventory(chunk).items():
+            if c not in inventory:
+                inventory[c] = [0, []]
+            inventory[c][0] += count
+            missing = max_offsets - len(inventory[c][1])
+            inventory[c][1].extend(n_chars + i for i in offsets[:missing])
+        n_chars += len(chunk)
+
+    if index is not None:
+        index[key] = dict(mtime=stat.st_mtime, size=stat.st_size, inventory=inventory)
+    return inventory
@@ -1,8 +1,24 @@
-from openiti.helper.ara import *
+"""List the characters in OpenITI text files that are not allowed.
+
+Folders are walked recursively (e.g., the 25 years repos, not only
+the barzakh folder) and the files are audited in parallel. The character
+inventories of the files are stored in a character index in each folder
+(see char_audit), so that only new and changed files are read again.
+
+The report lists, for each unallowed character, the files that contain it
+and the number of occurrences in each file; it can be saved as json or tsv:
+
+    python check_folder_for_disallowed_characters.py 25Y_repos barzakh -o report.tsv
+"""
+import argparse
+import json
+import multiprocessing
 import unicodedata
 import os
 import re
 
+import char_audit
+
 
 
 allowed_chars = """\
@@ -134,39 +150,189 @@ allowed_chars = [x.split("\t")[0] for x in allowed_chars.splitlines()]
 allowed_chars = [c for c in allowed_chars if c not in ("-", ".")]
 allowed_chars += ["\.", "\-"]
 allowed_chars = re.compile("[{}]+".format("".join(allowed_chars)))
+# characters that are not in the whitelist but should not be reported:
+ignored_chars = re.compile("[0-9a-zA-ZāĀēĒṭṬṯṮūŪīĪİıōŌṣṢšŠḍḌḏḎǧǦġĠḫḪḳḲẓẒčČñʿʾ' \"\n\t\[\]]+")
+# files that are not audited:
+skipped_extensions = (".py", ".yml", ".docx", ".md", ".json", ".tsv", ".zip",
+                      ".jpg", ".jpeg", ".png")
 
-def get_all_non_allowed_chars_in_file(fp, print_output=False):
-    with open(fp, mode="r", encoding="utf-8") as file:
-        text = file.read()
-    text = normalize_composites(denoise(text))
-    all_chars = "".join(set(text))
-    filtered_chars = re.sub(allowed_chars, "", all_chars)
-    filtered_chars = re.sub("[0-9a-zA-ZāĀēĒṭṬṯṮūŪīĪİıōŌṣṢšŠḍḌḏḎǧǦġĠḫḪḳḲẓẒčČñʿʾ' \"\n\t\[\]]+", "", filtered_chars)
-    return filtered_chars
+def get_unallowed_char_counts(inventory):
+    """Get the unallowed characters in a character inventory, with their counts
 
-def get_all_non_allowed_chars_in_folder(folder):
-    all_chars = set()
-    for fn in os.listdir(folder):
-        fp = os.path.join(folder, fn)
-        if os.path.isfile(fp) and not fn.endswith((".py", ".yml", ".docx", ".md")):
-            print(fn)
-            all_chars = all_chars.union(set(get_all_non_allowed_chars_in_file(fp)))
-            print(len(all_chars))
-    # print the non-allowed characters in the folder:
-    all_chars = "".join(all_chars)
+    Args:
+        inventory (dict): character inventory (see char_audit.get_char_inventory)
+
+    Returns:
+        dict (key: character, value: count)
+    """
+    filtered_chars = char_audit.get_unallowed_chars(inventory, allowed_chars)
+    filtered_chars = ignored_chars.sub("", filtered_chars)
+    return {c: inventory[c][0] for c in filtered_chars}
+
+def get_all_non_allowed_chars_in_file(fp, print_output=False, char_index=None):
+    inventory = char_audit.get_file_inventory(fp, char_index)
+    return "".join(get_unallowed_char_counts(inventory))
+
+def list_text_files(folder, recursive=True):
+    """List the paths to the text files in a folder
+    (hidden files and folders, like .git, are skipped)
+
+    Args:
+        folder (str): path to the folder
+        recursive (bool): if True, the subfolders are included
+
+    Returns:
+        list
+    """
+    fps = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".")) if recursive else []
+        for fn in sorted(files):
+            if not fn.startswith(".") and not fn.endswith(skipped_extensions):
+                fps.append(os.path.join(root, fn))
+    return fps
+
+def audit_file(fp):
+    """Build the character inventory of a file (in a worker process)
+
+    Args:
+        fp (str): path to the file
+
+    Returns:
+        tup (fp, character index entry of the file; None if the file could not be read)
+    """
+    index = dict()
+    try:
+        char_audit.get_file_inventory(fp, index)
+    except Exception as e:
+        print("Error reading", fp, ":", e)
+        return fp, None
+    return fp, index[os.path.abspath(fp)]
+
+def audit_folders(folders, workers=1, recursive=True, use_index=True):
+    """Find the unallowed characters in all text files in the folders
+
+    Args:
+        folders (list): paths to the folders
+        workers (int): number of processes used to read the files
+        recursive (bool): if True, the subfolders are audited as well
+        use_index (bool): if True, the character inventories of unchanged files
+            are taken from the character index of the folder (see char_audit)
+
+    Returns:
+        dict (key: unallowed character,
+              value: dict (key: path to a file containing the character,
+                           value: number of occurrences in the file))
+    """
+    report = dict()
+    for folder in folders:
+        char_index = char_audit.load_char_index(folder) if use_index else dict()
+        fps = list_text_files(folder, recursive)
+        print(folder, ":", len(fps), "files")
+        inventories = dict()
+        to_be_read = []
+        for fp in fps:
+            entry = char_index.get(os.path.abspath(fp))
+            stat = os.stat(fp)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                inventories[fp] = entry["inventory"]
+            else:
+                to_be_read.append(fp)
+        print(len(to_be_read), "new or changed files")
+        if workers > 1 and len(to_be_read) > 1:
+            with multiprocessing.Pool(workers) as pool:
+                entries = list(pool.imap_unordered(audit_file, to_be_read, chunksize=4))
+        else:
+            entries = [audit_file(fp) for fp in to_be_read]
+        for fp, entry in entries:
+            if entry:
+                char_index[os.path.abspath(fp)] = entry
+                inventories[fp] = entry["inventory"]
+        if use_index:
+            char_audit.save_char_index(folder, char_index)
+
+        # merge the unallowed characters of all files:
+        for fp in sorted(inventories):
+            for c, count in get_unallowed_char_counts(inventories[fp]).items():
+                report.setdefault(c, dict())[fp] = count
+    return report
+
+def get_char_name(c):
+    """Get the Unicode name of a character ("" if it has no name)"""
+    try:
+        return unicodedata.name(c)
+    except ValueError:
+        return ""
+
+def save_report(report, fp):
+    """Save the report of audit_folders as a json file or (if the filename
+    ends with .tsv) as a tsv file with one row per character and file
+
+    Args:
+        report (dict): output of audit_folders
+        fp (str): path to the output file
+    """
+    if fp.endswith(".tsv"):
+        rows = ["char\tcodepoint\tname\tfile\tcount"]
+        for c in sorted(report):
+            for text_fp, count in sorted(report[c].items()):
+                rows.append("\t".join([c, "U+{:04X}".format(ord(c)), get_char_name(c),
+                                       text_fp, str(count)]))
+        with open(fp, mode="w", encoding="utf-8") as file:
+            file.write("\n".join(rows) + "\n")
+    else:
+        json_report = dict()
+        for c in sorted(report):
+            json_report[c] = dict(codepoint="U+{:04X}".format(ord(c)),
+                                  name=get_char_name(c),
+                                  count=sum(report[c].values()),
+                                  files=dict(sorted(report[c].items())))
+        with open(fp, mode="w", encoding="utf-8") as file:
+            json.dump(json_report, file, ensure_ascii=False, indent=2)
+
+def print_report(report):
+    """Print the unallowed characters, with their total counts
+    and the number of files in which they occur"""
     not_found = []
-    for c in sorted(all_chars):
-        try:
-            print(c, "\t", unicodedata.name(c))
-        except:
+    for c in sorted(report):
+        name = get_char_name(c)
+        if not name:
             not_found.append(c)
+            continue
+        print(c, "\t", name, "\t", sum(report[c].values()), "\t", len(report[c]), "files")
     if not_found:
         print("NOT FOUND:")
         for c in not_found:
-            print(c)
+            print(c, "\t", sum(report[c].values()), "\t", len(report[c]), "files")
+
+def get_all_non_allowed_chars_in_folder(folder):
+    # only new and changed files are read; the character inventories
+    # of the other files are taken from the character index of the folder:
+    report = audit_folders([folder], recursive=False)
+    print_report(report)
+    return "".join(report)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="List the characters in OpenITI text files that are not allowed")
+    parser.add_argument("folders", nargs="*", default=["."],
+                        help="folders to be audited (default: the current folder)")
+    parser.add_argument("-o", "--output",
+                        help="path to the report (json, or tsv if the filename ends with .tsv)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="number of processes (default: number of CPUs)")
+    parser.add_argument("--no-recursive", action="store_true",
+                        help="do not audit the subfolders")
+    parser.add_argument("--no-index", action="store_true",
+                        help="read all files again, without using or updating the character index")
+    args = parser.parse_args()
 
-get_all_non_allowed_chars_in_folder(".")
-    
-    
-            
+    report = audit_folders(args.folders, workers=args.workers,
+                           recursive=not args.no_recursive, use_index=not args.no_index)
+    print_report(report)
+    if args.output:
+        save_report(report, args.output)
+        print("report saved to", args.output)
 
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
-from openiti.helper.ara import *
+"""Clean the text files in a folder (e.g., barzakh) before pushing them.
+
+The files are cleaned in parallel (when no user input is needed),
+with the same compiled replacement tables as _pipeline.clean.
+In dry-run mode, nothing is written: the number of substitutions
+made by every rule in every file is reported instead.
+
+Usage (see main):
+
+    python clean_before_push.py . --workers 4
+    python clean_before_push.py . --dry-run --report substitutions.tsv
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
 import unicodedata
 import os
 import re
-import textwrap
-from shutil import copyfile
+
+import _pipeline
+import char_audit
+import line_wrap
+import substitution_rules
+import text_access
 
 # Whitelist of characters that are allowed in OpenITI texts:
 
@@ -371,6 +390,94 @@ repl_tup_urd = [
     ("ى", "ی"),     # Alif maksura
     ]
 
+# final cleaning of the text (after adding the paragraph marks);
+# (name, pattern, replacement, literal) tuples, see substitution_rules:
+final_cleaning_rules = [
+    ("section title on a new line", " ###", "\n\n###", " ###"),
+    ("tildas at the start of the text (paragraph)", r"\A~~[ \r\n]+~~", r"\n\n# ", "~~"),
+    ("tildas at the start of the text", r"\A~~[ \r\n]+", r"\n\n", "~~"),
+    ("empty continued line", r"[\r\n]+~~ *(?:[\r\n]+|\Z)", "\n", "~~"),
+    ("leading and trailing alif (OCR)", "(?<=# |~~) *ا\s+| +ا *(?=[\r\n])", "", "ا"),
+    ("space after tildas", "~~ ", "~~", "~~ "),
+    ("al-shay'", r"\b([وفبلك]*(?:ا?ل)?)شئ\b", r"\1شيء", "شئ"),
+]
+compiled_final_cleaning_rules = None   # compiled on first use
+
+# compiled replacement tables and rule lists (key: tuple of language codes):
+replacement_tables = dict()
+replacement_rules = dict()
+
+
+def get_lang_repl_tups(fn):
+    """Get the replacement tuples (general and language-specific)
+    that apply to a text file
+
+    Args:
+        fn (str): file name of the text file
+
+    Returns:
+        tup (key: tuple of language codes, list of (pattern, replacement) tuples)
+    """
+    key = []
+    tups = list(repl_tup)
+    for lang, lang_tups in [("ara", repl_tup_ara), ("per", repl_tup_per), ("urd", repl_tup_urd)]:
+        if re.findall("-(?:[a-z]{3})*"+lang, fn):
+            key.append(lang)
+            tups += lang_tups
+    return tuple(key), tups
+
+def describe_chars(s):
+    """Describe a pattern or replacement by the names of its characters"""
+    if not s:
+        return "nothing"
+    return " + ".join(unicodedata.name(c, "U+{:04X}".format(ord(c))) for c in s if c != "?")
+
+def get_replacement_table(fn):
+    """Get the compiled replacement table for a text file
+    (see _pipeline.compile_replacement_table)
+
+    Args:
+        fn (str): file name of the text file
+
+    Returns:
+        dict (None if the replacement tuples could not be compiled)
+    """
+    key, tups = get_lang_repl_tups(fn)
+    if key not in replacement_tables:
+        replacement_tables[key] = _pipeline.compile_replacement_table(tups)
+    return replacement_tables[key]
+
+def get_replacement_rules(fn):
+    """Get the replacement tuples for a text file as a compiled
+    rule list (one rule per tuple, see substitution_rules),
+    which can be applied with a profile to count the substitutions of each rule
+
+    Args:
+        fn (str): file name of the text file
+
+    Returns:
+        list
+    """
+    key, tups = get_lang_repl_tups(fn)
+    if key not in replacement_rules:
+        rules = []
+        for pattern, repl in tups:
+            name = "{} > {}".format(describe_chars(pattern), describe_chars(repl))
+            literal = pattern if re.escape(pattern) == pattern else None
+            rules.append([(name, pattern, repl, literal)])
+        rules.append([("unwanted characters", unwanted_chars_regex.pattern, "", None)])
+        replacement_rules[key] = substitution_rules.compile_rules(rules)
+    return replacement_rules[key]
+
+def get_final_cleaning_rules():
+    """Get the compiled final cleaning rules (each rule is applied separately,
+    since the rules feed into each other)"""
+    global compiled_final_cleaning_rules
+    if compiled_final_cleaning_rules is None:
+        compiled_final_cleaning_rules = substitution_rules.compile_rules(
+            [[rule] for rule in final_cleaning_rules])
+    return compiled_final_cleaning_rules
+
 
 def add_paragraph_marks(text, keep_line_endings=True, maxlength=72):
     """Add paragraph marks (hashtags and tildas) to one file.
@@ -420,28 +527,31 @@ def wrap(text, max_length=72):
         if line.startswith(("###", "\r", "\n")):
             wrapped.append(line)
         else:
-            lines = textwrap.wrap(line, max_length, break_long_words=False)
+            lines = line_wrap.wrap_line(line, max_length)
             wrapped.append("\n~~".join(lines))
 
     return "".join(wrapped)
 
 
-def get_all_non_allowed_chars_in_file(fp, print_output=False):
-    with open(fp, mode="r", encoding="utf-8") as file:
-        text = file.read()
-    text = normalize_composites(denoise(text))
-    all_chars = "".join(set(text))
-    filtered_chars = re.sub(allowed_chars_regex, "", all_chars)
+def get_all_non_allowed_chars_in_file(fp, print_output=False, char_index=None):
+    inventory = char_audit.get_file_inventory(fp, char_index)
+    filtered_chars = char_audit.get_unallowed_chars(inventory, allowed_chars_regex)
     return filtered_chars
 
 def get_all_non_allowed_chars_in_folder(folder):
+    # only new and changed files are read; the character inventories
+    # of the other files are taken from the character index of the folder:
+    char_index = char_audit.load_char_index(folder)
     all_chars = set()
     for fn in os.listdir(folder):
         fp = os.path.join(folder, fn)
+        if fn == char_audit.char_index_fn:
+            continue
         if os.path.isfile(fp) and not fn.endswith((".py", ".yml", ".docx", ".md")):
             print(fn)
-            all_chars = all_chars.union(set(get_all_non_allowed_chars_in_file(fp)))
+            all_chars = all_chars.union(set(get_all_non_allowed_chars_in_file(fp, char_index=char_index)))
             print("Subtotal: number of unallowed characters:", len(all_chars))
+    char_audit.save_char_index(folder, char_index)
     # print the non-allowed characters in the folder:
     all_chars = "".join(all_chars)
     not_found = []
@@ -475,7 +585,24 @@ def ask_replace_permission(text, pattern, repl, auto=False):
             text = re.sub(pattern, repl, text)
     return text
 
-def clean(text, fn, auto=False):
+def clean(text, fn, auto=False, profile=None):
+    """Clean a text file
+
+    Args:
+        text (str): content of the text file
+        fn (str): file name of the text file
+        auto (bool): if True, all unallowed characters are automatically
+            replaced; if False, the user is asked for each pattern and character
+        profile (dict): if a dictionary is provided (only in auto mode),
+            the rules are applied one by one and the number of substitutions
+            made by every rule is stored in it (see substitution_rules.apply_rules).
+            Defaults to None
+
+    Returns:
+        str
+    """
+    from openiti.helper.ara import normalize_composites, denoise
+
     print(fn)
     # check presence of metadata header:
     if not text.strip().startswith("######OpenITI#"):
@@ -498,33 +625,41 @@ def clean(text, fn, auto=False):
 ##        editor = ""
 
     # clean text from unwanted characters:
-    text = deNoise(text)
+    text = denoise(text)
     text = normalize_composites(text)
     #text = re.sub(remove, "", text)
     #text = re.sub("أٓ", "آ", text)
 
-    # replace all patterns for which an auto replacement has been defined:
-    print("Going through general replacement patterns...")
-    for pattern, repl in repl_tup:
-        text = ask_replace_permission(text, pattern, repl, auto)
-    if re.findall("-(?:[a-z]{3})*ara", fn):
-        print("Going through replacement patterns for Arabic text...")
-        for pattern, repl in repl_tup_ara:
-            print([pattern])
-            text = ask_replace_permission(text, pattern, repl, auto)
-    if re.findall("-(?:[a-z]{3})*per", fn):
-        print("Going through replacement patterns for Persian text...")
-        for pattern, repl in repl_tup_per:
-            text = ask_replace_permission(text, pattern, repl, auto)
-    if re.findall("-(?:[a-z]{3})*urd", fn):
-        print("Going through replacement patterns for Urdu text...")
-        for pattern, repl in repl_tup_urd:
-            text = ask_replace_permission(text, pattern, repl, auto)
-
-    # replace all remaining unwanted characters:
     if auto:
-        text = re.sub(unwanted_chars_regex, "", text)
-    else:       
+        # apply all replacement patterns in a single pass
+        # and remove all remaining unwanted characters
+        # (with a profile: rule by rule, counting the substitutions):
+        table = get_replacement_table(fn) if profile is None else None
+        if table:
+            text = _pipeline.apply_replacement_table(text, table)
+            text = unwanted_chars_regex.sub("", text)
+        else:
+            text = substitution_rules.apply_rules(text, get_replacement_rules(fn), profile)
+    else:
+        # replace all patterns for which an auto replacement has been defined:
+        print("Going through general replacement patterns...")
+        for pattern, repl in repl_tup:
+            text = ask_replace_permission(text, pattern, repl, auto)
+        if re.findall("-(?:[a-z]{3})*ara", fn):
+            print("Going through replacement patterns for Arabic text...")
+            for pattern, repl in repl_tup_ara:
+                print([pattern])
+                text = ask_replace_permission(text, pattern, repl, auto)
+        if re.findall("-(?:[a-z]{3})*per", fn):
+            print("Going through replacement patterns for Persian text...")
+            for pattern, repl in repl_tup_per:
+                text = ask_replace_permission(text, pattern, repl, auto)
+        if re.findall("-(?:[a-z]{3})*urd", fn):
+            print("Going through replacement patterns for Urdu text...")
+            for pattern, repl in repl_tup_urd:
+                text = ask_replace_permission(text, pattern, repl, auto)
+
+        # replace all remaining unwanted characters:
         all_chars = "".join(set(text))
         filtered_chars = re.sub(allowed_chars_regex, "", all_chars)
         #filtered_chars = re.sub("[0-9a-zA-ZāĀēĒṭṬṯṮūŪīĪİıōŌṣṢšŠḍḌḏḎǧǦġĠḫḪḳḲẓẒčČçÇñÑãÃáÁàÀäÄéÉèÈêÊëËïÏîÎôÔóÓòÒōÕöÖüÜûÛúÚùÙʿʾ' \"\n\t\[\]]+", "", filtered_chars)
@@ -560,21 +695,13 @@ def clean(text, fn, auto=False):
             text = add_paragraph_marks(text, keep_line_endings=True)
         else:
             text = add_paragraph_marks(text, keep_line_endings=False)
+        if profile is not None:
+            profile.setdefault("paragraph marks added", [0, 0])[1] += 1
 ##    if editor:
 ##        text = re.sub("INSERT_EDITOR", editor, text)
 
     # final cleaning:
-    text = re.sub(" ###", "\n\n###", text)
-    #text = re.sub(r"(#META#Header#End#)~~[ \r\n]+~~", r"\1\n\n# ", text)
-    #text = re.sub("(#META#Header#End#)~~[ \r\n]+", r"\1\n\n", text)
-    text = re.sub(r"\A~~[ \r\n]+~~", r"\n\n# ", text)
-    text = re.sub(r"\A~~[ \r\n]+", r"\n\n", text)
-    text = re.sub(r"[\r\n]+~~ *(?:[\r\n]+|\Z)", "\n", text)
-    text = re.sub("(?<=# |~~) *ا\s+| +ا *(?=[\r\n])", "", text) # fix leading and trailing alif issue (OCR)
-    text = re.sub("~~ ", "~~", text)
-    text = re.sub(r"\b([وفبلك]*(?:ا?ل)?)شئ\b", r"\1شيء", text)  # al-shay'
-
-
+    text = substitution_rules.apply_rules(text, get_final_cleaning_rules(), profile)
 
     return header + "#META#Header#End#" + text
 
@@ -590,7 +717,7 @@ def rewrap(text, maxlength=72):
             new += el
         elif not el.startswith("##"):
             #print(textwrap.wrap(el))
-            new += "\n~~".join(textwrap.wrap(el, maxlength))
+            new += "\n~~".join(line_wrap.wrap_line(el, maxlength, break_long_words=True))
         else:
             new += el
     #new = re.sub("([\r\n]+)([^P#~])", r"\1# \2", new)
@@ -600,64 +727,241 @@ def rewrap(text, maxlength=72):
         return new
 
 
+def get_yml_fn(fn):
+    """Get the filename of the version yml file of a text file"""
+    if fn.endswith(("inProgress", "completed", "mARkdown")):
+        return os.path.splitext(fn)[0] + ".yml"
+    return fn + ".yml"
 
+def fix_yml_uri(folder, fn, dry_run=False, write_counts=None):
+    """Make sure the URI in the version yml file of a text file
+    is the same as the filename
 
-AUTO_CLEAN = True
-folder = "."
+    Args:
+        folder (str): path to the folder
+        fn (str): filename of the text file
+        dry_run (bool): if True, the yml file is not changed
+        write_counts (dict): see text_access.write_text
+    """
+    yml_fn = get_yml_fn(fn)
+    print("**YML: "+yml_fn)
+    yml_fp = os.path.join(folder, yml_fn)
+    if not os.path.exists(yml_fp):
+        print("yml file not found:", yml_fn)
+        return
+    yml_str = text_access.read_text(yml_fp, encoding="utf-8")
+    if not yml_fn[:-4] in yml_str:
+        if "00#VERS#URI######:" in yml_str:
+            if dry_run:
+                print("URI in yml file would be replaced by", yml_fn[:-4])
+                return
+            yml_str = re.sub("00#VERS#URI######:.*", "00#VERS#URI######: "+yml_fn[:-4], yml_str)
+            text_access.write_text(yml_fp, yml_str, counts=write_counts)
+        else:
+            print(yml_str)
 
-if AUTO_CLEAN:
-    print("LISTING ALL CHARACTERS THAT ARE NOT ALLOWED IN OPENITI TEXTS")
-    print("AND THAT ARE NOT REMOVED BY THE NORMALIZATION AND DENOISE FUNCTIONS:")
-    get_all_non_allowed_chars_in_folder(folder)
-    r = input("All of these characters will be deleted or replaced. Agree? Y/N: ")
-    if r.lower() != "y":
-        AUTO_CLEAN = False
-        print("AUTOMATIC REPLACEMENT DECLINED.")
+def list_text_files(folder, start=0):
+    """List the text files in a folder whose author died in or after start
+
+    Args:
+        folder (str): path to the folder
+        start (int): minimum death date of the author
+
+    Returns:
+        list (of filenames)
+    """
+    fns = []
+    for fn in sorted(os.listdir(folder)):
+        d = re.findall("^\d{4}", fn)
+        if d and not fn.endswith("yml") and int(d[0]) >= start \
+           and os.path.isfile(os.path.join(folder, fn)):
+            fns.append(fn)
+    return fns
 
-start = 0
-for fn in os.listdir(folder):
+def clean_file(folder, fn, auto=False, dry_run=False):
+    """Clean a text file and save it (if it was changed)
+
+    Args:
+        folder (str): path to the folder
+        fn (str): filename of the text file
+        auto (bool): see clean
+        dry_run (bool): if True, the file is not written; instead,
+            the number of substitutions made by each rule is counted
+
+    Returns:
+        tup (status, profile): status is "written", "unchanged", "changed"
+            (dry run: the file would be written) or "aborted";
+            profile (dry run only; otherwise None): key: rule name,
+            value: [seconds, number of substitutions]
+    """
     fp = os.path.join(folder, fn)
-    #if fn.endswith(("-ara1", ".completed")):
-    d = re.findall("^\d{4}", fn)
-    if d and not fn.endswith("yml") and int(d[0]) >= start:
-        if fn.endswith(".txt"):
-            copyfile(fn, fn[:-4])
-            os.remove(fn)
-            print("changed filename:", fn, ">", fn[:-4])
-            fn = fn[:-4]
-        print(fn)
-        with open(fp, mode="r", encoding="utf-8-sig") as file:
-            text = file.read()
-            text = clean(text, fn, AUTO_CLEAN)
-##            text = re.sub(" ###", "\n\n###", text)
-##            text = re.sub("(#META#Header#End#)~~[\r\n]+~~", r"\1\n\n# ", text)
-##            text = re.sub("(#META#Header#End#)~~[\r\n]+", r"\1\n\n", text)
-##            text = re.sub(r"[\r\n]+~~ *(?:[\r\n]+|\Z)", "\n", text)
-##            text = re.sub("(?<=# |~~) *ا +| +ا *(?=[\r\n])", "", text)
-##            text = re.sub("~~ ", "~~", text)
-            #text = rewrap(text, 72)
-        if text:
-            with open(fp, mode="w", encoding="utf-8-sig") as file:
-                file.write(text.strip())
-        else:
-            print("rewriting file", fn, "aborted")
+    profile = dict() if dry_run else None
+    old_text = text_access.read_text(fp, encoding="utf-8-sig")
+    text = clean(old_text, fn, auto, profile)
+##    text = re.sub(" ###", "\n\n###", text)
+##    text = re.sub("(#META#Header#End#)~~[\r\n]+~~", r"\1\n\n# ", text)
+##    text = re.sub("(#META#Header#End#)~~[\r\n]+", r"\1\n\n", text)
+##    text = re.sub(r"[\r\n]+~~ *(?:[\r\n]+|\Z)", "\n", text)
+##    text = re.sub("(?<=# |~~) *ا +| +ا *(?=[\r\n])", "", text)
+##    text = re.sub("~~ ", "~~", text)
+    #text = rewrap(text, 72)
+    if not text:
+        print("rewriting file", fn, "aborted")
+        return "aborted", profile
+    if dry_run:
+        return ("changed" if text.strip() != old_text else "unchanged"), profile
+    if text_access.write_text(fp, text.strip(), encoding="utf-8-sig"):
+        return "written", profile
+    return "unchanged", profile
+
+def clean_file_in_worker(args):
+    """Clean a text file in a worker process, capturing its console output
 
-        # check yml file:
-        if fn.endswith(("inProgress", "completed", "mARkdown")):
-            yml_fn = os.path.splitext(fn)[0] + ".yml"
-        else:
-            yml_fn = fn + ".yml"
-        print("**YML: "+yml_fn)
-        yml_fp = os.path.join(folder, yml_fn)
-        with open(yml_fp, mode="r", encoding="utf-8") as file:
-            yml_str = file.read()
-        if not yml_fn[:-4] in yml_str:
-            if "00#VERS#URI######:" in yml_str:
-                yml_str = re.sub("00#VERS#URI######:.*", "00#VERS#URI######: "+yml_fn[:-4], yml_str)
-                with open(yml_fp, mode="w", encoding="utf-8") as file:
-                    file.write(yml_str)
+    Args:
+        args (tup): folder, filename, auto, dry_run (see clean_file)
+
+    Returns:
+        tup (fn, status, output, profile)
+    """
+    folder, fn, auto, dry_run = args
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            status, profile = clean_file(folder, fn, auto, dry_run)
+        except Exception as e:
+            print("Error cleaning", fn, ":", e)
+            status, profile = "error", None
+    return fn, status, output.getvalue(), profile
+
+def iter_cleaned_files(folder, fns, auto=False, dry_run=False, workers=1):
+    """Clean text files (in parallel if workers > 1), in sorted order
+
+    Yields:
+        tup (fn, status, profile) (see clean_file)
+    """
+    args = [(folder, fn, auto, dry_run) for fn in fns]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            for fn, status, output, profile in pool.imap(clean_file_in_worker, args):
+                print(output, end="")
+                yield fn, status, profile
+    else:
+        for folder, fn, auto, dry_run in args:
+            status, profile = clean_file(folder, fn, auto, dry_run)
+            yield fn, status, profile
+
+def save_substitution_report(profiles, fp):
+    """Save the number of substitutions per file and rule as a tsv file
+
+    Args:
+        profiles (dict): key: filename, value: profile (see clean_file)
+        fp (str): path to the tsv file
+    """
+    rows = ["file\trule\tsubstitutions"]
+    for fn in sorted(profiles):
+        for rule, (seconds, hits) in profiles[fn].items():
+            if hits:
+                rows.append("{}\t{}\t{}".format(fn, rule, hits))
+    with open(fp, mode="w", encoding="utf-8") as file:
+        file.write("\n".join(rows) + "\n")
+
+def clean_folder(folder=".", auto_clean=True, silent=False, dry_run=False,
+                 workers=1, start=0, report_fp=None):
+    """Clean all text files in a folder and fix the URIs in their yml files
+
+    Args:
+        folder (str): path to the folder
+        auto_clean (bool): if True, unallowed characters are automatically
+            replaced; if False, the user is asked about each pattern and character
+            (and the files are cleaned one by one)
+        silent (bool): if True, the user is not asked to confirm
+            the automatic replacement of the unallowed characters
+        dry_run (bool): if True, nothing is written (or renamed):
+            the number of substitutions each rule would make in each file
+            is reported instead (dry runs always use automatic cleaning)
+        workers (int): number of processes used to clean the files
+        start (int): only clean the texts of authors who died in or after this year
+        report_fp (str): path to a tsv file in which the number of substitutions
+            per file and rule is saved (dry run only). Defaults to None
+
+    Returns:
+        dict (dry run: key: filename, value: profile (see clean_file);
+              otherwise: empty)
+    """
+    if dry_run:
+        auto_clean = True
+    elif auto_clean and not silent:
+        print("LISTING ALL CHARACTERS THAT ARE NOT ALLOWED IN OPENITI TEXTS")
+        print("AND THAT ARE NOT REMOVED BY THE NORMALIZATION AND DENOISE FUNCTIONS:")
+        get_all_non_allowed_chars_in_folder(folder)
+        r = input("All of these characters will be deleted or replaced. Agree? Y/N: ")
+        if r.lower() != "y":
+            auto_clean = False
+            print("AUTOMATIC REPLACEMENT DECLINED.")
+    if workers > 1 and not auto_clean:
+        print("Manual cleaning requires user input: cleaning the files one by one")
+        workers = 1
+
+    fns = []
+    for fn in list_text_files(folder, start):
+        if fn.endswith(".txt"):
+            if dry_run:
+                print("filename would be changed:", fn, ">", fn[:-4])
             else:
-                print(yml_str)
+                os.replace(os.path.join(folder, fn), os.path.join(folder, fn[:-4]))
+                print("changed filename:", fn, ">", fn[:-4])
+                fn = fn[:-4]
+        fns.append(fn)
+
+    write_counts = dict(written=0, skipped=0)
+    statuses = dict()
+    profiles = dict()
+    for fn, status, profile in iter_cleaned_files(folder, fns, auto_clean, dry_run, workers):
+        statuses[status] = statuses.get(status, 0) + 1
+        if profile is not None:
+            profiles[fn] = profile
+        # check yml file:
+        fix_yml_uri(folder, fn, dry_run, write_counts)
+
+    print("---------------")
+    if dry_run:
+        print("DRY RUN: no files were written")
+        for fn in sorted(profiles):
+            hits = {rule: h for rule, (s, h) in profiles[fn].items() if h}
+            print(fn, ":", sum(hits.values()), "substitutions")
+            for rule, h in hits.items():
+                print("    {:>8d}  {}".format(h, rule))
+        if report_fp:
+            save_substitution_report(profiles, report_fp)
+            print("substitution report saved to", report_fp)
+    print("Text files:", ", ".join("{}: {}".format(k, v) for k, v in sorted(statuses.items())))
+    print("Yml files written: {written}, unchanged (not written): {skipped}".format(**write_counts))
+    return profiles
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Clean the text files in a folder before pushing them")
+    parser.add_argument("folder", nargs="?", default=".",
+                        help="folder containing the text files (default: the current folder)")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of processes (default: 1)")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="do not write anything; report the substitutions per file and rule")
+    parser.add_argument("-r", "--report",
+                        help="save the substitutions per file and rule to this tsv file (dry run)")
+    parser.add_argument("--manual", action="store_true",
+                        help="ask the user about every replacement")
+    parser.add_argument("-s", "--silent", action="store_true",
+                        help="do not ask to confirm the automatic replacements")
+    parser.add_argument("--start", type=int, default=0,
+                        help="only clean texts of authors who died in or after this year")
+    args = parser.parse_args()
+    clean_folder(args.folder, auto_clean=not args.manual, silent=args.silent,
+                 dry_run=args.dry_run, workers=args.workers, start=args.start,
+                 report_fp=args.report)
+
+if __name__ == "__main__":
+    main()
 
 
 """
@@ -1,9 +1,8 @@
 import re
 
-fp = "1450Multiple.TulucIslam.AOCP202411031216-urd1"
+import text_access
 
-with open(fp, mode="r", encoding="utf-8") as file:
-    text = file.read()
+fp = "1450Multiple.TulucIslam.AOCP202411031216-urd1"
 
 def fix_number(m):
     start = m.group(1)
@@ -16,9 +15,13 @@ def fix_number(m):
     print(new_page_number)
     return f"{start}{new_page_number:03d}"
 
-text = re.sub("(PageV\d+P)(\d+)([AB])", fix_number, text)
-print(text[:5800])
-
-fp = "1450Multiple.TulucIslam.AOCP202411031216-urd1_corrected"
-with open(fp, mode="w", encoding="utf-8") as file:
-    file.write(text)
+# page numbers do not span lines, so the file can be corrected chunk by chunk:
+preview = ""
+out_fp = "1450Multiple.TulucIslam.AOCP202411031216-urd1_corrected"
+with open(out_fp, mode="w", encoding="utf-8") as file:
+    for chunk in text_access.iter_chunks(fp, encoding="utf-8"):
+        chunk = re.sub("(PageV\d+P)(\d+)([AB])", fix_number, chunk)
+        if len(preview) < 5800:
+            preview += chunk[:5800-len(preview)]
+        file.write(chunk)
+print(preview)
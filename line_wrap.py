@@ -0,0 +1,88 @@
+"""Greedy line wrapping for mARkdown texts.
+
+wrap_line gives the same result as textwrap.wrap (with its default
+settings), but for the common case - a line in which all whitespace
+is plain spaces, without hyphens and without leading spaces - it does not
+split the line into chunks: it finds the break positions directly
+with str.rfind, which is much faster on long (paragraph-length) lines.
+Other lines are wrapped with textwrap.
+
+wrap_lines wraps a stream of lines, adding a continuation marker
+(by default, a new line followed by OpenITI mARkdown tildas `~~`)
+between the wrapped parts of each line.
+"""
+import re
+import textwrap
+
+# whitespace other than plain spaces (textwrap converts it to spaces):
+other_whitespace_regex = re.compile(r"[^\S ]")
+
+
+def wrap_line(line, max_length=72, break_long_words=False):
+    """Wrap a line into lines of at most max_length characters
+
+    Args:
+        line (str): the line (without line breaks)
+        max_length (int): the maximum number of characters per line
+        break_long_words (bool): if True, words longer than max_length
+            are broken; if False, they are put on a line of their own
+
+    Returns:
+        list (the same list as
+        textwrap.wrap(line, max_length, break_long_words=break_long_words))
+    """
+    if "-" in line or line.startswith(" ") or other_whitespace_regex.search(line):
+        return textwrap.wrap(line, max_length, break_long_words=break_long_words)
+
+    lines = []
+    start = 0
+    n = len(line)
+    while True:
+        # drop the spaces at the start of continuation lines:
+        while start < n and line[start] == " ":
+            start += 1
+        if start == n:
+            break
+        end = start + max_length
+        if end >= n:
+            lines.append(line[start:].rstrip(" "))
+            break
+        if line[end] == " ":
+            # the line can be broken at the maximum length:
+            lines.append(line[start:end].rstrip(" "))
+            start = end
+            continue
+        # find the word that crosses the maximum length:
+        word_start = line.rfind(" ", start, end) + 1
+        word_end = line.find(" ", end)
+        if word_end == -1:
+            word_end = n
+        if break_long_words and word_end - word_start > max_length:
+            lines.append(line[start:end])
+            start = end
+        elif word_start > start:
+            lines.append(line[start:word_start].rstrip(" "))
+            start = word_start
+        else:
+            # a long word at the start of the line gets a line of its own:
+            lines.append(line[start:word_end])
+            start = word_end
+    return lines
+
+
+def wrap_lines(lines, max_length=72, wrapped_line_marker="\n~~"):
+    """Wrap a stream of lines; section titles are not wrapped.
+
+    Args:
+        lines (iterable): (line, separator) tuples: the separator contains
+            the line break characters after the line
+        max_length (int): the maximum number of characters per line
+        wrapped_line_marker (str): the string inserted between the wrapped parts of a line
+
+    Yields:
+        str
+    """
+    for line, sep in lines:
+        if not line.startswith("###"):
+            line = wrapped_line_marker.join(wrap_line(line, max_length))
+        yield line + sep
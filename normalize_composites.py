@@ -1,18 +1,27 @@
+import os
+
 from openiti.helper.ara import normalize_composites
 
+import text_access
+
 allah = normalize_composites("ﷲ")
 print(len(allah))
 
 a = normalize_composites("أ")
 print(len(a))
 
-with open("0730ShaficIbnCali.HusnManaqib.LMN20200820-ara1.completed",
-          mode="r", encoding="utf-8") as file:
-    text = file.read()
-print(len(text))
-text = normalize_composites(text)
-print(len(text))
-with open("0730ShaficIbnCali.HusnManaqib.LMN20200820-ara1.completed",
-          mode="w", encoding="utf-8") as file:
-    file.write(text)
+fp = "0730ShaficIbnCali.HusnManaqib.LMN20200820-ara1.completed"
+# normalize the file chunk by chunk (normalize_composites does not work
+# across lines) into a temporary file, then replace the original:
+len_before = 0
+len_after = 0
+with open(fp + ".tmp", mode="w", encoding="utf-8") as file:
+    for chunk in text_access.iter_chunks(fp, encoding="utf-8"):
+        len_before += len(chunk)
+        chunk = normalize_composites(chunk)
+        len_after += len(chunk)
+        file.write(chunk)
+print(len_before)
+print(len_after)
+os.replace(fp + ".tmp", fp)
 
@@ -0,0 +1,105 @@
+"""Ordered lists of regex substitution rules, applied with as few passes as possible.
+
+A rule is a tuple (name, pattern, replacement, literal):
+the literal is a string that every match of the pattern contains
+(None if there is no such string). A rule is only applied if its literal
+is in the text, so rules that cannot match cost a substring search
+instead of a regex pass.
+
+A rule list is a list of rule groups, applied in order. The rules
+in a group are compiled into a single scanner (an alternation of the patterns)
+and applied in one traversal of the text.
+Only put rules in the same group if applying them together gives
+the same result as applying them one after the other: their matches
+must not overlap and no rule may create or destroy matches of another
+(including lookbehind and word boundary context). Rules that feed into
+each other must be in separate groups. NB: an alternation cannot use
+the fast literal prefix search of a single pattern, so fusing rules
+only pays off if their patterns have no literal prefix
+(check with the profiler and benchmark_pipeline).
+
+The profiler applies every rule as a separate pass and reports
+the time spent on each rule and the number of substitutions it made.
+"""
+import re
+import time
+
+
+def compile_rules(rule_groups):
+    """Compile a list of rule groups
+
+    Args:
+        rule_groups (list): list of lists of (name, pattern,
+            replacement, literal) tuples
+
+    Returns:
+        list (of dictionaries, one for every group)
+    """
+    compiled = []
+    for rules in rule_groups:
+        group = dict(rules=rules, literals=[r[3] for r in rules])
+        if len(rules) == 1:
+            name, pattern, repl, literal = rules[0]
+            group["regex"] = re.compile(pattern)
+            group["repl"] = repl
+        else:
+            # follow each pattern by an empty marker group that tells which rule matched
+            # (the marker is the last group to close, see Match.lastindex),
+            # and shift the back references in the replacement:
+            alternatives = []
+            repls = dict()
+            n_groups = 0
+            for name, pattern, repl, literal in rules:
+                offset = n_groups
+                alternatives.append(pattern + "()")
+                n_groups += re.compile(pattern).groups + 1
+                repls[n_groups] = re.sub(r"\\(\d+)",
+                                         lambda m: r"\g<{}>".format(int(m.group(1)) + offset),
+                                         repl)
+            group["regex"] = re.compile("|".join(alternatives))
+            group["repl"] = lambda m, repls=repls: m.expand(repls[m.lastindex])
+        compiled.append(group)
+    return compiled
+
+
+def apply_rules(text, compiled_rules, profile=None):
+    """Apply a compiled list of rule groups to a text
+
+    Args:
+        text (str): the text
+        compiled_rules (list): output of compile_rules
+        profile (dict): if a dictionary is provided, every rule is applied
+            separately and its time and number of substitutions are added
+            to the dictionary (key: rule name, value: [seconds, hits]).
+            Defaults to None (no profiling)
+
+    Returns:
+        str
+    """
+    for group in compiled_rules:
+        if profile is not None:
+            for name, pattern, repl, literal in group["rules"]:
+                start = time.perf_counter()
+                hits = 0
+                if literal is None or literal in text:
+                    text, hits = re.subn(pattern, repl, text)
+                stats = profile.setdefault(name, [0, 0])
+                stats[0] += time.perf_counter() - start
+                stats[1] += hits
+        elif any(literal is None or literal in text for literal in group["literals"]):
+            text = group["regex"].sub(group["repl"], text)
+    return text
+
+
+def print_profile(profile):
+    """Print the time and number of substitutions of every rule,
+    the most expensive rules first
+
+    Args:
+        profile (dict): key: rule name, value: [seconds, hits]
+            (see apply_rules)
+    """
+    total = sum(seconds for seconds, hits in profile.values())
+    for name, (seconds, hits) in sorted(profile.items(), key=lambda item: -item[1][0]):
+        share = 100 * seconds / total if total else 0
+        print("  {:8.4f}s {:5.1f}%  {:>8d} hits  {}".format(seconds, share, hits, name))
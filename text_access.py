@@ -0,0 +1,264 @@
+"""Memory-mapped, chunked access to (large) OpenITI text files.
+
+Instead of reading a whole file into one string, the file is memory-mapped:
+the metadata header can be found with a bytes search, and the text
+is decoded chunk by chunk, on demand. Every chunk (except possibly
+the last) ends with a new line, so chunks can be processed line by line
+and regexes that do not match across lines give the same results
+on the chunks as on the whole text.
+
+As when a file is opened in text mode, line endings are translated
+to "\n" (a "\r\n" that falls between two byte ranges is handled
+by the incremental decoder).
+
+Texts are written back with write_text: if the file already has
+exactly the same content, it is not touched (so that its modification
+time does not change); otherwise, the text is written to a temporary
+file in the same folder, which then replaces the file, so that
+the file is never left half-written.
+"""
+import codecs
+import contextlib
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+
+header_splitter = b"#META#Header#End#"
+# (maximum) number of bytes decoded at a time:
+chunk_size = 1000000
+
+
+@contextlib.contextmanager
+def open_mapped(fp):
+    """Memory-map a file (read-only)
+
+    Args:
+        fp (str): path to the file
+
+    Yields:
+        mmap.mmap (or an empty bytes object if the file is empty)
+    """
+    with open(fp, mode="rb") as file:
+        try:
+            buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty files cannot be mapped
+            yield b""
+            return
+        try:
+            yield buf
+        finally:
+            buf.close()
+
+
+def find_header_end(buf):
+    """Find the position of the end of the metadata header in a mapped file
+
+    Args:
+        buf (mmap.mmap): the mapped file
+
+    Returns:
+        int (byte offset of the #META#Header#End# tag; -1 if there is no header)
+    """
+    return buf.find(header_splitter)
+
+
+def iter_chunk_bounds(buf, start=0, end=None, size=chunk_size):
+    """Divide a byte range of a mapped file into chunks that end with a new line
+
+    Args:
+        buf (mmap.mmap): the mapped file
+        start (int): byte offset of the start of the range
+        end (int): byte offset of the end of the range (default: end of the file)
+        size (int): maximum number of bytes in a chunk
+            (unless a single line is longer)
+
+    Yields:
+        tup (start, end)
+    """
+    if end is None:
+        end = len(buf)
+    while start < end:
+        chunk_end = min(start + size, end)
+        if chunk_end < end:
+            nl = buf.rfind(b"\n", start, chunk_end)
+            if nl < 0:  # a line longer than the chunk size is a chunk of its own
+                nl = buf.find(b"\n", chunk_end, end)
+            chunk_end = nl + 1 if nl >= 0 else end
+        yield start, chunk_end
+        start = chunk_end
+
+
+def decode_chunks(buf, start=0, end=None, encoding="utf-8", size=chunk_size):
+    """Decode a byte range of a mapped file chunk by chunk
+
+    Args:
+        buf (mmap.mmap): the mapped file
+        start (int): byte offset of the start of the range
+        end (int): byte offset of the end of the range (default: end of the file)
+        encoding (str): encoding of the file
+        size (int): maximum number of bytes decoded at a time
+
+    Yields:
+        str
+    """
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+    for chunk_start, chunk_end in iter_chunk_bounds(buf, start, end, size):
+        chunk = decoder.decode(buf[chunk_start:chunk_end])
+        if chunk:
+            yield chunk
+    chunk = decoder.decode(b"", final=True)
+    if chunk:
+        yield chunk
+
+
+def iter_chunks(fp, encoding="utf-8", size=chunk_size):
+    """Read a text file chunk by chunk
+
+    Args:
+        fp (str): path to the file
+        encoding (str): encoding of the file
+        size (int): maximum number of bytes decoded at a time
+
+    Yields:
+        str
+    """
+    with open_mapped(fp) as buf:
+        yield from decode_chunks(buf, encoding=encoding, size=size)
+
+
+def iter_lines(fp, encoding="utf-8", size=chunk_size):
+    """Read a text file line by line (see str.splitlines)
+
+    Args:
+        fp (str): path to the file
+        encoding (str): encoding of the file
+        size (int): maximum number of bytes decoded at a time
+
+    Yields:
+        str (without line endings)
+    """
+    rest = ""
+    for chunk in iter_chunks(fp, encoding, size):
+        lines = (rest + chunk).splitlines(keepends=True)
+        rest = lines.pop()
+        if rest.splitlines() != [rest]:  # the last line is complete
+            lines.append(rest)
+            rest = ""
+        for line in lines:
+            yield line.splitlines()[0]
+    if rest:
+        yield rest
+
+
+def read_header(fp, encoding="utf-8-sig"):
+    """Read the metadata header of a text file, without reading the text
+
+    Args:
+        fp (str): path to the file
+        encoding (str): encoding of the file
+
+    Returns:
+        tup (header (None if the file has no header),
+             byte offset of the text after the #META#Header#End# tag)
+    """
+    with open_mapped(fp) as buf:
+        i = find_header_end(buf)
+        if i < 0:
+            return None, 0
+        header = "".join(decode_chunks(buf, 0, i, encoding))
+        return header, i + len(header_splitter)
+
+
+def read_text(fp, start=0, end=None, encoding="utf-8"):
+    """Read (a byte range of) a text file into a string
+
+    Args:
+        fp (str): path to the file
+        start (int): byte offset of the start of the range
+        end (int): byte offset of the end of the range (default: end of the file)
+        encoding (str): encoding of the file
+
+    Returns:
+        str
+    """
+    with open_mapped(fp) as buf:
+        return "".join(decode_chunks(buf, start, end, encoding))
+
+
+def encode_text(text, encoding="utf-8", newline=None):
+    """Encode a text as it would be written to a file opened in text mode
+
+    Args:
+        text (str): the text
+        encoding (str): encoding of the file
+        newline (str): see the newline argument of open
+            (default: None, i.e., "\n" is written as os.linesep)
+
+    Returns:
+        bytes
+    """
+    if newline is None:
+        newline = os.linesep
+    if newline not in ("", "\n"):
+        text = text.replace("\n", newline)
+    return text.encode(encoding)
+
+
+def get_file_hash(fp):
+    """Get the sha1 hash of the contents of a file
+
+    Args:
+        fp (str): path to the file
+
+    Returns:
+        str
+    """
+    with open_mapped(fp) as buf:
+        return hashlib.sha1(buf).hexdigest()
+
+
+def write_text(fp, text, encoding="utf-8", newline=None, counts=None):
+    """Write a text to a file, unless the file already contains that text
+
+    The text is written to a temporary file in the same folder,
+    which then replaces the file (with the permissions of the file it replaces).
+
+    Args:
+        fp (str): path to the file
+        text (str): the text
+        encoding (str): encoding of the file
+        newline (str): see the newline argument of open
+        counts (dict): if a dictionary is provided, its "written" or "skipped"
+            count is incremented. Defaults to None
+
+    Returns:
+        bool (False if the file was not written because it was unchanged)
+    """
+    data = encode_text(text, encoding, newline)
+    # compare hashes only if the file has the same size:
+    written = not (os.path.isfile(fp) and os.path.getsize(fp) == len(data)
+                   and get_file_hash(fp) == hashlib.sha1(data).hexdigest())
+    if written:
+        folder, fn = os.path.split(os.path.abspath(fp))
+        handle, temp_fp = tempfile.mkstemp(dir=folder, prefix="."+fn+".", suffix=".tmp")
+        try:
+            with os.fdopen(handle, mode="wb") as file:
+                file.write(data)
+            if os.path.exists(fp):
+                mode = os.stat(fp).st_mode
+            else:
+                umask = os.umask(0)
+                os.umask(umask)
+                mode = 0o666 & ~umask
+            os.chmod(temp_fp, mode & 0o7777)
+            os.replace(temp_fp, fp)
+        except BaseException:
+            if os.path.exists(temp_fp):
+                os.remove(temp_fp)
+            raise
+    if counts is not None:
+        key = "written" if written else "skipped"
+        counts[key] = counts.get(key, 0) + 1
+    return written
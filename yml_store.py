@@ -0,0 +1,111 @@
+"""Cached access to OpenITI yml files.
+
+yml files are parsed (with openiti.helper.yml) only once: the parsed
+dictionaries are kept in a small LRU cache, keyed by the path,
+modification time and size of the file, so that a file that was changed
+on disk is parsed again. Callers always get a copy of the dictionary,
+so that they can change it without changing the cache.
+
+Changes are not written immediately: write_yml stores the new dictionary
+(which read_yml returns from then on) and flush writes all pending
+changes at once (see text_access.write_text; unchanged files are not
+rewritten). Call flush before the yml files are moved or read
+by other means.
+"""
+import collections
+import os
+
+import text_access
+
+# maximum number of parsed yml files kept in memory:
+max_cache_size = 1000
+# key: (path, modification time, size); value: parsed yml dictionary:
+cache = collections.OrderedDict()
+# key: path; value: yml dictionary that still has to be written:
+pending = dict()
+
+
+def get_key(fp):
+    """Get the cache key of a yml file
+
+    Args:
+        fp (str): path to the yml file
+
+    Returns:
+        tup (absolute path, modification time (ns), size)
+    """
+    stat = os.stat(fp)
+    return (os.path.abspath(fp), stat.st_mtime_ns, stat.st_size)
+
+
+def parse_yml(yml_str, fp=""):
+    """Parse a yml string (e.g., a template) into a dictionary
+
+    Args:
+        yml_str (str): the yml string
+        fp (str): path to the yml file (only used in error messages)
+
+    Returns:
+        dict
+    """
+    from openiti.helper.yml import ymlToDic
+
+    return ymlToDic(yml_str, yml_fp=fp)
+
+
+def add_to_cache(key, yml_d):
+    """Store a parsed yml dictionary in the cache,
+    removing the least recently used dictionary if the cache is full"""
+    cache[key] = yml_d
+    cache.move_to_end(key)
+    if len(cache) > max_cache_size:
+        cache.popitem(last=False)
+
+
+def read_yml(fp):
+    """Get the dictionary of a yml file
+
+    Args:
+        fp (str): path to the yml file
+
+    Returns:
+        dict (a copy: changes must be saved with write_yml)
+    """
+    from openiti.helper.yml import readYML
+
+    abs_fp = os.path.abspath(fp)
+    if abs_fp in pending:
+        return dict(pending[abs_fp])
+    key = get_key(fp)
+    if key in cache:
+        cache.move_to_end(key)
+    else:
+        add_to_cache(key, readYML(fp))
+    return dict(cache[key])
+
+
+def write_yml(fp, yml_d):
+    """Save the dictionary of a yml file (written to disk by flush)
+
+    Args:
+        fp (str): path to the yml file
+        yml_d (dict): the yml dictionary
+    """
+    pending[os.path.abspath(fp)] = dict(yml_d)
+
+
+def flush(write_counts=None):
+    """Write all pending yml dictionaries to disk
+
+    Args:
+        write_counts (dict): if provided, the number of (un)changed files
+            that were (not) written is counted in this dictionary
+            (see text_access.write_text). Defaults to None
+    """
+    from openiti.helper.yml import dicToYML
+
+    # (the written files are parsed again when they are read,
+    # since dicToYML may change the layout of the values)
+    for fp, yml_d in pending.items():
+        text_access.write_text(fp, dicToYML(yml_d), counts=write_counts)
+    pending.clear()